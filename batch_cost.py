@@ -0,0 +1,192 @@
+#!/bin/env python3
+
+"""
+computes the costs of many workflow runs and writes per-run and per-task cost tables
+"""
+
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+import os
+import sys
+
+import boto3
+import pandas as pd
+
+from compute_pricing import get_pricing, get_run_cost
+from omics_paginator import iter_runs
+from price_table import PriceTable
+from run_store import DEFAULT_RUN_STORE, DEFAULT_RUN_STORE_MAX_BYTES, RunStore
+
+parser = ArgumentParser()
+parser.add_argument('--profile', type=str, help="AWS profile to use")
+parser.add_argument('--region', type=str, help="AWS region to use")
+parser.add_argument('--offering', type=str, help="path to pricing offer JSON")
+parser.add_argument('--price-table', type=str, help="path to a price table built with price_table.py")
+parser.add_argument('--offline', action='store_true', help="use the cached pricing offer without revalidating it")
+parser.add_argument('--status', type=str, default='COMPLETED', help="only include runs with this status")
+parser.add_argument('--name-prefix', type=str, help="only include runs whose name starts with this prefix")
+parser.add_argument('--workflow-id', type=str, help="only include runs of this workflow")
+parser.add_argument('--since', type=str, help="only include runs created at or after this ISO date/time (UTC)")
+parser.add_argument('--until', type=str, help="only include runs created before this ISO date/time (UTC)")
+parser.add_argument('--run-cache', type=str, default=DEFAULT_RUN_STORE, help="path of the local run cache database")
+parser.add_argument('--no-run-cache', action='store_true', help="always retrieve run details from AWS HealthOmics")
+parser.add_argument(
+    '--run-cache-max-bytes', type=int, default=DEFAULT_RUN_STORE_MAX_BYTES,
+    help="maximum size of the run cache, least recently used runs are removed first. 0 for no limit"
+)
+parser.add_argument('--max-workers', type=int, default=8, help="maximum concurrent run fetches")
+parser.add_argument('--format', type=str, default='csv', choices=['csv', 'parquet'], help="output file format")
+parser.add_argument('-o', '--output-dir', type=str, default='.', help="directory to save cost reports to")
+parser.add_argument('run_ids', type=str, nargs='*', help="HealthOmics workflow run-ids to analyze. overrides filters")
+
+
+RUN_COLUMNS = [
+    'runId', 'name', 'workflowId', 'n_tasks', 'run_duration_hr', 'storage_gib',
+    'storage_cost', 'total_task_cost', 'total'
+]
+TASK_COLUMNS = [
+    'runId', 'workflowId', 'name', 'cpus', 'memory_gib', 'gpus', 'instance',
+    'duration_hr', 'usd_per_hour', 'cost'
+]
+
+
+def parse_utc(value):
+    if value is None:
+        return None
+    dt = datetime.fromisoformat(value)
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def list_runs(client, status=None, name_prefix=None, workflow_id=None, since=None, until=None):
+    """
+    returns runs from `list_runs` matching all given filters
+
+    status is filtered by the API, the other filters are applied client side
+    """
+    request = {}
+    if status:
+        request['status'] = status
+
+    runs = []
+    for run in iter_runs(client, **request):
+        if name_prefix and not (run.get('name') or '').startswith(name_prefix):
+            continue
+        if workflow_id and run.get('workflowId') != workflow_id:
+            continue
+        if since and run['creationTime'] < since:
+            continue
+        if until and run['creationTime'] >= until:
+            continue
+        runs.append(run)
+
+    return runs
+
+
+def get_batch_costs(run_ids, client, price_table, max_workers=8, run_store=None):
+    """
+    computes `get_run_cost` for many runs concurrently with a bounded thread pool
+    sharing one price table. task costs are returned as DataFrames
+
+    returns a tuple of (list of run costs, dictionary of {run_id: exception} for failed runs)
+    """
+    costs, errors = [], {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(
+                get_run_cost, run_id, client=client, price_table=price_table, run_store=run_store,
+                as_frame=True
+            ): run_id
+            for run_id in run_ids
+        }
+        for future in as_completed(futures):
+            run_id = futures[future]
+            try:
+                costs.append(future.result())
+            except Exception as e:
+                errors[run_id] = e
+
+    return costs, errors
+
+
+def cost_frames(costs):
+    """
+    flattens run costs from `get_batch_costs` into per-run and per-task DataFrames
+    """
+    runs, tasks = [], []
+    for cost in costs:
+        info = cost['info']
+        detail = cost['cost_detail']
+        runs.append({
+            'runId': info['runId'],
+            'name': info['name'],
+            'workflowId': info['workflowId'],
+            'n_tasks': len(detail['task_costs']),
+            'run_duration_hr': detail['storage_cost']['run_duration_hr'],
+            'storage_gib': detail['storage_cost']['storage_gib'],
+            'storage_cost': detail['storage_cost']['cost'],
+            'total_task_cost': detail['total_task_cost'],
+            'total': cost['total'],
+        })
+        tasks.append(
+            detail['task_costs'].assign(runId=info['runId'], workflowId=info['workflowId'])
+        )
+
+    run_costs = pd.DataFrame.from_records(runs, columns=RUN_COLUMNS).sort_values('runId')
+    if tasks:
+        task_costs = pd.concat(tasks, ignore_index=True)[TASK_COLUMNS]
+    else:
+        task_costs = pd.DataFrame(columns=TASK_COLUMNS)
+    for column in ('runId', 'workflowId', 'instance'):
+        task_costs[column] = task_costs[column].astype('category')
+
+    return run_costs, task_costs
+
+
+def write_frame(df, path_base, file_format='csv'):
+    path = f'{path_base}.{file_format}'
+    if file_format == 'parquet':
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+    return path
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    session = boto3.Session(region_name=args.region, profile_name=args.profile)
+    client = session.client('omics')
+
+    if args.price_table:
+        price_table = PriceTable.load(args.price_table).for_region(client.meta.region_name)
+    else:
+        pricing = get_pricing(offering=args.offering, client=client, offline=args.offline)
+        price_table = PriceTable.from_pricing(pricing, region=client.meta.region_name)
+
+    run_ids = args.run_ids
+    if not run_ids:
+        runs = list_runs(
+            client, status=args.status, name_prefix=args.name_prefix, workflow_id=args.workflow_id,
+            since=parse_utc(args.since), until=parse_utc(args.until)
+        )
+        run_ids = [run['id'] for run in runs]
+
+    print(f"computing costs for {len(run_ids)} runs", file=sys.stderr)
+    run_store = None if args.no_run_cache else RunStore(args.run_cache, max_bytes=args.run_cache_max_bytes)
+    costs, errors = get_batch_costs(
+        run_ids, client, price_table, max_workers=args.max_workers, run_store=run_store
+    )
+    for run_id, error in errors.items():
+        print(f"failed to compute cost for run {run_id}: {error}", file=sys.stderr)
+
+    run_costs, task_costs = cost_frames(costs)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    for df, name in ((run_costs, 'run_costs'), (task_costs, 'task_costs')):
+        path = write_frame(df, os.path.join(args.output_dir, name), file_format=args.format)
+        print(f"wrote {path}", file=sys.stderr)
+
+    print(f"total: ${run_costs['total'].sum():.2f} over {len(run_costs)} runs", file=sys.stderr)
+
+    if errors:
+        sys.exit(1)
@@ -0,0 +1,182 @@
+#!/bin/env python3
+
+"""
+renders timeline plots of many workflow runs, with an index page linking them
+
+pricing is retrieved once, run details are retrieved concurrently in threads and
+each run's timeline is rendered in a process pool as soon as its details have
+arrived, so plotting many large runs uses all cores.
+"""
+
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import html
+import multiprocessing
+import os
+import sys
+
+import boto3
+import pandas as pd
+
+from batch_cost import list_runs, parse_utc
+from compute_pricing import get_pricing
+from price_table import PriceTable
+from run_store import DEFAULT_RUN_STORE, DEFAULT_RUN_STORE_MAX_BYTES, RunStore
+from timeline import LOD_TASK_THRESHOLD, get_run_and_tasks, write_timeline
+
+parser = ArgumentParser()
+parser.add_argument('--profile', type=str, help="AWS profile to use")
+parser.add_argument('--region', type=str, help="AWS region to use")
+parser.add_argument('--offering', type=str, help="path to pricing offer JSON")
+parser.add_argument('--price-table', type=str, help="path to a price table built with price_table.py")
+parser.add_argument('--offline', action='store_true', help="use the cached pricing offer without revalidating it")
+parser.add_argument('--status', type=str, default='COMPLETED', help="only include runs with this status")
+parser.add_argument('--name-prefix', type=str, help="only include runs whose name starts with this prefix")
+parser.add_argument('--workflow-id', type=str, help="only include runs of this workflow")
+parser.add_argument('--since', type=str, help="only include runs created at or after this ISO date/time (UTC)")
+parser.add_argument('--until', type=str, help="only include runs created before this ISO date/time (UTC)")
+parser.add_argument('--run-cache', type=str, default=DEFAULT_RUN_STORE, help="path of the local run cache database")
+parser.add_argument('--no-run-cache', action='store_true', help="always retrieve run details from AWS HealthOmics")
+parser.add_argument(
+    '--run-cache-max-bytes', type=int, default=DEFAULT_RUN_STORE_MAX_BYTES,
+    help="maximum size of the run cache, least recently used runs are removed first. 0 for no limit"
+)
+parser.add_argument('--max-workers', type=int, default=8, help="maximum concurrent run fetches")
+parser.add_argument('--processes', type=int, default=None, help="number of rendering processes, defaults to the number of CPUs")
+parser.add_argument(
+    '-u', '--time-units', type=str, default='min', choices=['sec', 'min', 'hr', 'day'], help="time units to use for plots"
+)
+parser.add_argument('--lod-threshold', type=int, default=LOD_TASK_THRESHOLD, help="see timeline.py --lod-threshold")
+parser.add_argument('-o', '--output-dir', type=str, default='.', help="directory to save timelines and the index page to")
+parser.add_argument('run_ids', type=str, nargs='*', help="HealthOmics workflow run-ids to plot. overrides filters")
+
+INDEX_COLUMNS = ['name', 'workflowId', 'status', 'creationTime', 'tasks', 'wall_time_hr', 'task_cost']
+
+
+def render_timelines(run_ids, client, price_table, output_dir='.', max_workers=8, processes=None,
+                     run_store=None, **options):
+    """
+    writes `timeline.write_timeline` output of many runs to `output_dir`
+
+    run details are retrieved with up to `max_workers` threads, and plots are
+    rendered by a pool of `processes` processes with `show()` disabled. the pool
+    spawns fresh processes rather than forking this one while fetch threads run
+
+    :param: options: other arguments of `timeline.write_timeline`, e.g. time_units
+
+    returns a tuple of (list of run summaries, dictionary of {run_id: exception} for failed runs)
+    """
+    summaries, errors = [], {}
+    with ThreadPoolExecutor(max_workers=max_workers) as fetcher, \
+            ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn')) as renderer:
+        fetches = {
+            fetcher.submit(get_run_and_tasks, run_id, client=client, run_store=run_store): run_id
+            for run_id in run_ids
+        }
+        renders = {}
+        for future in as_completed(fetches):
+            run_id = fetches[future]
+            try:
+                run, tasks = future.result()
+            except Exception as e:
+                errors[run_id] = e
+                continue
+            render = renderer.submit(
+                write_timeline, run, tasks, output_dir=output_dir, pricing=price_table, **options
+            )
+            renders[render] = run_id
+
+        for future in as_completed(renders):
+            try:
+                summaries.append(future.result())
+            except Exception as e:
+                errors[renders[future]] = e
+
+    return summaries, errors
+
+
+def write_index(summaries, output_dir='.', title='workflow run timelines'):
+    """writes an index.html linking the timelines of `render_timelines`, newest runs first"""
+    df = pd.DataFrame(summaries, columns=['runId', 'html'] + INDEX_COLUMNS)
+    df = df.sort_values('creationTime', ascending=False, ignore_index=True)
+
+    def cell(value, fmt='{}'):
+        return '' if pd.isna(value) else html.escape(fmt.format(value))
+
+    rows = []
+    for summary in df.itertuples(index=False):
+        link = html.escape(os.path.relpath(summary.html, output_dir))
+        rows.append(
+            '<tr>'
+            f'<td><a href="{link}">{html.escape(summary.runId)}</a></td>'
+            f'<td>{cell(summary.name)}</td>'
+            f'<td>{cell(summary.workflowId)}</td>'
+            f'<td>{cell(summary.status)}</td>'
+            f'<td>{cell(summary.creationTime, "{:%Y-%m-%d %H:%M}")}</td>'
+            f'<td class="n">{cell(summary.tasks)}</td>'
+            f'<td class="n">{cell(summary.wall_time_hr, "{:.2f}")}</td>'
+            f'<td class="n">{cell(summary.task_cost, "${:,.2f}")}</td>'
+            '</tr>'
+        )
+
+    path = os.path.join(output_dir, 'index.html')
+    with open(path, 'w') as file:
+        file.write(f"""<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{html.escape(title)}</title>
+<style>
+body {{ font-family: sans-serif; }}
+table {{ border-collapse: collapse; }}
+th, td {{ padding: 4px 10px; border-bottom: 1px solid #ddd; text-align: left; }}
+td.n {{ text-align: right; }}
+</style>
+</head>
+<body>
+<h1>{html.escape(title)}</h1>
+<table>
+<tr><th>run</th><th>name</th><th>workflow</th><th>status</th><th>created (UTC)</th><th>tasks</th><th>wall time (hr)</th><th>task cost</th></tr>
+{chr(10).join(rows)}
+</table>
+</body>
+</html>
+""")
+    return path
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    session = boto3.Session(region_name=args.region, profile_name=args.profile)
+    client = session.client('omics')
+
+    if args.price_table:
+        price_table = PriceTable.load(args.price_table).for_region(client.meta.region_name)
+    else:
+        pricing = get_pricing(offering=args.offering, client=client, offline=args.offline)
+        price_table = PriceTable.from_pricing(pricing, region=client.meta.region_name)
+
+    run_ids = args.run_ids
+    if not run_ids:
+        runs = list_runs(
+            client, status=args.status, name_prefix=args.name_prefix, workflow_id=args.workflow_id,
+            since=parse_utc(args.since), until=parse_utc(args.until)
+        )
+        run_ids = [run['id'] for run in runs]
+
+    print(f"rendering timelines of {len(run_ids)} runs", file=sys.stderr)
+    os.makedirs(args.output_dir, exist_ok=True)
+    run_store = None if args.no_run_cache else RunStore(args.run_cache, max_bytes=args.run_cache_max_bytes)
+    summaries, errors = render_timelines(
+        run_ids, client, price_table, output_dir=args.output_dir, max_workers=args.max_workers,
+        processes=args.processes, run_store=run_store, time_units=args.time_units,
+        lod_threshold=args.lod_threshold
+    )
+    for run_id, error in errors.items():
+        print(f"failed to render timeline of run {run_id}: {error}", file=sys.stderr)
+
+    path = write_index(summaries, output_dir=args.output_dir)
+    print(f"wrote {path}", file=sys.stderr)
+
+    if errors:
+        sys.exit(1)
@@ -0,0 +1,41 @@
+#!/bin/env python3
+
+"""
+measures `batch_cost.get_batch_costs` throughput against a stub omics client
+with a fixed latency per API call, for several numbers of worker threads
+"""
+
+from argparse import ArgumentParser
+import sys
+import time
+
+from common import PRICING, REGION, StubOmics, rerun_at_revision
+
+parser = ArgumentParser()
+parser.add_argument('--runs', type=int, default=80, help="number of runs to cost")
+parser.add_argument('--tasks', type=int, default=100, help="number of tasks per run")
+parser.add_argument('--latency', type=float, default=0.02, help="seconds per stub API call")
+parser.add_argument('--workers', type=int, nargs='+', default=[1, 8], help="numbers of worker threads to compare")
+parser.add_argument('--rev', type=str, help="git revision to measure instead of the working tree")
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    if args.rev:
+        sys.exit(rerun_at_revision(args.rev))
+
+    from batch_cost import get_batch_costs
+    from price_table import PriceTable
+
+    price_table = PriceTable.from_pricing(PRICING, region=REGION)
+    run_ids = [str(1000000 + i) for i in range(args.runs)]
+    for workers in args.workers:
+        # a new client per measurement, so client-side rate limiting starts afresh
+        client = StubOmics(tasks_per_run=args.tasks, latency=args.latency)
+        start = time.perf_counter()
+        costs, errors = get_batch_costs(run_ids, client, price_table, max_workers=workers)
+        seconds = time.perf_counter() - start
+        print(
+            f"{args.runs} runs of {args.tasks} tasks, {args.latency * 1000:.0f} ms per call, {workers} workers: "
+            f"{len(costs) / seconds:.1f} runs/s ({len(errors)} errors)"
+        )
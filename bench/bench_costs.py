@@ -0,0 +1,56 @@
+#!/bin/env python3
+
+"""
+times `compute_pricing.get_run_cost` on a synthetic run, excluding task retrieval
+
+reports the best of --repeat wall times and the peak of Python allocations, for
+the JSON output and (where supported) `as_frame=True`. --output writes the
+JSON output, e.g. to check that two revisions produce the same costs
+"""
+
+from argparse import ArgumentParser
+import inspect
+import json
+import sys
+import tracemalloc
+
+from common import PRICING, REGION, StaticRunStore, StubOmics, best_of, make_run, make_tasks, rerun_at_revision
+
+parser = ArgumentParser()
+parser.add_argument('--tasks', type=int, default=100000, help="number of tasks of the synthetic run")
+parser.add_argument('--repeat', type=int, default=3, help="timed repetitions, the best is reported")
+parser.add_argument('--output', type=str, help="path to write the JSON cost output to")
+parser.add_argument('--rev', type=str, help="git revision to measure instead of the working tree")
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    if args.rev:
+        sys.exit(rerun_at_revision(args.rev))
+
+    import compute_pricing
+    from price_table import PriceTable
+
+    client = StubOmics(tasks_per_run=0)
+    price_table = PriceTable.from_pricing(PRICING, region=REGION)
+    run_store = StaticRunStore(make_run('1234567'), make_tasks(args.tasks))
+
+    def run_cost(**kwargs):
+        return compute_pricing.get_run_cost(
+            '1234567', client=client, price_table=price_table, run_store=run_store, **kwargs
+        )
+
+    variants = {'json': {}}
+    if 'as_frame' in inspect.signature(compute_pricing.get_run_cost).parameters:
+        variants['as_frame'] = {'as_frame': True}
+
+    for name, kwargs in variants.items():
+        seconds, cost = best_of(lambda: run_cost(**kwargs), repeat=args.repeat)
+        tracemalloc.start()
+        run_cost(**kwargs)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"{args.tasks} tasks, {name}: {seconds * 1000:.0f} ms, {peak / 2**20:.1f} MiB peak allocations")
+        if name == 'json' and args.output:
+            with open(args.output, 'w') as file:
+                json.dump(cost, file, indent=4, default=str)
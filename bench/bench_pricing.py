@@ -0,0 +1,110 @@
+#!/bin/env python3
+
+"""
+times `compute_pricing.get_pricing` on a large synthetic AmazonOmics offer file
+
+the offer has --products SKUs, of which only the synthetic instance types and
+run storage are priced products, like the real offer. each parser runs in its
+own process so its peak RSS can be reported: `json` loads the whole document,
+`ijson` (where supported, with the streaming extra installed) streams it
+"""
+
+from argparse import SUPPRESS, ArgumentParser
+import hashlib
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import PRICING, rerun_at_revision
+
+parser = ArgumentParser()
+parser.add_argument('--products', type=int, default=300000, help="number of SKUs of the synthetic offer")
+parser.add_argument('--offer', type=str, help="path of an offer file to parse instead of a synthetic one")
+parser.add_argument('--rev', type=str, help="git revision to measure instead of the working tree")
+# parses the offer in this process with one parser, see measure()
+parser.add_argument('--parser', type=str, choices=['json', 'ijson'], help=SUPPRESS)
+
+
+def write_offer(path, products):
+    """writes an offer of `products` SKUs, the priced ones of PRICING among other product families"""
+    offer = {'formatVersion': 'v1.0', 'offerCode': 'AmazonOmics', 'products': {}, 'terms': {'OnDemand': {}}}
+    resource_types = list(PRICING)
+    for i in range(products):
+        sku = f'SKU{i:012d}'
+        if i < len(resource_types):
+            resource_type = resource_types[i]
+            family = 'Storage' if resource_type == 'Run Storage' else 'Compute'
+        else:
+            resource_type = f'Other Resource {i}'
+            family = ['Data Transfer', 'Storage', 'Analytics Storage', 'Workflow'][i % 4]
+        offer['products'][sku] = {
+            'sku': sku,
+            'productFamily': family,
+            'attributes': {
+                'servicecode': 'AmazonOmics', 'location': 'EU (London)', 'locationType': 'AWS Region',
+                'usagetype': f'EUW2-{resource_type}', 'operation': 'StartRun', 'regionCode': 'eu-west-2',
+                'resourceType': resource_type, 'servicename': 'AWS HealthOmics',
+            },
+        }
+        price = PRICING.get(resource_type, {'priceDimensions': {'pricePerUnit': {'USD': '0.0100000000'}}})
+        offer['terms']['OnDemand'][sku] = {
+            f'{sku}.JRTCKXETXF': {
+                'offerTermCode': 'JRTCKXETXF', 'sku': sku, 'effectiveDate': '2026-01-01T00:00:00Z',
+                'priceDimensions': {
+                    f'{sku}.JRTCKXETXF.6YS6EN2CT7': {
+                        'rateCode': f'{sku}.JRTCKXETXF.6YS6EN2CT7', 'description': f'{resource_type} per hour',
+                        'beginRange': '0', 'endRange': 'Inf', 'unit': 'hrs',
+                        'pricePerUnit': price['priceDimensions']['pricePerUnit'], 'appliesTo': [],
+                    }
+                },
+                'termAttributes': {},
+            }
+        }
+    with open(path, 'w') as file:
+        json.dump(offer, file)
+
+
+def parse(offer_path, parser_name):
+    """parses the offer with `parser_name` in this process and prints time, peak RSS and a digest of the prices"""
+    import compute_pricing
+
+    if parser_name == 'json' and getattr(compute_pricing, 'ijson', None):
+        compute_pricing.ijson = None
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    pricing = compute_pricing.get_pricing(offering=offer_path)
+    seconds = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline
+    prices = {k: v['priceDimensions']['pricePerUnit'] for k, v in pricing.items()}
+    digest = hashlib.sha256(json.dumps(prices, sort_keys=True).encode()).hexdigest()[:12]
+    print(f"{parser_name}: {seconds:.2f} s, peak RSS +{peak / 1024:.0f} MiB, {len(pricing)} prices ({digest})")
+
+
+def measure(offer_path, parser_name):
+    return subprocess.call([sys.executable, os.path.abspath(__file__), '--offer', offer_path, '--parser', parser_name])
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    if args.rev:
+        sys.exit(rerun_at_revision(args.rev))
+    if args.parser:
+        sys.exit(parse(args.offer, args.parser))
+
+    offer_path = args.offer
+    if not offer_path:
+        offer_path = os.path.join(tempfile.mkdtemp(prefix='bench-offer-'), 'offer.json')
+        write_offer(offer_path, args.products)
+    print(f"offer: {os.path.getsize(offer_path) / 2**20:.0f} MiB, {offer_path}")
+
+    import compute_pricing
+
+    parsers = ['json']
+    if getattr(compute_pricing, 'ijson', None):
+        parsers.append('ijson')
+    for parser_name in parsers:
+        measure(offer_path, parser_name)
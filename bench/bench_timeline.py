@@ -0,0 +1,67 @@
+#!/bin/env python3
+
+"""
+times `timeline.get_task_timings_data` on synthetic runs
+
+each timed call gets a fresh copy of the tasks, made outside the timing, since
+earlier revisions modified them in place. with --html, also reports the size and
+build + save time of the timeline html document, with and without level of detail
+"""
+
+from argparse import ArgumentParser
+import copy
+import os
+import sys
+import tempfile
+import time
+
+from common import PRICING, make_tasks, rerun_at_revision
+
+parser = ArgumentParser()
+parser.add_argument('--tasks', type=int, nargs='+', default=[10000, 100000], help="numbers of tasks of the synthetic runs")
+parser.add_argument('--repeat', type=int, default=3, help="timed repetitions, the best is reported")
+parser.add_argument('--html', action='store_true', help="also measure the saved timeline html documents")
+parser.add_argument('--rev', type=str, help="git revision to measure instead of the working tree")
+
+
+def time_timings_data(timeline, tasks, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        tasks_copy = copy.deepcopy(tasks)
+        start = time.perf_counter()
+        timeline.get_task_timings_data(tasks_copy, time_units='min', pricing=PRICING)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def measure_html(timeline, tasks, lod, output_dir):
+    """returns (size in bytes, build + save seconds) of the timeline html document of `tasks`"""
+    from bokeh.io import save
+    from bokeh.resources import CDN
+
+    data = timeline.get_task_timings_data(tasks, time_units='min', pricing=PRICING)
+    path = os.path.join(output_dir, f'timeline_{len(tasks)}_{lod}.html')
+    start = time.perf_counter()
+    layout = timeline.plot_timeline(data, time_units='min', show_plot=False, pricing=PRICING, lod=lod)
+    save(layout, filename=path, resources=CDN, title='bench')
+    return os.path.getsize(path), time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    if args.rev:
+        sys.exit(rerun_at_revision(args.rev))
+
+    import timeline
+
+    for n in args.tasks:
+        seconds = time_timings_data(timeline, make_tasks(n), repeat=args.repeat)
+        print(f"{n} tasks, get_task_timings_data: {seconds * 1000:.0f} ms")
+
+    if args.html:
+        output_dir = tempfile.mkdtemp(prefix='bench-html-')
+        for n in args.tasks:
+            tasks = make_tasks(n)
+            for lod in (False, True):
+                size, seconds = measure_html(timeline, tasks, lod, output_dir)
+                print(f"{n} tasks, html lod={'on' if lod else 'off'}: {size / 1024:.0f} KiB, {seconds:.2f} s")
@@ -0,0 +1,144 @@
+"""
+synthetic workflow runs and a stub `omics` client for the benchmark scripts in this directory
+
+the scripts import the repository's modules from the parent directory, or from
+the tree of an older git revision with `--rev`, to measure before and after a change:
+
+    python bench/bench_costs.py --tasks 100000
+    python bench/bench_costs.py --tasks 100000 --rev 304219a^
+"""
+
+from datetime import datetime, timedelta, timezone
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.environ.get('BENCH_REPO_ROOT') or os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_ROOT)
+
+REGION = 'eu-west-2'
+T0 = datetime(2026, 1, 1, tzinfo=timezone.utc)
+INSTANCE_TYPES = ['omics.c.large', 'omics.m.xlarge', 'omics.r.2xlarge']
+
+# `compute_pricing.get_pricing()` style offer of the synthetic instance types
+PRICING = {
+    instance_type: {
+        'attributes': {'resourceType': instance_type},
+        'priceDimensions': {'pricePerUnit': {'USD': str(0.1 * (i + 1))}},
+    }
+    for i, instance_type in enumerate(INSTANCE_TYPES)
+}
+PRICING['Run Storage'] = {
+    'attributes': {'resourceType': 'Run Storage'},
+    'priceDimensions': {'pricePerUnit': {'USD': '0.0001'}},
+}
+
+
+def make_tasks(n, seed=0):
+    """returns `n` synthetic `list_run_tasks` items of 20 processes, created within an hour"""
+    rng = random.Random(seed)
+    tasks = []
+    for i in range(n):
+        creation = T0 + timedelta(seconds=rng.randint(0, 3600))
+        start = creation + timedelta(seconds=rng.randint(1, 600))
+        stop = start + timedelta(seconds=rng.randint(10, 7200))
+        cpus = rng.choice([2, 4, 8])
+        tasks.append({
+            'taskId': str(i),
+            'name': f'NFCORE:RNASEQ:PROC{i % 20} (sample{i % 7})',
+            'status': rng.choice(['COMPLETED'] * 8 + ['FAILED', 'CANCELLED']),
+            'cpus': cpus,
+            'memory': cpus * rng.choice([2, 4]),
+            'gpus': 0,
+            'instanceType': rng.choice(INSTANCE_TYPES),
+            'creationTime': creation,
+            'startTime': start,
+            'stopTime': stop,
+        })
+    return tasks
+
+
+def make_run(run_id):
+    return {
+        'id': run_id, 'arn': f'arn:aws:omics:{REGION}:123456789012:run/{run_id}', 'name': f'run-{run_id}',
+        'workflowId': '1234567', 'status': 'COMPLETED', 'creationTime': T0, 'startTime': T0,
+        'stopTime': T0 + timedelta(hours=3), 'storageCapacity': 1200,
+    }
+
+
+class StubOmics:
+    """
+    `omics` client serving synthetic runs of `tasks_per_run` tasks, sleeping
+    `latency` seconds per call like a remote API
+    """
+
+    class meta:
+        region_name = REGION
+
+    def __init__(self, tasks_per_run=1000, latency=0.0):
+        self.tasks = make_tasks(tasks_per_run)
+        self.latency = latency
+
+    def get_run(self, id):
+        time.sleep(self.latency)
+        return {**make_run(id), 'ResponseMetadata': {}}
+
+    def list_run_tasks(self, id, startingToken=None, maxResults=100, **kwargs):
+        time.sleep(self.latency)
+        start = int(startingToken or 0)
+        response = {'items': [dict(task) for task in self.tasks[start:start + maxResults]]}
+        if start + maxResults < len(self.tasks):
+            response['nextToken'] = str(start + maxResults)
+        return response
+
+
+class StaticRunStore:
+    """`run_store.RunStore` stand-in serving one prebuilt run, so benchmarks exclude fetching"""
+
+    def __init__(self, run, tasks):
+        self.run = run
+        self.tasks = tasks
+
+    def get_run(self, run_id, client=None):
+        return dict(self.run)
+
+    def get_tasks(self, run_id, client=None, **kwargs):
+        return self.tasks
+
+
+def best_of(function, repeat=3):
+    """returns (best wall time in seconds, last result) of calling `function` `repeat` times"""
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def rerun_at_revision(rev):
+    """
+    runs the calling script again against the repository tree at git revision
+    `rev` (without the --rev option), and returns its exit status
+    """
+    tree = tempfile.mkdtemp(prefix='bench-')
+    archive = subprocess.run(['git', 'archive', rev], cwd=REPO_ROOT, check=True, capture_output=True).stdout
+    subprocess.run(['tar', '-x', '-C', tree], input=archive, check=True)
+
+    argv, skip = [], False
+    for arg in sys.argv[1:]:
+        if skip:
+            skip = False
+        elif arg == '--rev':
+            skip = True
+        elif not arg.startswith('--rev='):
+            argv.append(arg)
+
+    print(f'measuring {rev} (exported to {tree})', file=sys.stderr)
+    return subprocess.call(
+        [sys.executable, os.path.abspath(sys.argv[0]), *argv], env={**os.environ, 'BENCH_REPO_ROOT': tree}
+    )
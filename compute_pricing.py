@@ -5,109 +5,410 @@ computes the cost of a workflow run and individual tasks
 """
 
 from argparse import ArgumentParser
+from datetime import datetime, timezone
 import json
+import os
 from pprint import pprint
+import sys
+import tempfile
+import warnings
 
 import boto3
+import numpy as np
+import pandas as pd
 import requests
 
+from omics_paginator import iter_run_tasks
+from parquet_export import PARTITIONS, write_dataset
+from price_table import PriceTable
+from run_store import DEFAULT_RUN_STORE, DEFAULT_RUN_STORE_MAX_BYTES, RunStore
+from task_import import read_task_frame, run_from_tasks
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
 parser = ArgumentParser()
 parser.add_argument('--profile', type=str, help="AWS profile to use")
 parser.add_argument('--region', type=str, help="AWS region to use")
 parser.add_argument('--offering', type=str, help="path to pricing offer JSON")
-parser.add_argument('run_id', type=str, help="HealthOmics workflow run-id to analyze")
+parser.add_argument('--price-table', type=str, help="path to a price table built with price_table.py")
+parser.add_argument('--pricing-cache-dir', type=str, default=None, help="directory to cache pricing offers in")
+parser.add_argument('--no-pricing-cache', action='store_true', help="always download the full pricing offer")
+parser.add_argument('--offline', action='store_true', help="use the cached pricing offer without revalidating it")
+parser.add_argument('--run-cache', type=str, default=DEFAULT_RUN_STORE, help="path of the local run cache database")
+parser.add_argument('--no-run-cache', action='store_true', help="always retrieve run details from AWS HealthOmics")
+parser.add_argument(
+    '--run-cache-max-bytes', type=int, default=DEFAULT_RUN_STORE_MAX_BYTES,
+    help="maximum size of the run cache, least recently used runs are removed first. 0 for no limit"
+)
+parser.add_argument('--task-costs', type=str, help="path to write per-task costs to as .csv or .parquet")
+parser.add_argument('--parquet', type=str, help="directory of a Parquet dataset to write per-task costs to, see parquet_export.py")
+parser.add_argument(
+    '--partition-by', type=str, default='workflow', choices=list(PARTITIONS), help="partitioning of the --parquet dataset"
+)
+parser.add_argument(
+    '--tasks-file', type=str,
+    help="compute the cost of the tasks of a Nextflow trace file or exported run manifest, see task_import.py"
+)
+parser.add_argument('--trace-timezone', type=str, default='UTC', help="time zone of --tasks-file Nextflow trace timestamps")
+parser.add_argument('run_id', type=str, help="HealthOmics workflow run-id to analyze, or a name for --tasks-file")
 
 
-def get_pricing(offering=None, client=None):
-    if offering:
-        # user specified offering
-        with open(offering, 'r') as file:
-            offering = json.load(file)
-    else:
-        # retrieve offring using Bulk API
-        if not client:
-            client = boto3.client('omics')
-        
-        region = client.meta.region_name
-        response = requests.get(f'https://pricing.us-east-1.amazonaws.com/offers/v1.0/aws/AmazonOmics/current/{region}/index.json')
-        if not response.ok:
-            response.raise_for_status()
-        
-        offering = response.json()
+PRICING_OFFER_URL = 'https://pricing.us-east-1.amazonaws.com/offers/v1.0/aws/AmazonOmics/current/{region}/index.json'
+DEFAULT_PRICING_CACHE_DIR = os.path.join(
+    os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')),
+    'healthomics_helper_tools',
+    'pricing'
+)
 
-    compute_offering = {
-        product[0]:product[1] 
-        for product in offering['products'].items() if product[1]['productFamily'] == 'Compute'
-    }
 
-    for key in compute_offering:
-        offer_term = list(offering['terms']['OnDemand'][key].values())[0]
-        price_dimensions = list(offer_term['priceDimensions'].values())[0]
-        compute_offering[key]['priceDimensions'] = price_dimensions
+def _offer_cache_paths(region, cache_dir):
+    return (
+        os.path.join(cache_dir, f'{region}.json'),
+        os.path.join(cache_dir, f'{region}.meta.json')
+    )
+
+
+def _read_offer_cache_meta(region, cache_dir):
+    offer_path, meta_path = _offer_cache_paths(region, cache_dir)
+    if not os.path.exists(offer_path):
+        return None
+    try:
+        with open(meta_path, 'r') as file:
+            return json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def get_pricing_cache_age(region, cache_dir=DEFAULT_PRICING_CACHE_DIR):
+    """
+    returns the time since the cached offer for region was downloaded or last revalidated
+    as a (downloaded_age, validated_age) tuple of timedeltas, or None if there is no cached offer
+    """
+    meta = _read_offer_cache_meta(region, cache_dir)
+    if meta is None:
+        return None
+
+    now = datetime.now(timezone.utc)
+    offer_path, _ = _offer_cache_paths(region, cache_dir)
+    mtime = datetime.fromtimestamp(os.path.getmtime(offer_path), timezone.utc).isoformat()
+    fetched = datetime.fromisoformat(meta.get('fetched_at', mtime))
+    validated = datetime.fromisoformat(meta.get('validated_at', meta.get('fetched_at', mtime)))
+    return now - fetched, now - validated
+
+
+def get_offer_file(region, cache_dir=DEFAULT_PRICING_CACHE_DIR, offline=False, timeout=60):
+    """
+    returns the path to a local copy of the regional AmazonOmics offer file
+
+    the cached copy is revalidated with a conditional GET (ETag / Last-Modified)
+    and only downloaded again if it has changed. if `offline` is set, or the
+    pricing API cannot be reached or returns an error, the cached copy is used as-is.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    offer_path, meta_path = _offer_cache_paths(region, cache_dir)
+    meta = _read_offer_cache_meta(region, cache_dir)
+
+    if offline:
+        if meta is None:
+            raise FileNotFoundError(f"no cached pricing offer for {region} in {cache_dir}")
+        return offer_path
+
+    headers = {}
+    if meta and meta.get('etag'):
+        headers['If-None-Match'] = meta['etag']
+    if meta and meta.get('last_modified'):
+        headers['If-Modified-Since'] = meta['last_modified']
+
+    try:
+        response = requests.get(
+            PRICING_OFFER_URL.format(region=region), headers=headers, stream=True, timeout=timeout
+        )
+    except requests.RequestException as e:
+        if meta is None:
+            raise
+        warnings.warn(f"could not revalidate cached pricing offer for {region}, using cached copy: {e}")
+        return offer_path
+
+    now = datetime.now(timezone.utc).isoformat()
+    with response:
+        if response.status_code == 304:
+            meta['validated_at'] = now
+        elif not response.ok:
+            if meta is None:
+                response.raise_for_status()
+            # e.g. throttling or a server error, the cached copy is still valid
+            warnings.warn(
+                f"could not revalidate cached pricing offer for {region} (HTTP {response.status_code}), "
+                "using cached copy"
+            )
+            return offer_path
+        else:
+            tmp_path = f'{offer_path}.{os.getpid()}.tmp'
+            try:
+                with open(tmp_path, 'wb') as file:
+                    for chunk in response.iter_content(chunk_size=1 << 20):
+                        file.write(chunk)
+            except requests.RequestException as e:
+                os.remove(tmp_path)
+                if meta is None:
+                    raise
+                warnings.warn(f"could not download pricing offer for {region}, using cached copy: {e}")
+                return offer_path
+            os.replace(tmp_path, offer_path)
+
+            meta = {
+                'url': response.url,
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'fetched_at': now,
+                'validated_at': now,
+            }
+
+    with open(meta_path, 'w') as file:
+        json.dump(meta, file)
+
+    return offer_path
 
 
+def _is_priced_product(product):
+    return (
+        product.get('productFamily') == 'Compute'
+        or product.get('attributes', {}).get('resourceType') == 'Run Storage'
+    )
+
+
+def _first_price_dimensions(offer_terms):
+    offer_term = list(offer_terms.values())[0]
+    return list(offer_term['priceDimensions'].values())[0]
+
+
+def extract_pricing(file):
+    """
+    extracts compute and run storage prices from a seekable AmazonOmics offer file object
+
+    with `ijson` installed the offer is streamed in two passes: one over `products`
+    keeping only Compute / Run Storage products, and one over `terms.OnDemand`
+    keeping only the first price dimension of those SKUs, so the whole document is
+    never held in memory. otherwise falls back to `json.load`.
+
+    returns a dictionary keyed by resourceType of {sku, productFamily, attributes, priceDimensions}
+    """
+    if ijson:
+        products = {
+            sku: product
+            for sku, product in ijson.kvitems(file, 'products', use_float=False)
+            if _is_priced_product(product)
+        }
+        file.seek(0)
+        price_dimensions = {
+            sku: _first_price_dimensions(offer_terms)
+            for sku, offer_terms in ijson.kvitems(file, 'terms.OnDemand', use_float=False)
+            if sku in products
+        }
+    else:
+        offering = json.load(file)
+        products = {
+            sku: product for sku, product in offering['products'].items() if _is_priced_product(product)
+        }
+        price_dimensions = {
+            sku: _first_price_dimensions(offering['terms']['OnDemand'][sku]) for sku in products
+        }
+        del offering
+
     # set resourceType as the primary hash key
-    pricing = {
-        instance['attributes']['resourceType']:instance 
-        for instance in compute_offering.values()
-        if instance['attributes'].get('resourceType')
-    }
-    
+    pricing = {}
+    for sku, product in products.items():
+        resource_type = product.get('attributes', {}).get('resourceType')
+        if resource_type and sku in price_dimensions:
+            pricing[resource_type] = {**product, 'priceDimensions': price_dimensions[sku]}
+
     return pricing
 
 
-def get_run_info(run_id, client=None):
+def get_pricing(offering=None, client=None, cache_dir=DEFAULT_PRICING_CACHE_DIR, offline=False):
+    if not offering and cache_dir:
+        # retrieve offering using Bulk API, via the local cache
+        if not client:
+            client = boto3.client('omics')
+
+        offering = get_offer_file(client.meta.region_name, cache_dir=cache_dir, offline=offline)
+
+    if offering:
+        # user specified or cached offering
+        with open(offering, 'rb') as file:
+            return extract_pricing(file)
+
+    # retrieve offring using Bulk API
     if not client:
         client = boto3.client('omics')
-    
+
+    region = client.meta.region_name
+    response = requests.get(PRICING_OFFER_URL.format(region=region), stream=True)
+    if not response.ok:
+        response.raise_for_status()
+
+    # spool to disk so the offer can be parsed without holding it in memory
+    with response, tempfile.TemporaryFile() as file:
+        for chunk in response.iter_content(chunk_size=1 << 20):
+            file.write(chunk)
+        file.seek(0)
+        return extract_pricing(file)
+
+
+def _get_run_and_tasks(run_id, client, run_store=None):
+    if run_store:
+        return run_store.get_run(run_id, client), run_store.get_tasks(run_id, client)
+
     run = client.get_run(id=run_id)
-    run.update({"duration": run['stopTime'] - run['startTime']})
+    del run['ResponseMetadata']
+    return run, list(iter_run_tasks(client, run_id))
+
 
-    response = client.list_run_tasks(id=run_id)
-    tasks = response['items']
-    while response.get('nextToken'):
-        response = client.list_run_tasks(id=run_id, startingToken=response.get('nextToken'))
-        tasks += response['items']
+def get_run_info(run_id, client=None, run_store=None):
+    if not client:
+        client = boto3.client('omics')
     
-    tasks = [{**task, "duration": task['stopTime'] - task['startTime']} for task in tasks]
+    run, tasks = _get_run_and_tasks(run_id, client, run_store=run_store)
+    run.update({"duration": run['stopTime'] - run['startTime']})
 
-    del run['ResponseMetadata']
+    tasks = [
+        {**task, "duration": task['stopTime'] - task['startTime']}
+        for task in tasks
+    ]
 
     run['tasks'] = tasks
     return run
 
 
 MINIMUM_STORAGE_CAPACITY_GIB=1200
-def get_run_cost(run_id, storage_gib=MINIMUM_STORAGE_CAPACITY_GIB, client=None, offering=None):
+TASK_COST_COLUMNS = ['name', 'cpus', 'memory_gib', 'gpus', 'instance', 'duration_hr', 'usd_per_hour', 'cost']
+
+
+def _task_columns(tasks):
+    """returns the columns of `tasks` used for costing, from a list of task dicts or a DataFrame"""
+    if isinstance(tasks, pd.DataFrame):
+        return {
+            'startTime': tasks['startTime'],
+            'stopTime': tasks['stopTime'],
+            'instanceType': tasks['instanceType'],
+            'name': tasks['name'].astype(object).where(tasks['name'].notna(), None).to_numpy(),
+            'cpus': tasks['cpus'].to_numpy(),
+            'memory': tasks['memory'].to_numpy(),
+            'gpus': tasks.get('gpus', pd.Series(0, index=tasks.index)).fillna(0).to_numpy(dtype='int64'),
+        }
+    return {
+        'startTime': [task['startTime'] for task in tasks],
+        'stopTime': [task['stopTime'] for task in tasks],
+        'instanceType': [task['instanceType'] for task in tasks],
+        'name': [task.get('name') for task in tasks],
+        'cpus': np.array([task['cpus'] for task in tasks]),
+        'memory': np.array([task['memory'] for task in tasks]),
+        'gpus': np.array([task.get('gpus') or 0 for task in tasks], dtype='int64'),
+    }
+
+
+def get_task_costs(tasks, price_table, region=None):
+    """
+    computes task costs as a DataFrame with one row per task and TASK_COST_COLUMNS columns
+
+    `tasks` is a list of task dicts or a DataFrame with the same columns (e.g. from
+    `task_import.read_task_frame`). durations and prices are computed on whole
+    columns rather than task by task, and `tasks` are not modified
+    """
+    columns = _task_columns(tasks)
+    start = pd.DatetimeIndex(columns['startTime'])
+    stop = pd.DatetimeIndex(columns['stopTime'])
+    instance = pd.Categorical(columns['instanceType'])
+
+    if (instance.codes < 0).any():
+        raise KeyError("tasks without an instance type")
+    usd_per_hour = price_table.compute_prices(instance.categories, region=region)
+    unknown = instance.categories[np.isnan(usd_per_hour)]
+    if len(unknown):
+        raise KeyError(f"no prices for instance types: {', '.join(map(str, unknown))}")
+    usd_per_hour = usd_per_hour[instance.codes]
+
+    duration_hr = (stop - start).total_seconds().to_numpy() / 3600
+
+    return pd.DataFrame({
+        # object dtype keeps missing names as None in the JSON output
+        'name': pd.Series(columns['name'], dtype=object),
+        'cpus': columns['cpus'],
+        'memory_gib': columns['memory'],
+        'gpus': columns['gpus'],
+        'instance': instance,
+        'duration_hr': duration_hr,
+        'usd_per_hour': usd_per_hour,
+        'cost': duration_hr * usd_per_hour,
+    }, columns=TASK_COST_COLUMNS)
+
+
+def task_cost_records(task_costs):
+    """
+    converts a task cost DataFrame from `get_task_costs` to the list of dicts in `get_run_cost` JSON output
+    """
+    return [
+        {
+            "name": name,
+            "resources": {
+                "cpus": cpus,
+                "memory_gib": memory_gib,
+                "gpus": gpus
+            },
+            "duration_hr": duration_hr,
+            "instance": instance,
+            "usd_per_hour": usd_per_hour,
+            "cost": cost
+        }
+        for name, cpus, memory_gib, gpus, instance, duration_hr, usd_per_hour, cost in zip(
+            *(task_costs[column].tolist() for column in TASK_COST_COLUMNS)
+        )
+    ]
+
+
+def write_task_costs(task_costs, path):
+    """writes a task cost DataFrame as Parquet if `path` ends with .parquet, otherwise as CSV"""
+    if path.endswith('.parquet'):
+        task_costs.to_parquet(path, index=False)
+    else:
+        task_costs.to_csv(path, index=False)
+
+
+def get_run_cost(run_id, storage_gib=MINIMUM_STORAGE_CAPACITY_GIB, client=None, offering=None,
+                 cache_dir=DEFAULT_PRICING_CACHE_DIR, offline=False, price_table=None, run_store=None,
+                 as_frame=False, run=None, tasks=None):
+    """
+    computes the cost of a workflow run
+
+    if `as_frame` is set, cost_detail.task_costs is the DataFrame from `get_task_costs`
+    instead of a list of dicts
+
+    if `tasks` are given (e.g. from `task_import.read_task_frame`), they are used instead of
+    retrieving the run, with `run` defaulting to `task_import.run_from_tasks`
+    """
     
     if not client:
         client = boto3.client('omics')
     
-    pricing = get_pricing(offering=offering, client=client)
-    STORAGE_USD_PER_GIB_PER_HR = float(pricing['Run Storage']['priceDimensions']['pricePerUnit']['USD'])
+    if not price_table:
+        pricing = get_pricing(offering=offering, client=client, cache_dir=cache_dir, offline=offline)
+        price_table = PriceTable.from_pricing(pricing, region=client.meta.region_name)
+    else:
+        # raises if the table has no prices for the client's region
+        price_table = price_table.for_region(client.meta.region_name)
+
+    STORAGE_USD_PER_GIB_PER_HR = price_table.storage_price()
     
-    run = get_run_info(run_id, client=client)
-    run_duration_hr = run['duration'].total_seconds() / 3600
-
-    task_costs = []
-    for task in run['tasks']:
-        if not task.get('gpus'):
-            task['gpus'] = 0
-        usd_per_hour = float(pricing[task['instanceType']]['priceDimensions']['pricePerUnit']['USD'])
-        duration_hr = task['duration'].total_seconds() / 3600
-
-        task_costs += [{
-            "name": task.get('name'),
-            "resources": {
-                "cpus": task['cpus'],
-                "memory_gib": task['memory'],
-                "gpus": task['gpus']
-            },
-            "duration_hr": duration_hr,
-            "instance": task['instanceType'],
-            "usd_per_hour": usd_per_hour,
-            "cost": duration_hr * usd_per_hour
-        }]
+    if tasks is None:
+        run, tasks = _get_run_and_tasks(run_id, client, run_store=run_store)
+    elif run is None:
+        run = run_from_tasks(run_id, tasks)
+    run_duration_hr = (run['stopTime'] - run['startTime']).total_seconds() / 3600
+
+    task_costs = get_task_costs(tasks, price_table)
     
     if not run.get('storageCapacity'):
         # assume the default storage capacity of 1200 GiB
@@ -119,13 +420,14 @@ def get_run_cost(run_id, storage_gib=MINIMUM_STORAGE_CAPACITY_GIB, client=None,
         storage_gib = MINIMUM_STORAGE_CAPACITY_GIB
         
     storage_cost = run_duration_hr * storage_gib * STORAGE_USD_PER_GIB_PER_HR
-    total_task_costs = sum([tc['cost'] for tc in task_costs])
+    # summed in task order so totals match exactly regardless of output format
+    total_task_costs = sum(task_costs['cost'].tolist())
     
     return {
         "info": {
             "runId": run['id'],
             "name": run.get('name'),
-            "workflowId": run['workflowId']
+            "workflowId": run.get('workflowId')
         },
         "total": storage_cost + total_task_costs,
         "cost_detail": {
@@ -136,7 +438,7 @@ def get_run_cost(run_id, storage_gib=MINIMUM_STORAGE_CAPACITY_GIB, client=None,
                 "cost": storage_cost
             },
             "total_task_cost": total_task_costs,
-            "task_costs": task_costs
+            "task_costs": task_costs if as_frame else task_cost_records(task_costs)
         }
     }
 
@@ -145,5 +447,42 @@ if __name__ == "__main__":
     args = parser.parse_args()
     session = boto3.Session(region_name=args.region, profile_name=args.profile)
 
-    cost = get_run_cost(args.run_id, client=session.client('omics'), offering=args.offering)
+    client = session.client('omics')
+
+    cache_dir = None if args.no_pricing_cache else (args.pricing_cache_dir or DEFAULT_PRICING_CACHE_DIR)
+    price_table = PriceTable.load(args.price_table).for_region(client.meta.region_name) if args.price_table else None
+    run_store = None if args.no_run_cache else RunStore(args.run_cache, max_bytes=args.run_cache_max_bytes)
+
+    tasks = None
+    if args.tasks_file:
+        # instance types of trace file tasks are fitted with the price table
+        if not price_table:
+            pricing = get_pricing(offering=args.offering, client=client, cache_dir=cache_dir, offline=args.offline)
+            price_table = PriceTable.from_pricing(pricing, region=client.meta.region_name)
+        tasks = read_task_frame(args.tasks_file, timezone=args.trace_timezone, price_table=price_table)
+
+    cost = get_run_cost(
+        args.run_id, client=client, offering=args.offering, cache_dir=cache_dir, offline=args.offline,
+        price_table=price_table, run_store=run_store, as_frame=True, tasks=tasks
+    )
+
+    task_costs = cost['cost_detail']['task_costs']
+    if args.task_costs:
+        write_task_costs(task_costs, args.task_costs)
+        print(f"wrote task costs to {args.task_costs}", file=sys.stderr)
+    if args.parquet:
+        path = write_dataset(
+            task_costs, args.parquet, run_id=cost['info']['runId'], workflow_id=cost['info']['workflowId'],
+            partition_by=args.partition_by
+        )
+        print(f"wrote task costs to {path}", file=sys.stderr)
+    cost['cost_detail']['task_costs'] = task_cost_records(task_costs)
+
+    if cache_dir and not (args.offering or args.price_table):
+        downloaded_age, validated_age = get_pricing_cache_age(client.meta.region_name, cache_dir=cache_dir)
+        print(
+            f"pricing offer cache: downloaded {downloaded_age} ago, revalidated {validated_age} ago",
+            file=sys.stderr
+        )
+
     print(json.dumps(cost, indent=4, default=str))
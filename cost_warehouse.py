@@ -0,0 +1,328 @@
+#!/bin/env python3
+
+"""
+incrementally collects the costs of completed workflow runs into a local
+Parquet store and aggregates spend by workflow, run name, process and time bucket
+
+`ingest` lists completed runs created since the last ingested run (the high-water
+mark, minus a lookback window for runs that took a while to finish), computes
+their costs with `get_run_cost` and appends them to the store. `query` answers
+aggregate questions from the store without calling any AWS APIs.
+"""
+
+from argparse import ArgumentParser
+from datetime import datetime, timedelta, timezone
+import json
+import os
+import sys
+
+import boto3
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from batch_cost import get_batch_costs, cost_frames, list_runs, parse_utc
+from compute_pricing import get_pricing
+from nf import normalize_process_name
+from price_table import PriceTable
+from run_store import DEFAULT_RUN_STORE, DEFAULT_RUN_STORE_MAX_BYTES, RunStore
+
+DEFAULT_WAREHOUSE_DIR = os.path.join(
+    os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')),
+    'healthomics_helper_tools',
+    'cost_warehouse'
+)
+
+RUN_COLUMNS = [
+    'runId', 'name', 'workflowId', 'creationTime', 'startTime', 'stopTime', 'n_tasks',
+    'run_duration_hr', 'storage_gib', 'storage_cost', 'total_task_cost', 'total', 'month'
+]
+TASK_COLUMNS = [
+    'runId', 'run_name', 'workflowId', 'creationTime', 'name', 'process', 'cpus', 'memory_gib',
+    'gpus', 'instance', 'duration_hr', 'usd_per_hour', 'cost', 'month'
+]
+
+# pandas period aliases for query time buckets
+BUCKETS = {'day': 'D', 'week': 'W', 'month': 'M'}
+
+parser = ArgumentParser()
+parser.add_argument('--warehouse', type=str, default=DEFAULT_WAREHOUSE_DIR, help="directory of the cost store")
+commands = parser.add_subparsers(dest='command', required=True)
+
+ingest_parser = commands.add_parser('ingest', help="append newly completed runs to the cost store")
+ingest_parser.add_argument('--profile', type=str, help="AWS profile to use")
+ingest_parser.add_argument('--region', type=str, help="AWS region to use")
+ingest_parser.add_argument('--offering', type=str, help="path to pricing offer JSON")
+ingest_parser.add_argument('--price-table', type=str, help="path to a price table built with price_table.py")
+ingest_parser.add_argument('--offline', action='store_true', help="use the cached pricing offer without revalidating it")
+ingest_parser.add_argument('--workflow-id', type=str, help="only ingest runs of this workflow")
+ingest_parser.add_argument(
+    '--lookback-days', type=float, default=7,
+    help="also consider runs created this long before the high-water mark, to pick up long runs that completed since"
+)
+ingest_parser.add_argument('--run-cache', type=str, default=DEFAULT_RUN_STORE, help="path of the local run cache database")
+ingest_parser.add_argument('--no-run-cache', action='store_true', help="always retrieve run details from AWS HealthOmics")
+ingest_parser.add_argument(
+    '--run-cache-max-bytes', type=int, default=DEFAULT_RUN_STORE_MAX_BYTES,
+    help="maximum size of the run cache, least recently used runs are removed first. 0 for no limit"
+)
+ingest_parser.add_argument('--max-workers', type=int, default=8, help="maximum concurrent run fetches")
+
+query_parser = commands.add_parser('query', help="aggregate costs in the cost store")
+query_parser.add_argument(
+    '--by', type=str, default='workflowId',
+    help="comma separated columns to group by, e.g. workflowId,process. grouping by process aggregates task costs"
+)
+query_parser.add_argument('--bucket', type=str, default='month', choices=list(BUCKETS), help="time bucket of run creation times")
+query_parser.add_argument('--workflow-id', type=str, help="only include runs of this workflow")
+query_parser.add_argument('--name-prefix', type=str, help="only include runs whose name starts with this prefix")
+query_parser.add_argument('--process', type=str, help="only include tasks of this process (implies task costs)")
+query_parser.add_argument('--since', type=str, help="only include runs created at or after this ISO date/time (UTC)")
+query_parser.add_argument('--until', type=str, help="only include runs created before this ISO date/time (UTC)")
+query_parser.add_argument('--csv', action='store_true', help="print results as CSV")
+
+
+def _month(timestamps):
+    return timestamps.dt.tz_convert('UTC').dt.strftime('%Y-%m')
+
+
+class CostWarehouse:
+    """
+    append-only Parquet store of run and task costs, partitioned by month of run creation
+
+    layout:
+        <path>/runs/month=YYYY-MM/*.parquet   one row per run
+        <path>/tasks/month=YYYY-MM/*.parquet  one row per task
+        <path>/state.json                     high-water mark of ingested run creation times
+    """
+
+    def __init__(self, path=DEFAULT_WAREHOUSE_DIR):
+        self.path = path
+        self.runs_path = os.path.join(path, 'runs')
+        self.tasks_path = os.path.join(path, 'tasks')
+        self.state_path = os.path.join(path, 'state.json')
+
+    def _read_state(self):
+        try:
+            with open(self.state_path, 'r') as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+
+    def _write_state(self, state):
+        os.makedirs(self.path, exist_ok=True)
+        tmp_path = f'{self.state_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump(state, file, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+    @property
+    def high_water_mark(self):
+        """creation time of the newest ingested run, or None for an empty store"""
+        value = self._read_state().get('high_water_mark')
+        return datetime.fromisoformat(value) if value else None
+
+    def read(self, table='runs', columns=None, filters=None):
+        """
+        reads the runs or tasks table, only loading the given columns and the
+        month partitions matching `filters` (pyarrow filter tuples)
+        """
+        path = self.runs_path if table == 'runs' else self.tasks_path
+        all_columns = RUN_COLUMNS if table == 'runs' else TASK_COLUMNS
+        if not os.path.exists(path):
+            return pd.DataFrame(columns=columns or all_columns)
+
+        df = pd.read_parquet(path, columns=columns, filters=filters or None)
+        if 'month' in df:
+            df['month'] = df['month'].astype(str)
+        return df
+
+    def run_ids(self, since=None):
+        filters = [('month', '>=', since.strftime('%Y-%m'))] if since else None
+        return set(self.read('runs', columns=['runId'], filters=filters)['runId'])
+
+    def append(self, costs, runs):
+        """
+        appends run costs from `get_batch_costs` to the store. task rows of the runs
+        left behind by an interrupted append are replaced, not appended twice
+
+        :param: costs: list of `get_run_cost` results with task costs as DataFrames
+        :param: runs: dictionary of {run_id: `list_runs` item} for the creation, start and stop times
+        """
+        if not costs:
+            return
+
+        run_costs, task_costs = cost_frames(costs)
+        for column in ('creationTime', 'startTime', 'stopTime'):
+            run_costs[column] = pd.to_datetime(
+                run_costs['runId'].map(lambda run_id: runs[run_id].get(column)), utc=True
+            )
+        run_costs['month'] = _month(run_costs['creationTime'])
+
+        run_info = run_costs.set_index('runId')
+        task_run_ids = task_costs['runId'].astype(str)
+        task_costs['run_name'] = task_run_ids.map(run_info['name'])
+        task_costs['creationTime'] = task_run_ids.map(run_info['creationTime'])
+        task_costs['month'] = task_run_ids.map(run_info['month'])
+        task_costs['process'] = task_costs['name'].map(normalize_process_name)
+
+        # tasks first, so an interrupted append is retried rather than skipped as already ingested,
+        # after removing the tasks such an append left behind
+        self._remove_tasks(set(run_costs['runId']), months=run_costs['month'].unique())
+        task_costs[TASK_COLUMNS].to_parquet(self.tasks_path, partition_cols=['month'], index=False)
+        run_costs[RUN_COLUMNS].to_parquet(self.runs_path, partition_cols=['month'], index=False)
+
+    def _remove_tasks(self, run_ids, months):
+        """removes the tasks of `run_ids` from the `months` partitions, rewriting only the files that have any"""
+        for month in months:
+            month_path = os.path.join(self.tasks_path, f'month={month}')
+            if not os.path.isdir(month_path):
+                continue
+            for file_name in os.listdir(month_path):
+                if file_name.startswith(('.', '_')):
+                    continue
+                file_path = os.path.join(month_path, file_name)
+                ids = pq.read_table(file_path, columns=['runId'])['runId'].cast(pa.string())
+                stale = pc.is_in(ids, value_set=pa.array(sorted(run_ids), type=pa.string()))
+                if not pc.any(stale).as_py():
+                    continue
+                table = pq.read_table(file_path).filter(pc.invert(stale))
+                if not table.num_rows:
+                    os.remove(file_path)
+                    continue
+                # hidden from dataset reads until it replaces the file
+                tmp_path = os.path.join(month_path, f'.{file_name}.{os.getpid()}.tmp')
+                pq.write_table(table, tmp_path)
+                os.replace(tmp_path, file_path)
+
+    def ingest(self, client, price_table, workflow_id=None, lookback=timedelta(days=7), max_workers=8,
+               run_store=None):
+        """
+        appends completed runs created after the high-water mark minus `lookback`
+        that are not in the store yet
+
+        returns a tuple of (list of ingested run ids, dictionary of {run_id: exception} for failed runs)
+        """
+        high_water_mark = self.high_water_mark
+        since = high_water_mark - lookback if high_water_mark else None
+
+        known = self.run_ids(since=since)
+        runs = {
+            run['id']: run
+            for run in list_runs(client, status='COMPLETED', workflow_id=workflow_id, since=since)
+            if run['id'] not in known
+        }
+
+        costs, errors = get_batch_costs(
+            list(runs), client, price_table, max_workers=max_workers, run_store=run_store
+        )
+        self.append(costs, runs)
+
+        # don't move the high-water mark past runs that failed, so they are retried next time
+        created = [runs[cost['info']['runId']]['creationTime'] for cost in costs]
+        if errors:
+            oldest_failed = min(runs[run_id]['creationTime'] for run_id in errors)
+            created = [t for t in created if t < oldest_failed]
+
+        if created and (high_water_mark is None or max(created) > high_water_mark):
+            self._write_state({
+                'high_water_mark': max(created).astimezone(timezone.utc).isoformat(),
+                'updated_at': datetime.now(timezone.utc).isoformat(),
+            })
+
+        return [cost['info']['runId'] for cost in costs], errors
+
+    def query(self, by=('workflowId',), bucket='month', workflow_id=None, name_prefix=None, process=None,
+              since=None, until=None):
+        """
+        aggregates costs by time bucket ('day', 'week' or 'month' of run creation) and `by` columns
+
+        run costs (including run storage) are aggregated unless grouping or
+        filtering by process, in which case task costs are aggregated
+        """
+        by = list(by)
+        task_level = 'process' in by or process is not None
+        table = 'tasks' if task_level else 'runs'
+
+        filters = []
+        if since:
+            filters.append(('month', '>=', since.strftime('%Y-%m')))
+        if until:
+            filters.append(('month', '<=', until.strftime('%Y-%m')))
+        if workflow_id:
+            filters.append(('workflowId', '==', workflow_id))
+        if process:
+            filters.append(('process', '==', process))
+
+        name_column = 'run_name' if task_level else 'name'
+        if task_level:
+            values = {'cost': 'sum', 'duration_hr': 'sum', 'runId': 'nunique', 'name': 'size'}
+        else:
+            values = {'total': 'sum', 'storage_cost': 'sum', 'total_task_cost': 'sum', 'runId': 'size'}
+
+        columns = set(by) | set(values) | {'creationTime'}
+        if name_prefix:
+            columns.add(name_column)
+        df = self.read(table, columns=sorted(columns), filters=filters)
+
+        if since:
+            df = df[df['creationTime'] >= since]
+        if until:
+            df = df[df['creationTime'] < until]
+        if name_prefix:
+            df = df[df[name_column].fillna('').str.startswith(name_prefix)]
+
+        df = df.assign(
+            bucket=df['creationTime'].dt.tz_convert(None).dt.to_period(BUCKETS[bucket]).dt.start_time
+        )
+        keys = ['bucket'] + by
+        for key in by:
+            if isinstance(df[key].dtype, pd.CategoricalDtype):
+                df[key] = df[key].astype(str)
+
+        result = df.groupby(keys, sort=True).agg(values).reset_index()
+        if task_level:
+            return result.rename(columns={'duration_hr': 'task_hours', 'runId': 'runs', 'name': 'tasks'})
+        return result.rename(columns={'runId': 'runs'})
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    warehouse = CostWarehouse(args.warehouse)
+
+    if args.command == 'ingest':
+        session = boto3.Session(region_name=args.region, profile_name=args.profile)
+        client = session.client('omics')
+
+        if args.price_table:
+            price_table = PriceTable.load(args.price_table).for_region(client.meta.region_name)
+        else:
+            pricing = get_pricing(offering=args.offering, client=client, offline=args.offline)
+            price_table = PriceTable.from_pricing(pricing, region=client.meta.region_name)
+
+        run_store = None if args.no_run_cache else RunStore(args.run_cache, max_bytes=args.run_cache_max_bytes)
+        ingested, errors = warehouse.ingest(
+            client, price_table, workflow_id=args.workflow_id, lookback=timedelta(days=args.lookback_days),
+            max_workers=args.max_workers, run_store=run_store
+        )
+        for run_id, error in errors.items():
+            print(f"failed to compute cost for run {run_id}: {error}", file=sys.stderr)
+        print(
+            f"ingested {len(ingested)} runs into {args.warehouse}, high-water mark {warehouse.high_water_mark}",
+            file=sys.stderr
+        )
+
+        if errors:
+            sys.exit(1)
+
+    else:
+        result = warehouse.query(
+            by=[c.strip() for c in args.by.split(',') if c.strip()], bucket=args.bucket,
+            workflow_id=args.workflow_id, name_prefix=args.name_prefix, process=args.process,
+            since=parse_utc(args.since), until=parse_utc(args.until)
+        )
+        if args.csv:
+            result.to_csv(sys.stdout, index=False)
+        else:
+            print(result.to_string(index=False))
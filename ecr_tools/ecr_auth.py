@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+On-disk cache of ECR authorization tokens shared across sync invocations.
+
+Tokens from ecr:GetAuthorizationToken are valid for 12 hours. They are cached
+per registry (account and region) in files readable only by the current user,
+together with a Docker client config directory holding the credentials. Docker
+(``docker --config DIR``) and other OCI clients that read Docker config files
+(e.g. ``DOCKER_CONFIG=DIR crane ...``) can use the cached credentials without
+running ``docker login``.
+"""
+
+import os
+import json
+import base64
+import threading
+from datetime import datetime, timedelta, timezone
+
+import boto3
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+    "healthomics_helper_tools",
+    "ecr_auth",
+)
+
+# refresh tokens that expire within this margin so long syncs don't hit 401s
+DEFAULT_REFRESH_MARGIN = timedelta(minutes=30)
+
+
+def _write_private(path, data):
+    """Atomically write a JSON file with mode 0600."""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def parse_registry(ecr_registry):
+    """
+    Split an ECR registry hostname into account id and region.
+
+    E.g., '123456789012.dkr.ecr.eu-west-2.amazonaws.com' -> ('123456789012', 'eu-west-2')
+    """
+    parts = ecr_registry.split(".")
+    return parts[0], parts[3]
+
+
+class EcrAuthCache:
+    """ECR credentials cached on disk, refreshed automatically close to expiry."""
+
+    def __init__(self, cache_dir=None, refresh_margin=DEFAULT_REFRESH_MARGIN, session=None):
+        self.cache_dir = cache_dir or DEFAULT_CACHE_DIR
+        self.refresh_margin = refresh_margin
+        self._session = session or boto3.Session()
+        self._tokens = {}
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, mode=0o700, exist_ok=True)
+
+    def _token_path(self, ecr_registry):
+        account_id, region = parse_registry(ecr_registry)
+        return os.path.join(self.cache_dir, f"{account_id}_{region}.json")
+
+    def docker_config_dir(self, ecr_registry):
+        """Docker client config directory holding credentials for one registry."""
+        account_id, region = parse_registry(ecr_registry)
+        return os.path.join(self.cache_dir, "docker", f"{account_id}_{region}")
+
+    def _is_fresh(self, token):
+        expires_at = datetime.fromisoformat(token["expires_at"])
+        return expires_at - datetime.now(timezone.utc) > self.refresh_margin
+
+    def _load(self, ecr_registry):
+        try:
+            with open(self._token_path(ecr_registry), "r") as f:
+                token = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+        # the docker config may have been removed independently of the token
+        if not os.path.exists(os.path.join(self.docker_config_dir(ecr_registry), "config.json")):
+            return None
+        return token
+
+    def _fetch(self, ecr_registry):
+        account_id, region = parse_registry(ecr_registry)
+        ecr_client = self._session.client("ecr", region_name=region)
+        response = ecr_client.get_authorization_token(registryIds=[account_id])
+        auth_data = response["authorizationData"][0]
+
+        token = {
+            "registry": ecr_registry,
+            "account_id": account_id,
+            "region": region,
+            "authorization_token": auth_data["authorizationToken"],
+            "expires_at": auth_data["expiresAt"].astimezone(timezone.utc).isoformat(),
+        }
+
+        config_dir = self.docker_config_dir(ecr_registry)
+        os.makedirs(config_dir, mode=0o700, exist_ok=True)
+        _write_private(
+            os.path.join(config_dir, "config.json"),
+            {"auths": {ecr_registry: {"auth": token["authorization_token"]}}},
+        )
+        _write_private(self._token_path(ecr_registry), token)
+        return token
+
+    def token(self, ecr_registry):
+        """
+        Return a cached token for the registry, fetching a new one if needed.
+
+        Returns:
+            dict: with 'authorization_token' (base64 'AWS:password') and 'expires_at'
+        """
+        with self._lock:
+            token = self._tokens.get(ecr_registry)
+            if not token or not self._is_fresh(token):
+                token = self._load(ecr_registry)
+            if not token or not self._is_fresh(token):
+                token = self._fetch(ecr_registry)
+            self._tokens[ecr_registry] = token
+            return token
+
+    def credentials(self, ecr_registry):
+        """Return (username, password) for the registry."""
+        decoded = base64.b64decode(self.token(ecr_registry)["authorization_token"])
+        username, password = decoded.decode("utf-8").split(":", 1)
+        return username, password
+
+    def docker_config(self, ecr_registry):
+        """Ensure credentials are fresh and return the Docker config directory to use."""
+        self.token(ecr_registry)
+        return self.docker_config_dir(ecr_registry)
@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+"""
+Script to reconcile ECR with a pipeline's container requirements in one step.
+
+Submits the container image manifest to the omx-container-puller Step Functions
+state machine in chunks, waits for the executions to finish, checks which
+containers from omics.config are still missing in ECR and pushes only those
+through the local sync path, repeating until nothing is missing or the retry
+limit is reached.
+"""
+
+import sys
+import json
+import time
+import random
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import boto3
+from botocore.exceptions import ClientError
+
+# sibling modules, whether run as a script from this directory or imported as ecr_tools.reconcile
+try:
+    from .ecr_auth import EcrAuthCache
+    from .find_containers_stepfunction_missed import parse_container_spec
+    from .sync_containers_to_ecr import (
+        parse_omics_config,
+        load_manifest,
+        get_local_docker_images,
+        region_from_registry,
+        sync_container,
+    )
+except ImportError:
+    from ecr_auth import EcrAuthCache
+    from find_containers_stepfunction_missed import parse_container_spec
+    from sync_containers_to_ecr import (
+        parse_omics_config,
+        load_manifest,
+        get_local_docker_images,
+        region_from_registry,
+        sync_container,
+    )
+
+DEFAULT_STATE_MACHINE_NAME = "omx-container-puller"
+TERMINAL_EXECUTION_STATUSES = ("SUCCEEDED", "FAILED", "TIMED_OUT", "ABORTED")
+
+# batch_get_image accepts at most 100 image ids per call
+ECR_BATCH_SIZE = 100
+
+
+def chunk(items, size):
+    """Split a list into consecutive chunks of at most size items."""
+    return [items[i : i + size] for i in range(0, len(items), size)]
+
+
+def submit_manifest(sfn_client, state_machine_arn, manifest, chunk_size=50):
+    """
+    Start one state machine execution per manifest chunk.
+
+    Returns:
+        list: execution ARNs
+    """
+    run_id = time.strftime("%Y%m%dT%H%M%S")
+    execution_arns = []
+    for i, images in enumerate(chunk(manifest, chunk_size)):
+        response = sfn_client.start_execution(
+            stateMachineArn=state_machine_arn,
+            name=f"reconcile-{run_id}-{i}",
+            input=json.dumps({"manifest": images}),
+        )
+        print(
+            f"  Started execution {i + 1} ({len(images)} images): "
+            f"{response['executionArn']}"
+        )
+        execution_arns.append(response["executionArn"])
+    return execution_arns
+
+
+def wait_for_executions(
+    sfn_client,
+    execution_arns,
+    initial_delay=5,
+    max_delay=120,
+    timeout=4 * 3600,
+    sleep=time.sleep,
+):
+    """
+    Poll executions with jittered exponential backoff until all have finished.
+
+    Returns:
+        dict: execution ARN -> final status ("TIMEOUT" if still running at the deadline)
+    """
+    pending = list(execution_arns)
+    statuses = {}
+    delay = initial_delay
+    deadline = time.monotonic() + timeout
+
+    while pending:
+        for arn in list(pending):
+            status = sfn_client.describe_execution(executionArn=arn)["status"]
+            if status in TERMINAL_EXECUTION_STATUSES:
+                statuses[arn] = status
+                pending.remove(arn)
+                print(f"  {arn.split(':')[-1]}: {status}")
+
+        if not pending:
+            break
+
+        if time.monotonic() >= deadline:
+            for arn in pending:
+                statuses[arn] = "TIMEOUT"
+            print(f"  ⚠ {len(pending)} execution(s) still running after {timeout}s")
+            break
+
+        sleep(delay * random.uniform(0.5, 1.0))
+        delay = min(delay * 2, max_delay)
+
+    return statuses
+
+
+def find_missing_images(ecr_client, containers):
+    """
+    Check which containers are missing in ECR with batched lookups.
+
+    Containers are grouped by repository and each group is checked with
+    batch_get_image, up to 100 tags per call.
+
+    Returns:
+        list: container specs that are not in ECR
+    """
+    by_repository = {}
+    for container in sorted(set(containers)):
+        repository, tag = parse_container_spec(container)
+        by_repository.setdefault(repository, []).append((tag, container))
+
+    missing = []
+    for repository, tags in by_repository.items():
+        for batch in chunk(tags, ECR_BATCH_SIZE):
+            try:
+                response = ecr_client.batch_get_image(
+                    repositoryName=repository,
+                    imageIds=[{"imageTag": tag} for tag, _ in batch],
+                )
+            except ClientError as e:
+                if e.response["Error"]["Code"] != "RepositoryNotFoundException":
+                    print(f"Error checking {repository}: {e}")
+                missing += [container for _, container in batch]
+                continue
+
+            found = {image["imageId"].get("imageTag") for image in response["images"]}
+            missing += [container for tag, container in batch if tag not in found]
+
+    return missing
+
+
+def local_sync(containers, ecr_registry, region, manifest, dry_run=False):
+    """
+    Push containers through the local docker pull/tag/push path.
+
+    Returns:
+        list: containers that failed to sync
+    """
+    targets = [
+        {
+            "region": region,
+            "registry": ecr_registry,
+            "ecr_client": boto3.client("ecr", region_name=region),
+        }
+    ]
+    if not dry_run:
+        targets[0]["auth"] = EcrAuthCache()
+        try:
+            targets[0]["auth"].token(ecr_registry)
+        except Exception as e:
+            print(f"✗ Failed to get ECR credentials: {e}")
+            return list(containers)
+
+    local_images = get_local_docker_images()
+
+    failed = []
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        for container in containers:
+            print(f"Processing: {container}")
+            results = sync_container(
+                container, local_images, manifest, targets, executor, dry_run=dry_run
+            )
+            if not all(results.values()):
+                failed.append(container)
+            print()
+    return failed
+
+
+def reconcile(
+    containers,
+    manifest,
+    ecr_client,
+    sfn_client=None,
+    state_machine_arn=None,
+    chunk_size=50,
+    max_rounds=3,
+    sync_fn=None,
+    wait_options=None,
+):
+    """
+    Run the Step Functions puller (optional) then retry missing images until converged.
+
+    Args:
+        containers: container specs from omics.config
+        manifest: container image manifest (public image uris)
+        ecr_client: boto3 ECR client for the target registry
+        sfn_client: boto3 Step Functions client; if None the state machine is not run
+        sync_fn: callable(list of missing containers) -> list of failed containers
+        wait_options: keyword arguments for wait_for_executions
+
+    Returns:
+        list: containers still missing when reconciliation stopped
+    """
+    if sfn_client and state_machine_arn and manifest:
+        print(f"Submitting {len(manifest)} images to {state_machine_arn}")
+        execution_arns = submit_manifest(
+            sfn_client, state_machine_arn, manifest, chunk_size=chunk_size
+        )
+        print("Waiting for executions to finish...")
+        wait_for_executions(sfn_client, execution_arns, **(wait_options or {}))
+
+    missing = find_missing_images(ecr_client, containers)
+    for round_number in range(1, max_rounds + 1):
+        print(f"\nRound {round_number}: {len(missing)} container(s) missing in ECR")
+        if not missing or not sync_fn:
+            break
+
+        sync_fn(missing)
+        missing = find_missing_images(ecr_client, missing)
+
+    return missing
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run the container puller and retry missing images until ECR is complete"
+    )
+    parser.add_argument(
+        "--config",
+        type=str,
+        default="../conf/omics.config",
+        help="Path to omics.config file (default: ../conf/omics.config)",
+    )
+    parser.add_argument(
+        "--manifest",
+        type=str,
+        default="../container_image_manifest.json",
+        help="Path to container_image_manifest.json (default: ../container_image_manifest.json)",
+    )
+    parser.add_argument(
+        "--region",
+        type=str,
+        default="eu-west-2",
+        help="AWS region (default: eu-west-2)",
+    )
+    parser.add_argument(
+        "--state-machine-arn",
+        type=str,
+        default=None,
+        help=(
+            "Container puller state machine ARN "
+            f"(default: {DEFAULT_STATE_MACHINE_NAME} in the registry account/region)"
+        ),
+    )
+    parser.add_argument(
+        "--skip-step-function",
+        action="store_true",
+        help="Do not start the state machine; only retry images missing in ECR",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=50,
+        help="Number of manifest images per state machine execution (default: 50)",
+    )
+    parser.add_argument(
+        "--max-rounds",
+        type=int,
+        default=3,
+        help="Maximum number of local sync retry rounds (default: 3)",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=int,
+        default=4 * 3600,
+        help="Maximum seconds to wait for state machine executions (default: 14400)",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Show what the local sync would do without pulling, tagging or pushing",
+    )
+
+    args = parser.parse_args()
+
+    config_path = Path(args.config)
+    manifest_path = Path(args.manifest)
+
+    if not config_path.exists():
+        print(f"Error: Config file not found at {config_path}")
+        sys.exit(1)
+
+    if not manifest_path.exists():
+        print(f"Error: Manifest file not found at {manifest_path}")
+        sys.exit(1)
+
+    ecr_registry, containers = parse_omics_config(config_path)
+    manifest = load_manifest(manifest_path)
+
+    if not ecr_registry:
+        print("Error: Could not find ecr_registry in config file")
+        sys.exit(1)
+
+    region = region_from_registry(ecr_registry) or args.region
+    account_id = ecr_registry.split(".")[0]
+    state_machine_arn = (
+        args.state_machine_arn
+        or f"arn:aws:states:{region}:{account_id}:stateMachine:{DEFAULT_STATE_MACHINE_NAME}"
+    )
+
+    print("=" * 70)
+    print("Container Reconcile")
+    print("=" * 70)
+    print(f"ECR Registry: {ecr_registry}")
+    print(f"Target containers: {len(containers)}")
+    print(f"Manifest images: {len(manifest)}")
+    print("=" * 70 + "\n")
+
+    ecr_client = boto3.client("ecr", region_name=region)
+    sfn_client = None
+    if not args.skip_step_function:
+        sfn_client = boto3.client("stepfunctions", region_name=region)
+
+    missing = reconcile(
+        containers,
+        manifest,
+        ecr_client,
+        sfn_client=sfn_client,
+        state_machine_arn=state_machine_arn,
+        chunk_size=args.chunk_size,
+        max_rounds=args.max_rounds,
+        sync_fn=lambda images: local_sync(
+            images, ecr_registry, region, manifest, dry_run=args.dry_run
+        ),
+        wait_options={"timeout": args.timeout},
+    )
+
+    print("\n" + "=" * 70)
+    print("SUMMARY")
+    print("=" * 70)
+    print(f"Total containers: {len(set(containers))}")
+    print(f"Missing: {len(missing)}")
+
+    if missing:
+        print("\n" + "=" * 70)
+        print("MISSING CONTAINERS:")
+        print("=" * 70)
+        for container in missing:
+            print(f"  - {container}")
+        sys.exit(1)
+    else:
+        print("\n✓ All containers exist in ECR!")
+        sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -9,10 +9,19 @@ import sys
 import json
 import argparse
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 import boto3
 from pathlib import Path
 from botocore.exceptions import ClientError
 
+# sibling modules, whether run as a script from this directory or imported as ecr_tools.sync_containers_to_ecr
+try:
+    from .ecr_auth import DEFAULT_CACHE_DIR, EcrAuthCache
+    from .sync_metrics import SyncMetrics
+except ImportError:
+    from ecr_auth import DEFAULT_CACHE_DIR, EcrAuthCache
+    from sync_metrics import SyncMetrics
+
 
 def parse_omics_config(config_path):
     """Parse omics.config and extract ECR registry and containers."""
@@ -130,7 +139,33 @@ def match_manifest_image(target_spec, manifest_images):
     return None
 
 
-def pull_with_registry_fallback(image_name):
+def get_image_size(image_name):
+    """Return the size in bytes of a local Docker image, or 0 if unknown."""
+    try:
+        result = subprocess.run(
+            ["docker", "image", "inspect", "--format", "{{.Size}}", image_name],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        return int(result.stdout.strip())
+    except (subprocess.CalledProcessError, ValueError):
+        return 0
+
+
+def count_transferred_layers(output, marker):
+    """Count layers in docker pull/push progress output ending with marker."""
+    return sum(1 for line in output.splitlines() if line.strip().endswith(marker))
+
+
+def record_pull(metrics, image_key, image_name, output):
+    """Record layers/bytes pulled; bytes are the full local image size, an upper bound."""
+    layers = count_transferred_layers(output, "Pull complete")
+    n_bytes = get_image_size(image_name) if layers else 0
+    metrics.add_transfer(image_key, "pulled", n_bytes=n_bytes, n_layers=layers)
+
+
+def pull_with_registry_fallback(image_name, metrics=None, image_key=None):
     """
     Attempt to pull image.
     If it fails and image starts with known namespaces,
@@ -140,14 +175,19 @@ def pull_with_registry_fallback(image_name):
       - biocontainers/*  -> quay.io/biocontainers/*
       - nf-core/*        -> quay.io/nf-core/*
     """
+    metrics = metrics or SyncMetrics()
+    image_key = image_key or image_name
+
     print(f"  Pulling {image_name}...")
     try:
-        subprocess.run(
+        result = subprocess.run(
             ["docker", "pull", image_name],
             check=True,
             capture_output=True,
+            text=True,
         )
         print("  ✓ Pulled successfully")
+        record_pull(metrics, image_key, image_name, result.stdout)
         return image_name
     except subprocess.CalledProcessError:
         fallback_prefixes = ("biocontainers/", "nf-core/")
@@ -156,13 +196,16 @@ def pull_with_registry_fallback(image_name):
             if image_name.startswith(prefix):
                 fallback_image = f"quay.io/{image_name}"
                 print(f"  ⚠ Pull failed, retrying with {fallback_image}...")
+                metrics.add_retry(image_key)
                 try:
-                    subprocess.run(
+                    result = subprocess.run(
                         ["docker", "pull", fallback_image],
                         check=True,
                         capture_output=True,
+                        text=True,
                     )
                     print("  ✓ Pulled successfully via quay.io")
+                    record_pull(metrics, image_key, fallback_image, result.stdout)
                     return fallback_image
                 except subprocess.CalledProcessError as e:
                     print(f"  ✗ Failed to pull fallback image: {e}")
@@ -283,18 +326,178 @@ def set_ecr_repository_policy(ecr_client, repository_name):
         return False
 
 
-def push_image(image_tag):
-    """Push a Docker image to ECR."""
+def push_image(image_tag, metrics=None, image_key=None, docker_config=None):
+    """Push a Docker image to ECR, optionally using a specific Docker config directory."""
     print(f"  Pushing {image_tag}...")
+    docker = ["docker", "--config", docker_config] if docker_config else ["docker"]
     try:
-        subprocess.run(["docker", "push", image_tag], check=True, capture_output=True)
+        result = subprocess.run(
+            docker + ["push", image_tag], check=True, capture_output=True, text=True
+        )
         print(f"  ✓ Pushed successfully")
+        if metrics:
+            # layers that already exist in the repository are not uploaded
+            layers = count_transferred_layers(result.stdout, "Pushed")
+            n_bytes = get_image_size(image_tag) if layers else 0
+            metrics.add_transfer(
+                image_key or image_tag, "pushed", n_bytes=n_bytes, n_layers=layers
+            )
         return True
     except subprocess.CalledProcessError as e:
         print(f"  ✗ Failed to push: {e}")
         return False
 
 
+def region_from_registry(ecr_registry):
+    """Extract the AWS region from an ECR registry hostname, or None."""
+    region_match = re.search(r"\.([a-z0-9-]+)\.amazonaws\.com", ecr_registry)
+    return region_match.group(1) if region_match else None
+
+
+def registry_for_region(ecr_registry, region):
+    """
+    Build the ECR registry hostname for the same account in another region.
+
+    E.g., ('123456789012.dkr.ecr.eu-west-2.amazonaws.com', 'us-east-1')
+          -> '123456789012.dkr.ecr.us-east-1.amazonaws.com'
+    """
+    account_id = ecr_registry.split(".")[0]
+    return f"{account_id}.dkr.ecr.{region}.amazonaws.com"
+
+
+def prepare_ecr_repository(ecr_client, repository_name):
+    """Ensure an ECR repository exists and carries the HealthOmics policy."""
+    if ensure_ecr_repository(ecr_client, repository_name):
+        set_ecr_repository_policy(ecr_client, repository_name)
+        return True
+    return False
+
+
+def push_to_region(target, intermediate_tag, target_spec, dry_run=False, metrics=None):
+    """
+    Set up the repository, tag and push a single image to one regional registry.
+
+    Args:
+        target: dict with 'region', 'registry' and 'ecr_client' keys, and
+            optionally an EcrAuthCache under 'auth' to push with cached credentials
+        intermediate_tag: local image tag in target_spec format
+        target_spec: container spec from omics.config
+
+    Returns:
+        bool: True if the image was pushed (or would be, on a dry run)
+    """
+    metrics = metrics or SyncMetrics()
+    region = target["region"]
+    repository = target_spec.split(":")[0]
+    ecr_image = f"{target['registry']}/{target_spec}"
+
+    if dry_run:
+        print(f"  [DRY RUN] [{region}] Would ensure repository exists: {repository}")
+        print(f"  [DRY RUN] [{region}] Would set HealthOmics policy on: {repository}")
+        print(f"  [DRY RUN] [{region}] Would tag for ECR: {intermediate_tag} -> {ecr_image}")
+        print(f"  [DRY RUN] [{region}] Would push: {ecr_image}")
+        return True
+
+    with metrics.stage(target_spec, "repo_setup", region) as outcome:
+        outcome["ok"] = prepare_ecr_repository(target["ecr_client"], repository)
+
+    print(f"  [{region}] Tagging for ECR: {ecr_image}")
+    with metrics.stage(target_spec, "tag", region) as outcome:
+        outcome["ok"] = tag_image(intermediate_tag, ecr_image)
+    if not outcome["ok"]:
+        return False
+
+    # refreshes the cached token if it is close to expiry
+    docker_config = None
+    if target.get("auth"):
+        docker_config = target["auth"].docker_config(target["registry"])
+
+    with metrics.stage(target_spec, "push", region) as outcome:
+        outcome["ok"] = push_image(
+            ecr_image, metrics=metrics, image_key=target_spec, docker_config=docker_config
+        )
+    return outcome["ok"]
+
+
+def sync_container(
+    target_spec,
+    local_images,
+    manifest_images,
+    targets,
+    executor,
+    dry_run=False,
+    metrics=None,
+):
+    """
+    Make a single container available in every target regional registry.
+
+    The image is resolved (found locally or pulled) and retagged once, then
+    pushed to all regional registries concurrently.
+
+    Returns:
+        dict: region -> bool indicating whether the push succeeded
+    """
+    metrics = metrics or SyncMetrics()
+    failed = {target["region"]: False for target in targets}
+
+    # Search for matching local image (ignoring prefix before first "/")
+    local_match = find_matching_local_image(target_spec, local_images)
+
+    if local_match:
+        print(f"  ✓ Found locally as: {local_match}")
+        source_image = local_match
+    else:
+        print(f"  ✗ Not found locally")
+
+        # Find in manifest
+        manifest_match = match_manifest_image(target_spec, manifest_images)
+
+        if not manifest_match:
+            print(f"  ✗ Not found in manifest either. Skipping.")
+            return failed
+
+        print(f"  Found in manifest as: {manifest_match}")
+
+        # Pull image
+        if dry_run:
+            print(f"  [DRY RUN] Would pull: {manifest_match}")
+            source_image = manifest_match
+        else:
+            with metrics.stage(target_spec, "pull") as outcome:
+                pulled_image = pull_with_registry_fallback(
+                    manifest_match, metrics=metrics, image_key=target_spec
+                )
+                outcome["ok"] = bool(pulled_image)
+
+            if not pulled_image:
+                return failed
+
+            source_image = pulled_image
+
+    # Tag as target_spec format for local intermediate step
+    intermediate_tag = target_spec
+
+    # Tag image to intermediate format (if needed)
+    if source_image != intermediate_tag:
+        if dry_run:
+            print(f"  [DRY RUN] Would retag: {source_image} -> {intermediate_tag}")
+        else:
+            print(f"  Retagging: {source_image} -> {intermediate_tag}")
+            with metrics.stage(target_spec, "tag") as outcome:
+                outcome["ok"] = tag_image(source_image, intermediate_tag)
+            if not outcome["ok"]:
+                return failed
+
+    # Fan the push out to every regional registry
+    futures = {
+        target["region"]: executor.submit(
+            push_to_region, target, intermediate_tag, target_spec, dry_run, metrics
+        )
+        for target in targets
+    }
+    return {region: future.result() for region, future in futures.items()}
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Sync containers from omics.config to ECR"
@@ -311,17 +514,69 @@ def main():
         default="../container_image_manifest.json",
         help="Path to container_image_manifest.json (default: ../container_image_manifest.json)",
     )
+    parser.add_argument(
+        "--previous-config",
+        type=str,
+        default=None,
+        help=(
+            "omics.config from a previous pipeline version; only containers "
+            "added or changed since then are synced"
+        ),
+    )
     parser.add_argument(
         "--region",
         type=str,
         default="eu-west-2",
         help="AWS region (default: eu-west-2)",
     )
+    parser.add_argument(
+        "--regions",
+        type=str,
+        default=None,
+        help=(
+            "Comma-separated list of AWS regions to replicate to, "
+            "e.g. eu-west-2,us-east-1 (default: the region of ecr_registry)"
+        ),
+    )
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=None,
+        help="Maximum concurrent regional pushes (default: number of regions)",
+    )
     parser.add_argument(
         "--dry-run",
         action="store_true",
         help="Show what would be done without actually doing it",
     )
+    parser.add_argument(
+        "--auth-cache-dir",
+        type=str,
+        default=DEFAULT_CACHE_DIR,
+        help=f"Directory for cached ECR credentials (default: {DEFAULT_CACHE_DIR})",
+    )
+    parser.add_argument(
+        "--no-auth-cache",
+        action="store_true",
+        help="Run 'docker login' instead of using cached ECR credentials",
+    )
+    parser.add_argument(
+        "--metrics-jsonl",
+        type=str,
+        default=None,
+        help="Write per-image stage timings, transfers and API latency as JSON Lines",
+    )
+    parser.add_argument(
+        "--metrics-prom",
+        type=str,
+        default=None,
+        help="Write sync metrics as a Prometheus textfile (node_exporter textfile collector)",
+    )
+    parser.add_argument(
+        "--metrics-summary",
+        action="store_true",
+        help="Print a per-stage and per-API-call timing summary table",
+    )
 
     args = parser.parse_args()
 
@@ -353,118 +608,101 @@ def main():
         print("Error: Could not find ecr_registry in config file")
         sys.exit(1)
 
+    if args.previous_config:
+        _, previous_containers = parse_omics_config(args.previous_config)
+        previous_containers = set(previous_containers)
+        print(f"Previous config: {args.previous_config}")
+        target_containers = [c for c in target_containers if c not in previous_containers]
+
     print(f"ECR Registry: {ecr_registry}")
     print(f"Target containers: {len(target_containers)}")
     print(f"Manifest images: {len(manifest_images)}\n")
 
     # Extract region from registry
-    region_match = re.search(r"\.([a-z0-9-]+)\.amazonaws\.com", ecr_registry)
-    region = region_match.group(1) if region_match else args.region
-    print(f"AWS Region: {region}\n")
+    region = region_from_registry(ecr_registry) or args.region
+    if args.regions:
+        regions = [r.strip() for r in args.regions.split(",") if r.strip()]
+    else:
+        regions = [region]
+    print(f"AWS Region(s): {', '.join(regions)}\n")
 
     # Get local Docker images
     print("Checking local Docker images...")
     local_images = get_local_docker_images()
     print(f"Found {len(local_images)} local images\n")
 
-    # Initialize ECR client
-    ecr_client = boto3.client("ecr", region_name=region)
+    metrics = SyncMetrics()
+
+    # Initialize one registry/ECR client per target region
+    targets = [
+        {
+            "region": r,
+            "registry": registry_for_region(ecr_registry, r),
+            "ecr_client": metrics.instrument_client(
+                boto3.client("ecr", region_name=r)
+            ),
+        }
+        for r in regions
+    ]
+
+    executor = ThreadPoolExecutor(max_workers=args.max_workers or len(targets))
 
     # Login to ECR
-    if not args.dry_run:
-        if not ecr_login(ecr_registry, region):
+    if not args.dry_run and args.no_auth_cache:
+        logins = executor.map(
+            lambda target: ecr_login(target["registry"], target["region"]), targets
+        )
+        if not all(list(logins)):
             print("Failed to login to ECR. Exiting.")
             sys.exit(1)
+    elif not args.dry_run:
+        print(f"\nUsing cached ECR credentials in {args.auth_cache_dir}")
+        auth = EcrAuthCache(args.auth_cache_dir)
+        for target in targets:
+            try:
+                token = auth.token(target["registry"])
+            except Exception as e:
+                print(f"✗ Failed to get ECR credentials for {target['registry']}: {e}")
+                print("Failed to login to ECR. Exiting.")
+                sys.exit(1)
+            print(f"✓ {target['registry']} credentials valid until {token['expires_at']}")
+            target["auth"] = auth
 
     # Process each target container
     print("\n" + "=" * 70)
     print("Processing Containers")
     print("=" * 70 + "\n")
 
+    region_results = {r: {"success": [], "failed": []} for r in regions}
     success_count = 0
     failed_count = 0
 
     for target_spec in target_containers:
         print(f"Processing: {target_spec}")
 
-        # Search for matching local image (ignoring prefix before first "/")
-        local_match = find_matching_local_image(target_spec, local_images)
-
-        if local_match:
-            print(f"  ✓ Found locally as: {local_match}")
-            source_image = local_match
-        else:
-            print(f"  ✗ Not found locally")
-
-            # Find in manifest
-            manifest_match = match_manifest_image(target_spec, manifest_images)
-
-            if not manifest_match:
-                print(f"  ✗ Not found in manifest either. Skipping.")
-                failed_count += 1
-                continue
-
-            print(f"  Found in manifest as: {manifest_match}")
-
-            # Pull image
-            if args.dry_run:
-                print(f"  [DRY RUN] Would pull: {manifest_match}")
-                source_image = manifest_match
-            else:
-                pulled_image = pull_with_registry_fallback(manifest_match)
-
-                if not pulled_image:
-                    failed_count += 1
-                    continue
-
-                source_image = pulled_image
-
-        # Prepare ECR tag (use the target_spec format for ECR)
-        repository = target_spec.split(":")[0]
-        tag = target_spec.split(":")[1] if ":" in target_spec else "latest"
+        results = sync_container(
+            target_spec,
+            local_images,
+            manifest_images,
+            targets,
+            executor,
+            dry_run=args.dry_run,
+            metrics=metrics,
+        )
 
-        # Tag as target_spec format for local intermediate step
-        intermediate_tag = target_spec
-        ecr_image = f"{ecr_registry}/{target_spec}"
+        for r, ok in results.items():
+            region_results[r]["success" if ok else "failed"].append(target_spec)
 
-        # Ensure repository exists and has correct policy
-        if args.dry_run:
-            print(f"  [DRY RUN] Would ensure repository exists: {repository}")
-            print(f"  [DRY RUN] Would set HealthOmics policy on: {repository}")
+        if all(results.values()):
+            success_count += 1
+            metrics.set_result(target_spec, "success")
         else:
-            if ensure_ecr_repository(ecr_client, repository):
-                set_ecr_repository_policy(ecr_client, repository)
-
-        # Tag image to intermediate format (if needed)
-        if source_image != intermediate_tag:
-            if args.dry_run:
-                print(f"  [DRY RUN] Would retag: {source_image} -> {intermediate_tag}")
-            else:
-                print(f"  Retagging: {source_image} -> {intermediate_tag}")
-                if not tag_image(source_image, intermediate_tag):
-                    failed_count += 1
-                    continue
-
-        # Tag image for ECR
-        if args.dry_run:
-            print(f"  [DRY RUN] Would tag for ECR: {intermediate_tag} -> {ecr_image}")
-        else:
-            print(f"  Tagging for ECR: {ecr_image}")
-            if not tag_image(intermediate_tag, ecr_image):
-                failed_count += 1
-                continue
-
-        # Push to ECR
-        if args.dry_run:
-            print(f"  [DRY RUN] Would push: {ecr_image}")
-        else:
-            if not push_image(ecr_image):
-                failed_count += 1
-                continue
-
-        success_count += 1
+            failed_count += 1
+            metrics.set_result(target_spec, "failed")
         print()
 
+    executor.shutdown()
+
     # Summary
     print("=" * 70)
     print("SUMMARY")
@@ -473,6 +711,28 @@ def main():
     print(f"Successfully processed: {success_count}")
     print(f"Failed: {failed_count}")
 
+    if len(regions) > 1:
+        print()
+        for r in regions:
+            print(
+                f"  {r}: {len(region_results[r]['success'])} succeeded, "
+                f"{len(region_results[r]['failed'])} failed"
+            )
+            for target_spec in region_results[r]["failed"]:
+                print(f"    - {target_spec}")
+
+    if args.metrics_summary:
+        print()
+        metrics.print_summary()
+
+    if args.metrics_jsonl:
+        metrics.write_jsonl(args.metrics_jsonl)
+        print(f"\nMetrics written to: {args.metrics_jsonl}")
+
+    if args.metrics_prom:
+        metrics.write_prometheus(args.metrics_prom)
+        print(f"Prometheus metrics written to: {args.metrics_prom}")
+
     if args.dry_run:
         print("\nThis was a dry run. No changes were made.")
 
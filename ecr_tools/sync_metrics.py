@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+Instrumentation for sync_containers_to_ecr.py.
+
+Records per-image stage wall time, an upper bound of bytes pulled/pushed,
+retries and ECR API call latency, and emits them as JSON Lines, a Prometheus textfile or
+a summary table.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+THROTTLING_ERROR_CODES = (
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "RequestLimitExceeded",
+)
+
+
+class SyncMetrics:
+    """Thread-safe collector for container sync measurements."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started = time.time()
+        self._t0 = time.perf_counter()
+        self.events = []
+        self.images = {}
+
+    def _image(self, image):
+        if image not in self.images:
+            self.images[image] = {
+                "image": image,
+                "result": None,
+                "seconds": defaultdict(float),
+                "bytes_pulled": 0,
+                "bytes_pushed": 0,
+                "layers_pulled": 0,
+                "layers_pushed": 0,
+                "retries": 0,
+            }
+        return self.images[image]
+
+    @contextmanager
+    def stage(self, image, stage, region=None):
+        """
+        Time a stage of an image sync.
+
+        The yielded dict can be updated with ``ok=False`` to mark the stage as failed.
+        """
+        outcome = {"ok": True}
+        start = time.perf_counter()
+        try:
+            yield outcome
+        except Exception:
+            outcome["ok"] = False
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            key = f"{stage}[{region}]" if region else stage
+            with self._lock:
+                self._image(image)["seconds"][key] += seconds
+                self.events.append(
+                    {
+                        "type": "stage",
+                        "image": image,
+                        "stage": stage,
+                        "region": region,
+                        "seconds": seconds,
+                        "ok": outcome["ok"],
+                    }
+                )
+
+    def add_transfer(self, image, direction, n_bytes=0, n_layers=0):
+        """
+        Add transferred bytes/layers; direction is 'pulled' or 'pushed'.
+
+        Docker doesn't report the size of the layers it moves, so callers pass the
+        full image size when any layer was transferred: bytes are an upper bound.
+        """
+        with self._lock:
+            record = self._image(image)
+            record[f"bytes_{direction}"] += n_bytes
+            record[f"layers_{direction}"] += n_layers
+
+    def add_retry(self, image):
+        with self._lock:
+            self._image(image)["retries"] += 1
+
+    def set_result(self, image, result):
+        with self._lock:
+            self._image(image)["result"] = result
+
+    def api_call(self, operation, seconds, region=None, retries=0, error=None):
+        with self._lock:
+            self.events.append(
+                {
+                    "type": "api",
+                    "operation": operation,
+                    "region": region,
+                    "seconds": seconds,
+                    "retries": retries,
+                    "error": error,
+                }
+            )
+
+    def instrument_client(self, client):
+        """Record latency, retries and errors of every call made by a boto3 client."""
+        region = client.meta.region_name
+        service = client.meta.service_model.service_name
+
+        def before_call(context=None, **kwargs):
+            if context is not None:
+                context["sync_metrics_start"] = time.perf_counter()
+
+        def record(model, context, retries=0, error=None):
+            start = (context or {}).get("sync_metrics_start")
+            if start is not None:
+                self.api_call(
+                    model.name,
+                    time.perf_counter() - start,
+                    region=region,
+                    retries=retries,
+                    error=error,
+                )
+
+        def after_call(parsed=None, model=None, context=None, **kwargs):
+            parsed = parsed or {}
+            record(
+                model,
+                context,
+                retries=parsed.get("ResponseMetadata", {}).get("RetryAttempts", 0),
+                error=parsed.get("Error", {}).get("Code"),
+            )
+
+        def after_call_error(exception=None, context=None, **kwargs):
+            # connection-level failures; the operation name is not passed here
+            start = (context or {}).get("sync_metrics_start")
+            if start is not None:
+                self.api_call(
+                    "ConnectionError",
+                    time.perf_counter() - start,
+                    region=region,
+                    error=type(exception).__name__,
+                )
+
+        # before-parameter-build is emitted ahead of before-call handlers that
+        # may short-circuit the request, so every call gets a start time
+        client.meta.events.register(f"before-parameter-build.{service}", before_call)
+        client.meta.events.register(f"after-call.{service}", after_call)
+        client.meta.events.register(f"after-call-error.{service}", after_call_error)
+        return client
+
+    def image_records(self):
+        with self._lock:
+            return [
+                {**record, "seconds": dict(record["seconds"])}
+                for record in self.images.values()
+            ]
+
+    def api_summary(self):
+        """Aggregate API events by operation."""
+        summary = {}
+        with self._lock:
+            api_events = [e for e in self.events if e["type"] == "api"]
+        for event in api_events:
+            op = summary.setdefault(
+                event["operation"],
+                {
+                    "calls": 0,
+                    "seconds": 0.0,
+                    "max_seconds": 0.0,
+                    "retries": 0,
+                    "errors": 0,
+                    "throttled": 0,
+                },
+            )
+            op["calls"] += 1
+            op["seconds"] += event["seconds"]
+            op["max_seconds"] = max(op["max_seconds"], event["seconds"])
+            op["retries"] += event["retries"]
+            if event["error"]:
+                op["errors"] += 1
+                if event["error"] in THROTTLING_ERROR_CODES:
+                    op["throttled"] += 1
+        return summary
+
+    def stage_summary(self):
+        """Aggregate stage wall time by stage name (summed over regions)."""
+        summary = {}
+        with self._lock:
+            stage_events = [e for e in self.events if e["type"] == "stage"]
+        for event in stage_events:
+            stage = summary.setdefault(
+                event["stage"], {"count": 0, "seconds": 0.0, "max_seconds": 0.0, "failed": 0}
+            )
+            stage["count"] += 1
+            stage["seconds"] += event["seconds"]
+            stage["max_seconds"] = max(stage["max_seconds"], event["seconds"])
+            if not event["ok"]:
+                stage["failed"] += 1
+        return summary
+
+    def write_jsonl(self, path):
+        """Write every stage/api event followed by one summary line per image."""
+        with self._lock:
+            events = list(self.events)
+        with open(path, "w") as f:
+            for event in events:
+                f.write(json.dumps({"started": self._started, **event}) + "\n")
+            for record in self.image_records():
+                line = {"started": self._started, "type": "image", **record}
+                f.write(json.dumps(line) + "\n")
+
+    def write_prometheus(self, path):
+        """
+        Write metrics in Prometheus text exposition format.
+
+        The file is written atomically so it can be read by the node_exporter
+        textfile collector while a sync is running.
+        """
+        images = self.image_records()
+        lines = [
+            "# HELP ecr_sync_duration_seconds Wall time of the whole sync.",
+            "# TYPE ecr_sync_duration_seconds gauge",
+            f"ecr_sync_duration_seconds {time.perf_counter() - self._t0:.6f}",
+            "# HELP ecr_sync_last_run_timestamp_seconds Start time of the sync.",
+            "# TYPE ecr_sync_last_run_timestamp_seconds gauge",
+            f"ecr_sync_last_run_timestamp_seconds {self._started:.3f}",
+            "# HELP ecr_sync_images Images processed by result.",
+            "# TYPE ecr_sync_images gauge",
+        ]
+        results = defaultdict(int)
+        for record in images:
+            results[record["result"] or "unknown"] += 1
+        for result, count in sorted(results.items()):
+            lines.append(f'ecr_sync_images{{result="{result}"}} {count}')
+
+        lines += [
+            "# HELP ecr_sync_stage_seconds Summed wall time per sync stage.",
+            "# TYPE ecr_sync_stage_seconds gauge",
+        ]
+        for name, stage in sorted(self.stage_summary().items()):
+            lines.append(f'ecr_sync_stage_seconds{{stage="{name}"}} {stage["seconds"]:.6f}')
+
+        lines += [
+            "# HELP ecr_sync_bytes_upper_bound Upper bound of bytes transferred: full size of each image with any layer transferred.",
+            "# TYPE ecr_sync_bytes_upper_bound gauge",
+            f'ecr_sync_bytes_upper_bound{{direction="pulled"}} {sum(r["bytes_pulled"] for r in images)}',
+            f'ecr_sync_bytes_upper_bound{{direction="pushed"}} {sum(r["bytes_pushed"] for r in images)}',
+            "# HELP ecr_sync_retries Image-level retries (e.g. registry fallbacks).",
+            "# TYPE ecr_sync_retries gauge",
+            f"ecr_sync_retries {sum(r['retries'] for r in images)}",
+            "# HELP ecr_sync_api_calls ECR API calls per operation.",
+            "# TYPE ecr_sync_api_calls gauge",
+        ]
+        api = sorted(self.api_summary().items())
+        for name, op in api:
+            lines.append(f'ecr_sync_api_calls{{operation="{name}"}} {op["calls"]}')
+        lines += [
+            "# HELP ecr_sync_api_seconds Summed ECR API call latency per operation.",
+            "# TYPE ecr_sync_api_seconds gauge",
+        ]
+        for name, op in api:
+            lines.append(f'ecr_sync_api_seconds{{operation="{name}"}} {op["seconds"]:.6f}')
+        lines += [
+            "# HELP ecr_sync_api_throttled ECR API calls that ended throttled.",
+            "# TYPE ecr_sync_api_throttled gauge",
+        ]
+        for name, op in api:
+            lines.append(f'ecr_sync_api_throttled{{operation="{name}"}} {op["throttled"]}')
+        lines += [
+            "# HELP ecr_sync_api_sdk_retries Retries made by the SDK per operation.",
+            "# TYPE ecr_sync_api_sdk_retries counter",
+        ]
+        for name, op in api:
+            lines.append(f'ecr_sync_api_sdk_retries{{operation="{name}"}} {op["retries"]}')
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, path)
+
+    def print_summary(self, slowest=5):
+        print("=" * 70)
+        print("PERFORMANCE")
+        print("=" * 70)
+        print(f"{'stage':<16}{'count':>8}{'total s':>12}{'mean s':>10}{'max s':>10}{'failed':>8}")
+        for name, stage in sorted(self.stage_summary().items()):
+            print(
+                f"{name:<16}{stage['count']:>8}{stage['seconds']:>12.2f}"
+                f"{stage['seconds'] / stage['count']:>10.2f}{stage['max_seconds']:>10.2f}"
+                f"{stage['failed']:>8}"
+            )
+
+        api = self.api_summary()
+        if api:
+            print()
+            print(
+                f"{'api call':<28}{'calls':>7}{'mean ms':>10}{'max ms':>10}"
+                f"{'retries':>9}{'throttled':>10}"
+            )
+            for name, op in sorted(api.items()):
+                print(
+                    f"{name:<28}{op['calls']:>7}{1000 * op['seconds'] / op['calls']:>10.1f}"
+                    f"{1000 * op['max_seconds']:>10.1f}{op['retries']:>9}{op['throttled']:>10}"
+                )
+
+        images = self.image_records()
+        print()
+        print(f"Bytes pulled (at most): {sum(r['bytes_pulled'] for r in images) / 2**30:.2f} GiB")
+        print(f"Bytes pushed (at most): {sum(r['bytes_pushed'] for r in images) / 2**30:.2f} GiB")
+        print(f"Image retries: {sum(r['retries'] for r in images)}")
+
+        images.sort(key=lambda r: sum(r["seconds"].values()), reverse=True)
+        if images[:slowest]:
+            print("\nSlowest images:")
+            for record in images[:slowest]:
+                stages = ", ".join(f"{k}={v:.1f}s" for k, v in record["seconds"].items())
+                print(f"  {record['image']}: {stages}")
@@ -0,0 +1,160 @@
+#!/bin/env python3
+
+"""
+estimates the HealthOmics instance types and cost of a Nextflow pipeline before it is run
+
+each process's cpus / memory / time request is resolved statically from its
+directives and the withLabel / withName settings in the pipeline config (e.g.
+nf-core conf/base.config) and mapped to the cheapest `omics.*` instance it fits on.
+per-process task counts and durations from past runs in the cost warehouse (see
+cost_warehouse.py) turn this into a predicted run cost. no AWS calls are needed
+when a price table is given, so this can run in CI.
+"""
+
+from argparse import ArgumentParser
+import sys
+
+import boto3
+import numpy as np
+import pandas as pd
+
+from batch_cost import parse_utc
+from compute_pricing import get_pricing
+from cost_warehouse import DEFAULT_WAREHOUSE_DIR, CostWarehouse
+from instances import fit_instances
+from nf import NextflowWorkflow, normalize_process_name
+from price_table import PriceTable, as_price_table
+
+parser = ArgumentParser()
+parser.add_argument('project', type=str, help="top level directory of the Nextflow workflow project")
+parser.add_argument('--profile', type=str, help="AWS profile to use")
+parser.add_argument('--region', type=str, help="AWS region to price instances in")
+parser.add_argument('--offering', type=str, help="path to pricing offer JSON")
+parser.add_argument('--price-table', type=str, help="path to a price table built with price_table.py")
+parser.add_argument('--offline', action='store_true', help="use the cached pricing offer without revalidating it")
+parser.add_argument(
+    '--config', type=str, action='append',
+    help="config file with process resource settings, in order of precedence. can be repeated. "
+         "defaults to conf/base.config, nextflow.config and conf/modules.config"
+)
+parser.add_argument('--history', type=str, default=DEFAULT_WAREHOUSE_DIR, help="cost warehouse directory with past runs")
+parser.add_argument('--no-history', action='store_true', help="don't use past runs, only map processes to instances")
+parser.add_argument('--workflow-id', type=str, help="only use past runs of this workflow")
+parser.add_argument('--since', type=str, help="only use past runs created at or after this ISO date/time (UTC)")
+parser.add_argument('-o', '--output', type=str, help="path to write the per-process estimate to as CSV")
+
+
+def request_frame(requests):
+    """
+    converts `NextflowWorkflow.resource_requests()` to a DataFrame
+
+    unresolved cpus default to 1 (the Nextflow default) and unresolved memory to
+    0, i.e. whatever the smallest instance provides
+    """
+    df = pd.DataFrame(requests, columns=['name', 'labels', 'cpus', 'memory_gib', 'time_hr'])
+    df['labels'] = df['labels'].map(lambda labels: ','.join(labels or []))
+    df['cpus'] = df['cpus'].fillna(1.0)
+    df['memory_gib'] = df['memory_gib'].fillna(0.0)
+    # the same process can be defined in several files (e.g. local and nf-core modules)
+    return df.drop_duplicates('name', keep='last').rename(columns={'name': 'process'})
+
+
+def historical_durations(task_history):
+    """
+    summarizes past task durations per (unscoped) process name
+
+    :param: task_history: DataFrame with runId, process and duration_hr columns,
+        e.g. `CostWarehouse.read('tasks')`
+
+    returns a DataFrame indexed by process with tasks_per_run (averaged over all
+    runs in the history), mean_duration_hr and p90_duration_hr
+    """
+    columns = ['tasks_per_run', 'mean_duration_hr', 'p90_duration_hr']
+    if task_history.empty:
+        return pd.DataFrame(columns=columns, index=pd.Index([], name='process'))
+
+    process = task_history['process'].map(lambda name: normalize_process_name(name, scoped=False))
+    n_runs = task_history['runId'].nunique()
+    durations = task_history['duration_hr'].groupby(process)
+    return pd.DataFrame({
+        'tasks_per_run': durations.size() / n_runs,
+        'mean_duration_hr': durations.mean(),
+        'p90_duration_hr': durations.quantile(0.9),
+    })[columns].rename_axis('process')
+
+
+def estimate(requests, pricing, history=None, region=None):
+    """
+    maps resource requests to instances and predicts per-process cost per run
+
+    :param: requests: output of `NextflowWorkflow.resource_requests()` or `request_frame()`
+    :param: pricing: PriceTable or output of `compute_pricing.get_pricing()`
+    :param: history: output of `historical_durations()`
+
+    returns a DataFrame with the instance, usd_per_hour and max_task_cost (at the
+    time limit) of each process, and with history tasks_per_run, mean_duration_hr
+    and estimated_cost. estimated_cost is NaN for processes without history
+    """
+    df = requests if isinstance(requests, pd.DataFrame) else request_frame(requests)
+    df = df.copy()
+
+    instance, usd_per_hour = fit_instances(
+        df['cpus'], df['memory_gib'], as_price_table(pricing), region=region
+    )
+    df['instance'] = instance
+    df['usd_per_hour'] = usd_per_hour
+    df['max_task_cost'] = df['time_hr'].astype('float64') * usd_per_hour
+
+    if history is not None:
+        df = df.join(history[['tasks_per_run', 'mean_duration_hr']], on='process')
+    else:
+        df['tasks_per_run'] = np.nan
+        df['mean_duration_hr'] = np.nan
+    df['estimated_cost'] = df['tasks_per_run'] * df['mean_duration_hr'] * df['usd_per_hour']
+
+    return df.sort_values(['estimated_cost', 'process'], ascending=[False, True], ignore_index=True)
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    if args.price_table:
+        price_table = PriceTable.load(args.price_table)
+        if len(price_table.regions) > 1:
+            region = args.region or boto3.Session(profile_name=args.profile).region_name
+            price_table = price_table.for_region(region)
+    else:
+        session = boto3.Session(region_name=args.region, profile_name=args.profile)
+        client = session.client('omics')
+        pricing = get_pricing(offering=args.offering, client=client, offline=args.offline)
+        price_table = PriceTable.from_pricing(pricing, region=client.meta.region_name)
+
+    workflow = NextflowWorkflow(args.project)
+    requests = request_frame(workflow.resource_requests(config_files=args.config))
+
+    history = None
+    if not args.no_history:
+        filters = [('workflowId', '==', args.workflow_id)] if args.workflow_id else None
+        task_history = CostWarehouse(args.history).read(
+            'tasks', columns=['runId', 'process', 'duration_hr', 'creationTime'], filters=filters
+        )
+        if args.since:
+            task_history = task_history[task_history['creationTime'] >= parse_utc(args.since)]
+        history = historical_durations(task_history)
+
+    result = estimate(requests, price_table, history=history)
+    print(result.to_string(index=False))
+
+    if args.output:
+        result.to_csv(args.output, index=False)
+
+    unfitted = result.loc[result['instance'].isna(), 'process']
+    if len(unfitted):
+        print(f"\nno instance fits the request of: {', '.join(unfitted)}", file=sys.stderr)
+
+    with_history = result['estimated_cost'].notna()
+    print(
+        f"\nestimated cost per run: ${result['estimated_cost'].sum():.2f} "
+        f"({with_history.sum()} of {len(result)} processes have history)",
+        file=sys.stderr
+    )
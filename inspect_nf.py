@@ -56,6 +56,17 @@ parser.add_argument(
     default="omics.config",
     help="Filename to use for generated nextflow config file",
 )
+parser.add_argument(
+    "--previous-manifest",
+    type=str,
+    help="Container image manifest from a previous pipeline version. If given, only added or changed images are written to the delta manifest. May be the same file as --output-manifest-file, which is read before it is overwritten.",
+)
+parser.add_argument(
+    "--output-delta-file",
+    type=str,
+    default="container_image_manifest.delta.json",
+    help="Filename to use for the delta manifest generated with --previous-manifest",
+)
 parser.add_argument("--region", type=str, help="AWS region name")
 parser.add_argument(
     "--profile",
@@ -80,11 +91,27 @@ if __name__ == "__main__":
         with open(args.namespace_config, "r") as f:
             namespace_config = json.load(f)
 
+    previous_manifest = None
+    if args.previous_manifest:
+        with open(args.previous_manifest, "r") as f:
+            previous_manifest = json.load(f)["manifest"]
+
     print(f"Creating container image manifest: {args.output_manifest_file}")
     manifest = workflow.get_container_manifest(substitutions=substitutions)
     with open(args.output_manifest_file, "w") as file:
         json.dump({"manifest": manifest}, file, indent=4)
 
+    if previous_manifest is not None:
+        diff = diff_container_manifests(previous_manifest, manifest)
+        delta = diff["added"] + diff["changed"]
+        print(
+            f"Creating delta container image manifest: {args.output_delta_file} "
+            f"({len(diff['added'])} added, {len(diff['changed'])} changed, "
+            f"{len(diff['removed'])} removed)"
+        )
+        with open(args.output_delta_file, "w") as file:
+            json.dump({"manifest": delta}, file, indent=4)
+
     print(f"Creating nextflow config file: {args.output_config_file}")
     config = workflow.get_omics_config(
         session=session, substitutions=substitutions, namespace_config=namespace_config
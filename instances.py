@@ -0,0 +1,78 @@
+"""
+resources of AWS HealthOmics `omics.*` instance types
+
+HealthOmics runs each task on the smallest instance that fits its cpus and memory
+request. instance resources follow from the type name: the size gives the vCPUs
+(large = 2, xlarge = 4, Nxlarge = 4N) and the family the GiB of memory per vCPU.
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+# GiB of memory per vCPU of the general purpose instance families
+GIB_PER_VCPU = {'c': 2, 'm': 4, 'r': 8}
+
+INSTANCE_TYPE_PATTERN = re.compile(r'^omics\.(?P<family>[a-z0-9]+)\.(?P<size>(?P<n>\d*)x?large)$')
+
+
+def parse_instance_type(instance_type):
+    """
+    returns {instance, family, cpus, memory_gib} for an `omics.*` instance type,
+    or None for types whose resources can't be derived from the name (e.g. GPU families)
+    """
+    match = INSTANCE_TYPE_PATTERN.match(instance_type or '')
+    if not match or match['family'] not in GIB_PER_VCPU:
+        return None
+
+    if match['size'] == 'large':
+        cpus = 2
+    else:
+        cpus = 4 * int(match['n'] or 1)
+
+    return {
+        'instance': instance_type,
+        'family': match['family'],
+        'cpus': cpus,
+        'memory_gib': cpus * GIB_PER_VCPU[match['family']],
+    }
+
+
+def instance_specs(price_table, region=None):
+    """
+    returns a DataFrame of instance types in the price table with their
+    family, cpus, memory_gib and usd_per_hour, cheapest first
+    """
+    specs = [
+        spec for spec in map(parse_instance_type, price_table.instance_types(region)) if spec
+    ]
+    df = pd.DataFrame(specs, columns=['instance', 'family', 'cpus', 'memory_gib'])
+    df['usd_per_hour'] = price_table.compute_prices(df['instance'], region=region)
+    return df.sort_values(['usd_per_hour', 'cpus', 'memory_gib'], ignore_index=True)
+
+
+def fit_instances(cpus, memory_gib, price_table, region=None, specs=None):
+    """
+    vectorized lookup of the cheapest instance type fitting each (cpus, memory_gib) request
+
+    returns a tuple of (array of instance types, float array of USD per hour). requests
+    that don't fit any instance get None and NaN
+    """
+    if specs is None:
+        specs = instance_specs(price_table, region=region)
+
+    cpus = np.asarray(cpus, dtype='float64')
+    memory_gib = np.asarray(memory_gib, dtype='float64')
+
+    # requests x instances, instances ordered cheapest first
+    fits = (
+        (cpus[:, None] <= specs['cpus'].to_numpy()[None, :])
+        & (memory_gib[:, None] <= specs['memory_gib'].to_numpy()[None, :])
+    )
+    first_fit = fits.argmax(axis=1)
+    fitted = fits.any(axis=1)
+
+    instance = np.where(fitted, specs['instance'].to_numpy(dtype=object)[first_fit], None)
+    usd_per_hour = np.where(fitted, specs['usd_per_hour'].to_numpy()[first_fit], np.nan)
+    return instance, usd_per_hour
@@ -4,6 +4,13 @@ from os import path
 from textwrap import dedent
 import warnings
 
+from nf.resources import (
+    merge_process_configs,
+    parse_process_config,
+    process_directives,
+    resolve_resources,
+)
+
 __NF_DIRECTIVES: str = """
     accelerator,afterScript,
     beforeScript,
@@ -160,6 +167,41 @@ class NextflowWorkflow:
             raise fnfe
         return _docker_registry
 
+    @property
+    def config_files(self) -> list:
+        """
+        config files with process settings, in the order nf-core pipelines include them
+        """
+        candidates = [
+            path.join(self._project_path, "conf", "base.config"),
+            self._nf_config,
+            path.join(self._project_path, "conf", "modules.config"),
+        ]
+        return [config_file for config_file in candidates if path.exists(config_file)]
+
+    def resource_requests(self, config_files=None) -> list:
+        """
+        returns the resource request of each process, resolved from its directives and
+        the withLabel / withName settings in `config_files` (defaults to `config_files`)
+
+        each request is a dictionary of {name, nf_file, labels, cpus, memory_gib, time_hr}
+        with None for values that can't be resolved statically
+        """
+        if config_files is None:
+            config_files = self.config_files
+
+        configs = []
+        for config_file in config_files:
+            with open(config_file, "r") as file:
+                configs.append(parse_process_config(file.read()))
+        config = merge_process_configs(configs)
+
+        requests = []
+        for process in self.processes:
+            request = resolve_resources(process.name, process.resource_directives, config)
+            requests.append({"name": process.name, "nf_file": process.nf_file, **request})
+        return requests
+
     def get_container_manifest(self, substitutions=None) -> list:
         """
         generates a list of unique container image URIs to pull into an ECR Private registry
@@ -280,6 +322,11 @@ class NextflowProcess:
         if self.container:
             self.container = find_docker_uri(self.container)
 
+    @property
+    def resource_directives(self) -> dict:
+        """the cpus, memory, time and label directives of the process"""
+        return process_directives(self.body or "")
+
     def __hash__(self) -> int:
         # omit self.nf_file from hashing
         # this assumes a process with the same name same container are identical
@@ -320,3 +367,56 @@ def find_docker_uri(container: str) -> dict:
         uri = container
 
     return uri
+
+
+def _split_image_uri(uri: str) -> tuple:
+    # split on the last ':' after the last '/' so registry ports are preserved
+    name, sep, tag = uri.rpartition(":")
+    if not sep or "/" in tag:
+        return uri, "latest"
+    return name, tag
+
+
+def diff_container_manifests(previous: list, current: list) -> dict:
+    """
+    compares two container image manifests (lists of image uris)
+
+    returns a dictionary with:
+    - added: uris for repositories not in the previous manifest
+    - changed: uris for repositories whose tag differs from the previous manifest
+    - removed: uris in the previous manifest that are no longer used
+
+    the delta to transfer on a pipeline version bump is `added` + `changed`
+    """
+    previous_uris = set(previous)
+    previous_repos = {_split_image_uri(uri)[0] for uri in previous_uris}
+
+    added, changed = [], []
+    for uri in sorted(set(current) - previous_uris):
+        if _split_image_uri(uri)[0] in previous_repos:
+            changed.append(uri)
+        else:
+            added.append(uri)
+
+    return {
+        "added": added,
+        "changed": changed,
+        "removed": sorted(previous_uris - set(current)),
+    }
+
+
+def normalize_process_name(task_name: str, scoped: bool = True) -> str:
+    """
+    returns the Nextflow process name of a HealthOmics task name
+
+    e.g. 'NFCORE_RNASEQ:RNASEQ:FASTQC (sample1)' -> 'NFCORE_RNASEQ:RNASEQ:FASTQC',
+    or 'FASTQC' with `scoped=False`
+    """
+    if not task_name:
+        return task_name
+
+    # strip the task tag, e.g. ' (sample1)'
+    name = re.sub(r"\s*\(.*\)\s*$", "", task_name)
+    if not scoped:
+        name = name.rsplit(":", 1)[-1]
+    return name
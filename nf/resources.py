@@ -0,0 +1,306 @@
+"""
+static resolution of Nextflow process resource requests (cpus, memory, time)
+
+directive values are evaluated for the first task attempt, e.g.
+`{ check_max( 6.GB * task.attempt, 'memory' ) }` -> 6.0 GiB. values that depend on
+inputs or params (e.g. `{ meta.single_end ? 2 : 4 }`) can't be resolved statically
+and are treated as unset.
+"""
+
+import ast
+import operator
+import re
+
+RESOURCE_DIRECTIVES: list = ["cpus", "memory", "time"]
+
+_MEMORY_UNITS_GIB: dict = {
+    "B": 1 / 1024**3,
+    "KB": 1 / 1024**2,
+    "MB": 1 / 1024,
+    "GB": 1,
+    "TB": 1024,
+}
+
+_TIME_UNITS_HR: dict = {
+    "ms": 1 / 3600 / 1000,
+    "s": 1 / 3600,
+    "sec": 1 / 3600,
+    "m": 1 / 60,
+    "min": 1 / 60,
+    "h": 1,
+    "hour": 1,
+    "d": 24,
+    "day": 24,
+}
+
+_OPERATORS: dict = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.USub: operator.neg,
+}
+
+
+def _unit_pattern(units: dict) -> re.Pattern:
+    # longest units first so e.g. 'min' is not read as 'm'
+    alternatives = "|".join(sorted(map(re.escape, units), key=len, reverse=True))
+    return re.compile(
+        r"(['\"]?)(\d+(?:\.\d+)?)\s*\.?\s*(" + alternatives + r")s?\b\1"
+    )
+
+
+_MEMORY_PATTERN = _unit_pattern(_MEMORY_UNITS_GIB)
+_TIME_PATTERN = _unit_pattern(_TIME_UNITS_HR)
+_CHECK_MAX_PATTERN = re.compile(r"check_max\s*\(\s*(.+?)\s*,\s*['\"]\w+['\"]\s*\)", re.DOTALL)
+
+
+def _arithmetic(node):
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+        return node.value
+    if isinstance(node, ast.BinOp) and type(node.op) in _OPERATORS:
+        return _OPERATORS[type(node.op)](_arithmetic(node.left), _arithmetic(node.right))
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _OPERATORS:
+        return _OPERATORS[type(node.op)](_arithmetic(node.operand))
+    raise ValueError("not an arithmetic expression")
+
+
+def evaluate_resource(expression: str, directive: str):
+    """
+    evaluates a cpus, memory or time directive value for the first task attempt
+
+    returns cpus, memory in GiB or time in hours as a float, or None if the value
+    can't be resolved statically
+    """
+    if expression is None:
+        return None
+
+    value = str(expression).strip()
+    if value.startswith("{") and value.endswith("}"):
+        value = value[1:-1].strip()
+
+    value = _CHECK_MAX_PATTERN.sub(r"\1", value)
+    value = re.sub(r"\btask\.attempt\b", "1", value)
+
+    units = {"memory": _MEMORY_UNITS_GIB, "time": _TIME_UNITS_HR}.get(directive)
+    if units:
+        pattern = _MEMORY_PATTERN if directive == "memory" else _TIME_PATTERN
+        value = pattern.sub(
+            lambda match: f"({match.group(2)} * {units[match.group(3)]!r})", value
+        )
+    # quoted plain numbers, e.g. cpus '2'
+    value = re.sub(r"^(['\"])(\d+(?:\.\d+)?)\1$", r"\2", value)
+
+    try:
+        return float(_arithmetic(ast.parse(value, mode="eval").body))
+    except (SyntaxError, ValueError, TypeError, ZeroDivisionError):
+        return None
+
+
+def _strip_comments(contents: str) -> str:
+    contents = re.sub(r"/\*.*?\*/", "", contents, flags=re.DOTALL)
+    # keep '//' in urls, e.g. 'https://...'
+    return re.sub(r"(?<!:)//.*", "", contents)
+
+
+def _matching_brace(text: str, start: int) -> int:
+    """returns the index of the brace closing the one at `start`"""
+    depth = 0
+    for ix in range(start, len(text)):
+        if text[ix] == "{":
+            depth += 1
+        elif text[ix] == "}":
+            depth -= 1
+            if depth == 0:
+                return ix
+    return len(text)
+
+
+_SCOPE_TOKEN_PATTERN = re.compile(
+    r"(?P<selector>withLabel|withName)\s*:\s*(?:'(?P<sq>[^']*)'|\"(?P<dq>[^\"]*)\"|(?P<bare>[^\s{]+))\s*\{"
+    r"|(?<![\w.])(?P<key>[\w.]+)\s*=(?!=)\s*"
+    r"|(?P<block>\{)"
+)
+
+
+def _parse_scope(body: str) -> tuple:
+    """
+    returns (assignments, selectors) of a config scope body, where selectors is a
+    list of (kind, pattern, assignments) for withLabel / withName blocks
+    """
+    assignments, selectors = {}, []
+    pos = 0
+    while True:
+        match = _SCOPE_TOKEN_PATTERN.search(body, pos)
+        if not match:
+            break
+
+        if match.group("selector"):
+            start = match.end() - 1
+            end = _matching_brace(body, start)
+            pattern = match.group("sq") or match.group("dq") or match.group("bare")
+            selector_assignments, _ = _parse_scope(body[start + 1 : end])
+            selectors.append((match.group("selector"), pattern, selector_assignments))
+            pos = end + 1
+
+        elif match.group("key"):
+            start = match.end()
+            if body.startswith("{", start):
+                end = _matching_brace(body, start) + 1
+            else:
+                end = body.find("\n", start)
+                end = len(body) if end < 0 else end
+            assignments[match.group("key")] = body[start:end].strip()
+            pos = end
+
+        else:
+            # some other nested block, e.g. ext { ... }
+            pos = _matching_brace(body, match.start()) + 1
+
+    return assignments, selectors
+
+
+def parse_process_config(contents: str) -> dict:
+    """
+    returns the resource settings of the top level `process { ... }` scopes of a Nextflow config:
+
+    {
+        "defaults": {directive: expression},
+        "withLabel": [(pattern, {directive: expression}), ...],
+        "withName": [(pattern, {directive: expression}), ...],
+    }
+    """
+    contents = _strip_comments(contents)
+    config = {"defaults": {}, "withLabel": [], "withName": []}
+
+    pos = 0
+    for match in re.finditer(r"(?<![\w.])process\s*\{|\{", contents):
+        if match.start() < pos:
+            continue
+        end = _matching_brace(contents, match.end() - 1)
+        pos = end + 1
+        if match.group(0) == "{":
+            # skip nested scopes, e.g. profiles { ... }
+            continue
+
+        assignments, selectors = _parse_scope(contents[match.end() : end])
+        config["defaults"].update(
+            {k: v for k, v in assignments.items() if k in RESOURCE_DIRECTIVES}
+        )
+        for kind, pattern, selector_assignments in selectors:
+            resources = {
+                k: v for k, v in selector_assignments.items() if k in RESOURCE_DIRECTIVES
+            }
+            if resources:
+                config[kind].append((pattern, resources))
+
+    return config
+
+
+def merge_process_configs(configs: list) -> dict:
+    """merges `parse_process_config` results, later configs taking precedence"""
+    merged = {"defaults": {}, "withLabel": [], "withName": []}
+    for config in configs:
+        merged["defaults"].update(config["defaults"])
+        merged["withLabel"] += config["withLabel"]
+        merged["withName"] += config["withName"]
+    return merged
+
+
+def _selector_matches(pattern: str, value: str) -> bool:
+    negate = pattern.startswith("!")
+    if negate:
+        pattern = pattern[1:]
+    try:
+        matched = re.fullmatch(pattern, value) is not None
+    except re.error:
+        matched = pattern == value
+    return matched != negate
+
+
+def _alternatives(pattern: str) -> list:
+    """
+    splits a regex at its top level `|`, also inside a group spanning the whole
+    pattern, e.g. '.*:FASTQC|.*:MULTIQC' or '(.*:FASTQC|.*:MULTIQC)'
+    """
+    parts, start, depth, escaped, wrapped = [], 0, 0, False, pattern.startswith("(")
+    for i, char in enumerate(pattern):
+        if escaped:
+            escaped = False
+        elif char == "\\":
+            escaped = True
+        elif char in "([":
+            depth += 1
+        elif char in ")]":
+            depth -= 1
+            if depth == 0 and i < len(pattern) - 1:
+                wrapped = False
+        elif char == "|" and depth == 0:
+            parts.append(pattern[start:i])
+            start = i + 1
+    parts.append(pattern[start:])
+
+    if len(parts) == 1 and wrapped and pattern.endswith(")") and not pattern.startswith("(?"):
+        return _alternatives(pattern[1:-1])
+    return parts
+
+
+def _name_matches(pattern: str, name: str) -> bool:
+    # processes are only known by their simple name statically, so patterns of fully
+    # qualified names (e.g. '.*:RNASEQ:FASTQC') are matched on their last part. each
+    # alternative is matched separately, so the parts of '.*:A|.*:B' aren't mixed up
+    negate = pattern.startswith("!")
+    if negate:
+        pattern = pattern[1:]
+    matched = any(
+        _selector_matches(alternative, name)
+        or (":" in alternative and _selector_matches(alternative.rsplit(":", 1)[-1], name))
+        for alternative in _alternatives(pattern)
+    )
+    return matched != negate
+
+
+def process_directives(body: str) -> dict:
+    """
+    returns the cpus, memory, time and label directives in a process body
+
+    only the directive section before input:, output:, script: etc. is considered,
+    so e.g. `${task.cpus}` in scripts is not mistaken for a directive
+    """
+    header = re.split(r"^\s*(?:input|output|when|script|shell|exec|stub)\s*:", body, maxsplit=1, flags=re.MULTILINE)[0]
+
+    directives = {"label": []}
+    for match in re.finditer(
+        r"^\s*(cpus|memory|time|label)\b\s*(?:=\s*)?(.+?)\s*$", header, flags=re.MULTILINE
+    ):
+        key, value = match.groups()
+        if key == "label":
+            directives["label"].append(value.strip("'\""))
+        else:
+            directives[key] = value
+    return directives
+
+
+def resolve_resources(name: str, directives: dict, config: dict) -> dict:
+    """
+    resolves the resource request of a process, with Nextflow's precedence of
+    config defaults < process directives < withLabel < withName settings
+
+    returns {cpus, memory_gib, time_hr, labels}, with None for unresolved values
+    """
+    labels = directives.get("label", [])
+    expressions = dict(config["defaults"])
+    expressions.update({k: v for k, v in directives.items() if k in RESOURCE_DIRECTIVES})
+    for pattern, resources in config["withLabel"]:
+        if any(_selector_matches(pattern, label) for label in labels):
+            expressions.update(resources)
+    for pattern, resources in config["withName"]:
+        if _name_matches(pattern, name):
+            expressions.update(resources)
+
+    return {
+        "cpus": evaluate_resource(expressions.get("cpus"), "cpus"),
+        "memory_gib": evaluate_resource(expressions.get("memory"), "memory"),
+        "time_hr": evaluate_resource(expressions.get("time"), "time"),
+        "labels": labels,
+    }
@@ -0,0 +1,159 @@
+"""
+throttling-aware pagination for AWS HealthOmics list APIs
+
+pages are requested through a client-side rate limiter shared by all callers
+using the same service and region. requests are not paced until the API responds
+with a throttling error; from then on the limiter slows down on each throttling
+error and speeds back up as requests succeed. throttled requests are retried
+with jittered exponential backoff.
+
+this stacks on top of botocore's own retries: a throttling error only reaches
+the paginator once the client's retry mode (`Config(retries=...)`) has given up
+on the request.
+"""
+
+import random
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+THROTTLING_ERROR_CODES = (
+    "ThrottlingException",
+    "Throttling",
+    "TooManyRequestsException",
+    "RequestLimitExceeded",
+)
+
+# maximum maxResults accepted by the HealthOmics list APIs
+MAX_PAGE_SIZE = 100
+
+
+class AdaptiveRateLimiter:
+    """
+    token bucket limiter whose rate is cut on throttling and recovers gradually on success
+
+    a `rate` of None leaves requests unpaced until the first throttling error,
+    which sets the rate to `throttled_rate`. `max_rate` of None means no ceiling
+    """
+
+    def __init__(self, rate=None, min_rate=0.5, max_rate=None, throttled_rate=10.0, decrease=0.5, increase=1.05):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.throttled_rate = throttled_rate
+        self.decrease = decrease
+        self.increase = increase
+        self._next_time = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, sleep=time.sleep):
+        """blocks until a request may be sent"""
+        with self._lock:
+            if self.rate is None:
+                return
+            now = time.monotonic()
+            wait = self._next_time - now
+            self._next_time = max(now, self._next_time) + 1 / self.rate
+        if wait > 0:
+            sleep(wait)
+
+    def on_success(self):
+        with self._lock:
+            if self.rate is None:
+                return
+            self.rate *= self.increase
+            if self.max_rate is not None:
+                self.rate = min(self.max_rate, self.rate)
+
+    def on_throttle(self):
+        with self._lock:
+            if self.rate is None:
+                self.rate = self.throttled_rate
+            else:
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(client):
+    """returns the rate limiter shared by clients of the same service and region"""
+    meta = getattr(client, "meta", None)
+    key = (type(client).__name__, getattr(meta, "region_name", None))
+    with _limiters_lock:
+        if key not in _limiters:
+            _limiters[key] = AdaptiveRateLimiter()
+        return _limiters[key]
+
+
+def is_throttling_error(error):
+    if not isinstance(error, ClientError):
+        return False
+    response = error.response
+    return (
+        response.get("Error", {}).get("Code") in THROTTLING_ERROR_CODES
+        or response.get("ResponseMetadata", {}).get("HTTPStatusCode") == 429
+    )
+
+
+def paginate(
+    method,
+    items_key="items",
+    page_size=MAX_PAGE_SIZE,
+    max_retries=8,
+    base_delay=0.5,
+    max_delay=30.0,
+    rate_limiter=None,
+    sleep=time.sleep,
+    **request,
+):
+    """
+    generator over the items of a paginated list API call
+
+    :param: method: bound client method, e.g. `client.list_run_tasks`
+    :param: items_key: key of the list of items in each response
+    :param: page_size: maxResults to request per page
+    :param: max_retries: maximum number of retries of a throttled page request
+    :param: rate_limiter: AdaptiveRateLimiter to use, defaults to the one shared by the method's client
+    :param: request: other request parameters, e.g. `id=run_id`
+    """
+    if rate_limiter is None:
+        client = getattr(method, "__self__", None)
+        rate_limiter = get_rate_limiter(client) if client else AdaptiveRateLimiter()
+
+    request = dict(request)
+    if page_size:
+        request["maxResults"] = min(page_size, MAX_PAGE_SIZE)
+
+    while True:
+        for attempt in range(max_retries + 1):
+            rate_limiter.acquire(sleep=sleep)
+            try:
+                response = method(**request)
+                break
+            except ClientError as e:
+                if not is_throttling_error(e) or attempt == max_retries:
+                    raise
+                rate_limiter.on_throttle()
+                # full jitter backoff
+                sleep(random.uniform(0, min(max_delay, base_delay * 2**attempt)))
+
+        rate_limiter.on_success()
+        yield from response.get(items_key) or []
+
+        next_token = response.get("nextToken")
+        if not next_token:
+            break
+        request["startingToken"] = next_token
+
+
+def iter_run_tasks(client, run_id, **kwargs):
+    """generator over the tasks of a workflow run"""
+    return paginate(client.list_run_tasks, id=run_id, **kwargs)
+
+
+def iter_runs(client, **kwargs):
+    """generator over workflow runs, e.g. `iter_runs(client, status='COMPLETED')`"""
+    return paginate(client.list_runs, **kwargs)
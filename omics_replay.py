@@ -0,0 +1,132 @@
+#!/bin/env python3
+
+"""
+records AWS HealthOmics workflow runs and replays them as if they were in progress
+
+a recording is the `get_run` response and all tasks of a (finished) run. the
+ReplayClient stub serves it through the `get_run`, `list_run_tasks` and
+`get_run_task` calls of an `omics` client, with each record as it was at a
+point in replay time, so live monitoring (see timeline_live.py) can be
+developed and tested without a run in progress.
+"""
+
+import argparse
+from datetime import timedelta
+import time
+from types import SimpleNamespace
+
+import boto3
+
+from omics_paginator import MAX_PAGE_SIZE, iter_run_tasks
+from run_store import dumps, loads
+
+parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+parser.add_argument("runid", help="HealthOmics workflow run-id to record")
+parser.add_argument("-o", "--output", required=True, help="Path of the recording to write")
+parser.add_argument("--profile", default=None, help="AWS profile to use")
+parser.add_argument("--region", default=None, help="AWS region to use")
+
+
+def record_run(run_id, path, client=None):
+    """writes the run record and tasks of `run_id` to `path` as JSON"""
+    if not client:
+        client = boto3.client("omics")
+
+    run = client.get_run(id=run_id)
+    run.pop("ResponseMetadata", None)
+    tasks = list(iter_run_tasks(client, run_id))
+    with open(path, "w") as file:
+        file.write(dumps({"run": run, "tasks": tasks}))
+    return run, tasks
+
+
+def load_recording(path):
+    """returns the (run, tasks) of a recording written by `record_run`"""
+    with open(path, "r") as file:
+        recording = loads(file.read())
+    return recording["run"], recording["tasks"]
+
+
+def _at(record, now, created="creationTime"):
+    """returns `record` as it was at time `now`, or None if it didn't exist yet"""
+    if record[created] > now:
+        return None
+
+    record = dict(record)
+    if record.get("startTime") is None or record["startTime"] > now:
+        for key in ("startTime", "stopTime", "instanceType"):
+            record.pop(key, None)
+        record["status"] = "PENDING"
+    elif record.get("stopTime") is None or record["stopTime"] > now:
+        record.pop("stopTime", None)
+        record["status"] = "RUNNING"
+    return record
+
+
+class ReplayClient:
+    """
+    stub `omics` client replaying a recorded run
+
+    replay time starts at the run's creation time (or `start`) when the client is
+    created and runs `speed` times faster than real time. tasks appear at their
+    creation time, are PENDING until they start, RUNNING until they stop and then
+    have their recorded status.
+
+    usage:
+        client = ReplayClient.from_file("run.json", speed=60)
+        client.get_run(id=run_id)
+    """
+
+    def __init__(self, run, tasks, speed=1.0, start=None, clock=time.time, region_name=None):
+        self.run = run
+        self.tasks = sorted(tasks, key=lambda task: task["creationTime"])
+        self._tasks_by_id = {task["taskId"]: task for task in self.tasks}
+        self.speed = speed
+        self.start = start or run["creationTime"]
+        self.clock = clock
+        self._started_at = clock()
+        self.meta = SimpleNamespace(region_name=region_name)
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        run, tasks = load_recording(path)
+        return cls(run, tasks, **kwargs)
+
+    def now(self):
+        """current replay time"""
+        return self.start + timedelta(seconds=(self.clock() - self._started_at) * self.speed)
+
+    def _check_run(self, run_id):
+        if run_id != self.run["id"]:
+            raise KeyError(f"no recording of run {run_id}")
+
+    def get_run(self, id):
+        self._check_run(id)
+        return _at(self.run, self.now())
+
+    def get_run_task(self, id, taskId):
+        self._check_run(id)
+        if taskId not in self._tasks_by_id:
+            raise KeyError(f"no task {taskId} in run {id}")
+        return _at(self._tasks_by_id[taskId], self.now())
+
+    def list_run_tasks(self, id, status=None, startingToken=None, maxResults=MAX_PAGE_SIZE):
+        self._check_run(id)
+        now = self.now()
+        tasks = [
+            task
+            for task in (_at(task, now) for task in self.tasks)
+            if task and (status is None or task["status"] == status)
+        ]
+        start = int(startingToken or 0)
+        response = {"items": tasks[start : start + maxResults]}
+        if start + maxResults < len(tasks):
+            response["nextToken"] = str(start + maxResults)
+        return response
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    session = boto3.Session(profile_name=args.profile, region_name=args.region)
+    run, tasks = record_run(args.runid, args.output, client=session.client("omics"))
+    print(f"recorded {len(tasks)} tasks of run {run['id']} ({run.get('status')}) to {args.output}")
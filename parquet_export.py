@@ -0,0 +1,112 @@
+"""
+typed Parquet datasets of per-run task data, e.g. for loading many runs into analysis notebooks
+
+`write_dataset` writes a run's rows to a directory of Parquet files, optionally
+partitioned by workflow and run (hive layout, e.g.
+<path>/workflowId=1234567/runId=7654321/*.parquet). timestamps are stored as UTC
+timestamps and low-cardinality strings (status, instance type) as dictionary
+encoded categoricals, so they are read back with their types rather than as
+strings. run and workflow ids are kept as strings. writing a run again replaces
+its rows.
+
+`read_dataset` loads only the requested columns, and with partitioning only the
+files of the requested runs / workflows. requires pyarrow (pip install .[parquet])
+"""
+
+import os
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+except ImportError:
+    pa = ds = None
+
+# partition columns of each --partition-by option
+PARTITIONS = {'workflow': ['workflowId', 'runId'], 'run': ['runId'], 'none': []}
+
+# directory name pyarrow writes missing partition values (e.g. runs without a workflowId) to,
+# read back as nulls
+NULL_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+
+TIMESTAMP_COLUMNS = ['creationTime', 'startTime', 'stopTime']
+CATEGORICAL_COLUMNS = ['runId', 'workflowId', 'status', 'instanceType', 'instance']
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("Parquet datasets require pyarrow, install it with `pip install .[parquet]`")
+
+
+def typed_frame(df):
+    """returns a copy of `df` with timestamp columns in UTC and categorical id, status and instance columns"""
+    df = df.copy()
+    for column in TIMESTAMP_COLUMNS:
+        if column in df:
+            df[column] = pd.to_datetime(df[column], utc=True)
+    for column in CATEGORICAL_COLUMNS:
+        if column in df and not isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype('category')
+    return df
+
+
+def _partitioning(columns):
+    # run and workflow ids are numeric strings, which pyarrow would otherwise read back as integers
+    return ds.partitioning(pa.schema([(column, pa.string()) for column in columns]), flavor='hive')
+
+
+def write_dataset(df, path, run_id, workflow_id=None, partition_by='workflow'):
+    """
+    writes the rows of one run to the Parquet dataset at `path`, replacing rows
+    previously written for the run
+
+    :param: df: per-task DataFrame, e.g. `timeline.get_task_timings_data` or
+        `compute_pricing.get_task_costs` output
+    :param: partition_by: 'workflow' (workflowId / runId directories), 'run' (runId
+        directories) or 'none' (one file per run)
+
+    returns the path of the run's partition directory or file
+    """
+    _require_pyarrow()
+    df = typed_frame(df.assign(runId=run_id, workflowId=workflow_id))
+    partition_cols = PARTITIONS[partition_by]
+
+    if not partition_cols:
+        os.makedirs(path, exist_ok=True)
+        file_path = os.path.join(path, f'{run_id}.parquet')
+        df.to_parquet(file_path, index=False)
+        return file_path
+
+    df.to_parquet(
+        path, partition_cols=partition_cols, index=False, existing_data_behavior='delete_matching'
+    )
+    values = {'workflowId': workflow_id, 'runId': run_id}
+    return os.path.join(path, *(
+        f'{column}={NULL_PARTITION if values[column] is None else values[column]}' for column in partition_cols
+    ))
+
+
+def read_dataset(path, columns=None, run_ids=None, workflow_ids=None, filters=None, partition_by='workflow'):
+    """
+    reads a dataset written by `write_dataset`
+
+    :param: columns: columns to load, defaults to all
+    :param: run_ids, workflow_ids: only load these runs / workflows
+    :param: filters: other pyarrow filter tuples, e.g. [('status', '==', 'FAILED')]
+    :param: partition_by: partitioning the dataset was written with
+    """
+    _require_pyarrow()
+    filters = list(filters or [])
+    if run_ids is not None:
+        filters.append(('runId', 'in', [str(run_id) for run_id in run_ids]))
+    if workflow_ids is not None:
+        filters.append(('workflowId', 'in', [str(workflow_id) for workflow_id in workflow_ids]))
+
+    partition_cols = PARTITIONS[partition_by]
+    return pd.read_parquet(
+        path,
+        columns=columns,
+        filters=filters or None,
+        partitioning=_partitioning(partition_cols) if partition_cols else None,
+    )
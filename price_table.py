@@ -0,0 +1,202 @@
+#!/bin/env python3
+
+"""
+compiles AWS HealthOmics pricing offers into a compact multi-region price table
+
+the table maps `omics.*` instance types to USD/hr as floats for each region,
+plus the run storage rate, so cost calculations don't have to walk the pricing
+offer structure and parse price strings for every task.
+"""
+
+from argparse import ArgumentParser
+from datetime import datetime, timezone
+import json
+
+import numpy as np
+
+PRICE_TABLE_VERSION = 1
+RUN_STORAGE = 'Run Storage'
+
+parser = ArgumentParser()
+parser.add_argument('--regions', type=str, help="comma separated list of AWS regions to include")
+parser.add_argument(
+    '--offering', type=str, action='append', default=[],
+    help="REGION=PATH of a pricing offer JSON to use for a region. can be repeated"
+)
+parser.add_argument(
+    '--offline', action='store_true', help="use cached pricing offers without revalidating them"
+)
+parser.add_argument(
+    '-o', '--output', type=str, default='price_table.json', help="path to write the price table to"
+)
+
+
+class PriceTable:
+    """
+    USD prices of HealthOmics compute instances and run storage for one or more regions
+    """
+
+    def __init__(self, regions, built_at=None, sources=None, version=PRICE_TABLE_VERSION):
+        if version != PRICE_TABLE_VERSION:
+            raise ValueError(
+                f"unsupported price table version {version}, expected {PRICE_TABLE_VERSION}"
+            )
+
+        # {region: {"compute": {instance_type: usd_per_hr}, "storage_usd_per_gib_hr": float}}
+        self._regions = regions
+        self.version = version
+        self.built_at = built_at or datetime.now(timezone.utc).isoformat()
+        self.sources = sources or {}
+
+    @classmethod
+    def from_pricing(cls, pricing, region=None, source=None):
+        """
+        builds a single region table from the output of `compute_pricing.get_pricing()`
+        """
+        compute = {}
+        storage = None
+        for resource_type, product in pricing.items():
+            usd = float(product['priceDimensions']['pricePerUnit']['USD'])
+            if resource_type == RUN_STORAGE:
+                storage = usd
+            else:
+                compute[resource_type] = usd
+
+        return cls(
+            {region: {"compute": compute, "storage_usd_per_gib_hr": storage}},
+            sources={region: source} if source else None
+        )
+
+    @classmethod
+    def build(cls, offer_files):
+        """
+        builds a table from a dictionary of {region: path to pricing offer JSON}
+        """
+        # imported here since compute_pricing itself uses PriceTable
+        from compute_pricing import extract_pricing
+
+        tables = []
+        for region, offer_file in offer_files.items():
+            with open(offer_file, 'rb') as file:
+                pricing = extract_pricing(file)
+            tables.append(cls.from_pricing(pricing, region=region, source=offer_file))
+        return cls.merge(tables)
+
+    @classmethod
+    def fetch(cls, regions, cache_dir=None, offline=False):
+        """
+        builds a table for the given regions from the (cached) AWS Price List bulk API offers
+        """
+        from compute_pricing import DEFAULT_PRICING_CACHE_DIR, get_offer_file
+
+        cache_dir = cache_dir or DEFAULT_PRICING_CACHE_DIR
+        return cls.build({
+            region: get_offer_file(region, cache_dir=cache_dir, offline=offline)
+            for region in regions
+        })
+
+    @classmethod
+    def merge(cls, tables):
+        regions, sources = {}, {}
+        for table in tables:
+            regions.update(table._regions)
+            sources.update(table.sources)
+        return cls(regions, sources=sources)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r') as file:
+            data = json.load(file)
+        return cls(
+            data['regions'],
+            built_at=data.get('built_at'),
+            sources=data.get('sources'),
+            version=data.get('version')
+        )
+
+    def save(self, path):
+        with open(path, 'w') as file:
+            json.dump({
+                "version": self.version,
+                "built_at": self.built_at,
+                "sources": self.sources,
+                "regions": self._regions,
+            }, file, indent=2)
+
+    @property
+    def regions(self):
+        return sorted(self._regions, key=str)
+
+    def for_region(self, region):
+        """
+        returns a single region table, e.g. to price runs from an omics client in `region`
+        """
+        if region in self._regions:
+            return PriceTable(
+                {region: self._regions[region]},
+                built_at=self.built_at,
+                sources={region: self.sources[region]} if region in self.sources else None
+            )
+        raise KeyError(f"no prices for region {region}, table has prices for: {self._region_names}")
+
+    @property
+    def _region_names(self):
+        return ', '.join(map(str, self.regions))
+
+    def _region(self, region=None):
+        if region is None:
+            if len(self._regions) != 1:
+                raise ValueError(f"region must be specified, table has prices for: {self._region_names}")
+            return next(iter(self._regions.values()))
+        return self._regions[region]
+
+    def instance_types(self, region=None):
+        return sorted(self._region(region)['compute'])
+
+    def compute_price(self, instance_type, region=None):
+        """USD per hour for an instance type"""
+        return self._region(region)['compute'][instance_type]
+
+    def storage_price(self, region=None):
+        """USD per GiB per hour of run storage"""
+        return self._region(region)['storage_usd_per_gib_hr']
+
+    def compute_prices(self, instance_types, region=None):
+        """
+        vectorized lookup of USD per hour for a sequence of instance types
+
+        returns a float64 numpy array, with NaN for unknown instance types
+        """
+        compute = self._region(region)['compute']
+        instance_types = np.asarray(instance_types, dtype=object).astype(str)
+        unique, inverse = np.unique(instance_types, return_inverse=True)
+        unique_prices = np.array([compute.get(t, np.nan) for t in unique], dtype='float64')
+        return unique_prices[inverse.reshape(-1)]
+
+
+def as_price_table(pricing, region=None):
+    """
+    returns `pricing` as a PriceTable, converting `compute_pricing.get_pricing()` output if needed
+    """
+    if pricing is None or isinstance(pricing, PriceTable):
+        return pricing
+    return PriceTable.from_pricing(pricing, region=region)
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    offer_files = dict(o.split('=', 1) for o in args.offering)
+    tables = [PriceTable.build(offer_files)] if offer_files else []
+
+    regions = [r.strip() for r in (args.regions or '').split(',') if r.strip()]
+    regions = [r for r in regions if r not in offer_files]
+    if regions:
+        tables.append(PriceTable.fetch(regions, offline=args.offline))
+
+    if not tables:
+        parser.error("specify --regions and/or --offering")
+
+    table = PriceTable.merge(tables)
+    table.save(args.output)
+    print(f"price table for {', '.join(table.regions)} written to {args.output}")
@@ -0,0 +1,288 @@
+#!/bin/env python3
+
+"""
+local cache of AWS HealthOmics `get_run` and `list_run_tasks` results
+
+runs in a terminal state never change, so once a run has finished its run
+record and tasks are stored in a SQLite database and served from there without
+API calls. for runs that are still in progress only tasks that can still change
+are re-fetched.
+
+run as a script, prunes the cache and optionally compacts the database file:
+
+    python run_store.py --max-age-days 30 --vacuum
+"""
+
+from argparse import ArgumentParser
+from datetime import datetime
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from omics_paginator import iter_run_tasks
+
+DEFAULT_RUN_STORE = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+    "healthomics_helper_tools",
+    "runs.sqlite",
+)
+
+# default bound of the cache size, least recently used runs are removed beyond it
+DEFAULT_RUN_STORE_MAX_BYTES = 1 << 30
+
+TERMINAL_RUN_STATUSES = ("COMPLETED", "DELETED", "CANCELLED", "FAILED")
+TERMINAL_TASK_STATUSES = ("COMPLETED", "CANCELLED", "FAILED")
+ACTIVE_TASK_STATUSES = ("PENDING", "STARTING", "RUNNING", "STOPPING")
+
+parser = ArgumentParser()
+parser.add_argument("--run-cache", type=str, default=DEFAULT_RUN_STORE, help="path of the run cache database")
+parser.add_argument(
+    "--max-bytes", type=int, default=DEFAULT_RUN_STORE_MAX_BYTES,
+    help="remove least recently used runs until the cache is smaller than this. 0 for no limit",
+)
+parser.add_argument("--max-age-days", type=float, help="remove runs not used for more than this many days")
+parser.add_argument(
+    "--vacuum", action="store_true", help="compact the database file afterwards, which rewrites the whole file"
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    status TEXT,
+    terminal INTEGER NOT NULL,
+    tasks_complete INTEGER NOT NULL DEFAULT 0,
+    run_json TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    run_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    status TEXT,
+    task_json TEXT NOT NULL,
+    PRIMARY KEY (run_id, task_id)
+);
+"""
+
+
+def _encode(obj):
+    if isinstance(obj, datetime):
+        return {"__datetime__": obj.isoformat()}
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _decode(obj):
+    if "__datetime__" in obj and len(obj) == 1:
+        return datetime.fromisoformat(obj["__datetime__"])
+    return obj
+
+
+def dumps(record):
+    return json.dumps(record, default=_encode)
+
+
+def loads(text):
+    return json.loads(text, object_hook=_decode)
+
+
+class RunStore:
+    """
+    SQLite backed cache of workflow runs and their tasks
+
+    usage:
+        store = RunStore()
+        run = store.get_run(run_id, client)
+        tasks = store.get_tasks(run_id, client)
+    """
+
+    def __init__(self, path=DEFAULT_RUN_STORE, max_bytes=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _cached_run(self, run_id):
+        row = self._db.execute(
+            "SELECT run_json, terminal, tasks_complete FROM runs WHERE run_id = ?", (run_id,)
+        ).fetchone()
+        if row:
+            self._db.execute(
+                "UPDATE runs SET accessed_at = ? WHERE run_id = ?", (time.time(), run_id)
+            )
+            return loads(row[0]), bool(row[1]), bool(row[2])
+        return None, False, False
+
+    def _save_run(self, run):
+        now = time.time()
+        self._db.execute(
+            """
+            INSERT INTO runs (run_id, status, terminal, run_json, fetched_at, accessed_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (run_id) DO UPDATE SET
+                status = excluded.status, terminal = excluded.terminal,
+                run_json = excluded.run_json, fetched_at = excluded.fetched_at,
+                accessed_at = excluded.accessed_at
+            """,
+            (
+                run["id"],
+                run.get("status"),
+                int(run.get("status") in TERMINAL_RUN_STATUSES),
+                dumps(run),
+                now,
+                now,
+            ),
+        )
+
+    def _save_tasks(self, run_id, tasks):
+        self._db.executemany(
+            "INSERT OR REPLACE INTO tasks (run_id, task_id, status, task_json) VALUES (?, ?, ?, ?)",
+            [(run_id, task["taskId"], task.get("status"), dumps(task)) for task in tasks],
+        )
+
+    def get_run(self, run_id, client, refresh=False):
+        """
+        returns the `get_run` response (without ResponseMetadata), from the cache
+        if the run has finished
+        """
+        with self._lock:
+            run, terminal, _ = self._cached_run(run_id)
+            if run and terminal and not refresh:
+                self._db.commit()
+                return run
+
+        run = client.get_run(id=run_id)
+        run.pop("ResponseMetadata", None)
+
+        with self._lock:
+            self._save_run(run)
+            self._db.commit()
+        return run
+
+    def get_tasks(self, run_id, client, full_refresh=False):
+        """
+        returns all tasks of a run
+
+        for finished runs whose tasks have been fetched completely, the cached tasks
+        are returned without API calls. for runs in progress, only tasks in an
+        active state are listed, and tasks that were active last time but are not
+        anymore are fetched individually. tasks that start and finish between two
+        calls are picked up by the full fetch once the run has finished, or by
+        `full_refresh=True`.
+        """
+        run = self.get_run(run_id, client)
+        run_finished = run.get("status") in TERMINAL_RUN_STATUSES
+
+        with self._lock:
+            _, _, tasks_complete = self._cached_run(run_id)
+            cached = {
+                task_id: (status, task_json)
+                for task_id, status, task_json in self._db.execute(
+                    "SELECT task_id, status, task_json FROM tasks WHERE run_id = ?", (run_id,)
+                )
+            }
+            self._db.commit()
+
+        if tasks_complete and not full_refresh:
+            return [loads(task_json) for _, task_json in cached.values()]
+
+        if run_finished or full_refresh or not cached:
+            updated = list(iter_run_tasks(client, run_id))
+        else:
+            updated = []
+            for status in ACTIVE_TASK_STATUSES:
+                updated += list(iter_run_tasks(client, run_id, status=status))
+
+            active_ids = {task["taskId"] for task in updated}
+            for task_id, (status, _) in cached.items():
+                if status not in TERMINAL_TASK_STATUSES and task_id not in active_ids:
+                    task = client.get_run_task(id=run_id, taskId=task_id)
+                    task.pop("ResponseMetadata", None)
+                    updated.append(task)
+
+        with self._lock:
+            self._save_tasks(run_id, updated)
+            if run_finished:
+                self._db.execute(
+                    "UPDATE runs SET tasks_complete = 1 WHERE run_id = ?", (run_id,)
+                )
+            tasks = [
+                loads(task_json)
+                for (task_json,) in self._db.execute(
+                    "SELECT task_json FROM tasks WHERE run_id = ?", (run_id,)
+                )
+            ]
+            self._db.commit()
+
+        if self.max_bytes and self.size() > self.max_bytes:
+            self.prune(max_bytes=self.max_bytes)
+
+        return tasks
+
+    def size(self):
+        """
+        size in bytes of the database pages in use, without scanning the records.
+        pages freed by removed runs are reused, the file only shrinks with VACUUM
+        """
+        with self._lock:
+            page_count = self._db.execute("PRAGMA page_count").fetchone()[0]
+            freelist_count = self._db.execute("PRAGMA freelist_count").fetchone()[0]
+            page_size = self._db.execute("PRAGMA page_size").fetchone()[0]
+            return (page_count - freelist_count) * page_size
+
+    def delete(self, run_id):
+        with self._lock:
+            self._db.execute("DELETE FROM tasks WHERE run_id = ?", (run_id,))
+            self._db.execute("DELETE FROM runs WHERE run_id = ?", (run_id,))
+            self._db.commit()
+
+    def prune(self, max_bytes=None, max_age_days=None, vacuum=False):
+        """
+        removes runs not accessed for more than `max_age_days`, then least
+        recently accessed runs until the cache is smaller than `max_bytes`.
+        `vacuum` compacts the database file afterwards, which rewrites all of it
+
+        returns the number of runs removed
+        """
+        removed = 0
+        with self._lock:
+            if max_age_days is not None:
+                cutoff = time.time() - max_age_days * 86400
+                stale = self._db.execute(
+                    "SELECT run_id FROM runs WHERE accessed_at < ?", (cutoff,)
+                ).fetchall()
+                for (run_id,) in stale:
+                    self.delete(run_id)
+                    removed += 1
+
+            if max_bytes is not None and self.size() > max_bytes:
+                by_last_access = self._db.execute(
+                    "SELECT run_id FROM runs ORDER BY accessed_at"
+                ).fetchall()
+                for (run_id,) in by_last_access:
+                    if self.size() <= max_bytes:
+                        break
+                    self.delete(run_id)
+                    removed += 1
+
+            if vacuum:
+                self._db.execute("VACUUM")
+
+        return removed
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    store = RunStore(args.run_cache)
+    removed = store.prune(max_bytes=args.max_bytes or None, max_age_days=args.max_age_days, vacuum=args.vacuum)
+    print(f"removed {removed} runs from {args.run_cache}, {store.size() / 2**20:.1f} MiB in use")
+    store.close()
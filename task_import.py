@@ -0,0 +1,278 @@
+"""
+reads workflow tasks from Nextflow trace files and exported HealthOmics run manifests
+
+tasks are converted to the schema of `list_run_tasks` items used by timeline.py
+and compute_pricing.py (taskId, name, status, creationTime, startTime, stopTime,
+cpus, memory in GiB, gpus, instanceType), so runs can be analyzed without calls
+to AWS HealthOmics, e.g. in air-gapped environments or for local Nextflow runs.
+
+files are read in chunks of `chunksize` lines keeping only the needed columns,
+so parsing multi-GB trace files takes a fixed memory budget, and the tasks are
+kept as typed DataFrame columns (`read_task_frame`) rather than task dictionaries.
+
+- Nextflow trace files are tab separated, with at least the task_id, name,
+  status, submit, duration and realtime fields. start, complete, cpus, memory,
+  peak_rss and accelerator are used when present. tasks reused from the cache
+  (status CACHED) didn't run and are left out. timestamps are in the time zone
+  of the machine that ran Nextflow, UTC unless `timezone` is given. traces
+  written with `trace.raw = true` (epoch and byte counts) are read too. local tasks
+  have no instance type; with a price table each task is assigned the cheapest
+  `omics.*` instance its cpus and memory fit on, as HealthOmics would.
+- run manifests are JSON lines, e.g. the `manifest/run/<run id>/...` log streams
+  of a run exported from CloudWatch Logs. only task records (with a taskId) are read.
+"""
+
+import numpy as np
+import pandas as pd
+
+from instances import fit_instances, instance_specs
+
+TASK_COLUMNS = [
+    "taskId",
+    "name",
+    "status",
+    "creationTime",
+    "startTime",
+    "stopTime",
+    "cpus",
+    "memory",
+    "gpus",
+    "instanceType",
+]
+
+TRACE_COLUMNS = [
+    "task_id",
+    "name",
+    "status",
+    "submit",
+    "start",
+    "complete",
+    "duration",
+    "realtime",
+    "cpus",
+    "memory",
+    "peak_rss",
+    "accelerator",
+]
+
+# Nextflow task statuses to HealthOmics task statuses, CACHED tasks are left out
+TRACE_STATUSES = {
+    "COMPLETED": "COMPLETED",
+    "FAILED": "FAILED",
+    "ABORTED": "CANCELLED",
+}
+
+_DURATION_UNITS_SEC = {"ms": 1 / 1000, "s": 1, "m": 60, "h": 3600, "d": 86400}
+_MEMORY_UNITS_GIB = {"B": 1 / 1024**3, "KB": 1 / 1024**2, "MB": 1 / 1024, "GB": 1, "TB": 1024}
+
+_DURATION_PATTERN = (
+    r"^\s*(?:(?P<raw>\d+(?:\.\d+)?)"
+    r"|(?:(?P<d>\d+)d)?\s*(?:(?P<h>\d+)h)?\s*(?:(?P<m>\d+)m(?!s))?\s*"
+    r"(?:(?P<s>\d+(?:\.\d+)?)s)?\s*(?:(?P<ms>\d+(?:\.\d+)?)ms)?)\s*$"
+)
+_MEMORY_PATTERN = r"(?i)^\s*(?P<amount>\d+(?:\.\d+)?)\s*(?P<unit>[KMGT]?B)?\s*$"
+
+DEFAULT_CHUNKSIZE = 100_000
+
+
+def _parse_unique(values, parse):
+    """
+    applies `parse` (Series of strings to Series of floats) to the distinct values only.
+    trace columns repeat few values, e.g. requested memory or whole seconds durations
+    """
+    codes, uniques = pd.factorize(values)
+    # missing values have code -1, which picks the trailing NaN
+    parsed = np.append(parse(pd.Series(uniques, dtype="str")).to_numpy(), np.nan)
+    return pd.Series(parsed[codes], index=values.index)
+
+
+def parse_durations(values):
+    """
+    converts Nextflow durations (e.g. '1d 2h 3m 4s', '3.5s', '850ms') to seconds,
+    and plain numbers (trace.raw) from milliseconds
+    """
+    def parse(uniques):
+        parts = uniques.str.extract(_DURATION_PATTERN).astype("float64")
+        seconds = (parts[list(_DURATION_UNITS_SEC)] * pd.Series(_DURATION_UNITS_SEC)).sum(axis=1, min_count=1)
+        return seconds.fillna(parts["raw"] / 1000)
+
+    return _parse_unique(values, parse)
+
+
+def parse_memory(values):
+    """converts Nextflow memory sizes (e.g. '6 GB', '512 MB') to GiB, and plain numbers (trace.raw) from bytes"""
+    def parse(uniques):
+        parts = uniques.str.extract(_MEMORY_PATTERN)
+        factors = parts["unit"].str.upper().map(_MEMORY_UNITS_GIB).fillna(_MEMORY_UNITS_GIB["B"])
+        return parts["amount"].astype("float64") * factors
+
+    return _parse_unique(values, parse)
+
+
+def _timestamps(values, timezone):
+    """parses trace timestamps, or epoch milliseconds (trace.raw), to UTC"""
+    if values.dropna().str.fullmatch(r"\d+").all():
+        return pd.to_datetime(values.astype("float64"), unit="ms", utc=True)
+    return pd.to_datetime(values, format="ISO8601").dt.tz_localize(timezone).dt.tz_convert("UTC")
+
+
+def trace_frame(chunk, timezone="UTC", specs=None):
+    """
+    converts rows of a Nextflow trace file to a DataFrame of TASK_COLUMNS
+
+    :param: specs: `instances.instance_specs()` to assign instance types with
+    """
+    chunk = chunk[chunk["status"] != "CACHED"]
+    submit = _timestamps(chunk["submit"], timezone)
+    duration = pd.to_timedelta(parse_durations(chunk["duration"]), unit="s")
+    realtime = pd.to_timedelta(parse_durations(chunk["realtime"]).fillna(0), unit="s")
+
+    stop = submit + duration
+    if "complete" in chunk:
+        stop = _timestamps(chunk["complete"], timezone).fillna(stop)
+    start = stop - realtime
+    if "start" in chunk:
+        start = _timestamps(chunk["start"], timezone).fillna(start)
+    # tasks without duration or completion time (e.g. aborted or failed before they
+    # were started) end after their realtime, or at their start or submission
+    start = start.fillna(submit)
+    stop = stop.fillna(start + realtime)
+
+    cpus = pd.to_numeric(chunk["cpus"], errors="coerce") if "cpus" in chunk else None
+    cpus = cpus.fillna(1) if cpus is not None else pd.Series(1.0, index=chunk.index)
+    memory = pd.Series(np.nan, index=chunk.index)
+    for column in ("memory", "peak_rss"):
+        if column in chunk:
+            memory = memory.fillna(parse_memory(chunk[column]))
+    memory = memory.fillna(0)
+    gpus = pd.to_numeric(chunk["accelerator"], errors="coerce") if "accelerator" in chunk else None
+
+    tasks = pd.DataFrame(
+        {
+            "taskId": chunk["task_id"].astype(str),
+            "name": chunk["name"],
+            "status": chunk["status"].map(TRACE_STATUSES).fillna(chunk["status"]),
+            "creationTime": submit,
+            "startTime": start,
+            "stopTime": stop,
+            "cpus": cpus.astype("int64"),
+            "memory": memory,
+            "gpus": gpus.fillna(0).astype("int64") if gpus is not None else 0,
+            "instanceType": None,
+        },
+        columns=TASK_COLUMNS,
+    )
+    if specs is not None and len(tasks):
+        instance, _ = fit_instances(tasks["cpus"], tasks["memory"], None, specs=specs)
+        tasks["instanceType"] = instance
+    return tasks.reset_index(drop=True)
+
+
+def manifest_frame(chunk):
+    """converts records of a HealthOmics run manifest to a DataFrame of TASK_COLUMNS"""
+    if "taskId" not in chunk:
+        return pd.DataFrame(columns=TASK_COLUMNS)
+
+    chunk = chunk[chunk["taskId"].notna()]
+    tasks = chunk.reindex(columns=TASK_COLUMNS)
+    for column in ("creationTime", "startTime", "stopTime"):
+        tasks[column] = pd.to_datetime(tasks[column], utc=True, format="ISO8601")
+    tasks["taskId"] = tasks["taskId"].astype(str)
+    # the run record's missing values make numeric columns float, and tasks that
+    # haven't been placed yet (e.g. still pending) have no cpus or memory
+    tasks[["cpus", "memory"]] = tasks[["cpus", "memory"]].fillna(0).astype("int64")
+    tasks["gpus"] = tasks["gpus"].fillna(0).astype("int64")
+    return tasks.reset_index(drop=True)
+
+
+def _is_manifest(path):
+    with open(path, "r") as file:
+        for line in file:
+            if line.strip():
+                return line.lstrip().startswith("{")
+    return False
+
+
+def iter_task_frames(path, chunksize=DEFAULT_CHUNKSIZE, timezone="UTC", price_table=None):
+    """
+    generator of DataFrames of TASK_COLUMNS with the tasks of a Nextflow trace
+    file or HealthOmics run manifest, at most `chunksize` tasks each
+
+    :param: timezone: time zone of trace file timestamps
+    :param: price_table: PriceTable to assign instance types to trace file tasks with
+    """
+    if _is_manifest(path):
+        reader = pd.read_json(path, lines=True, chunksize=chunksize, dtype=False)
+        for chunk in reader:
+            yield manifest_frame(chunk)
+        return
+
+    specs = instance_specs(price_table) if price_table is not None else None
+    reader = pd.read_csv(
+        path,
+        sep="\t",
+        usecols=lambda column: column in TRACE_COLUMNS,
+        dtype=str,
+        na_values=["-"],
+        keep_default_na=False,
+        chunksize=chunksize,
+    )
+    for chunk in reader:
+        yield trace_frame(chunk, timezone=timezone, specs=specs)
+
+
+def read_task_frame(path, chunksize=DEFAULT_CHUNKSIZE, timezone="UTC", price_table=None):
+    """
+    returns the tasks of a Nextflow trace file or HealthOmics run manifest as one
+    DataFrame of TASK_COLUMNS, which `timeline.get_task_timings_data` and
+    `compute_pricing.get_task_costs` take in place of a list of tasks
+    """
+    frames = list(iter_task_frames(path, chunksize=chunksize, timezone=timezone, price_table=price_table))
+    if not frames:
+        return pd.DataFrame(columns=TASK_COLUMNS)
+    return pd.concat(frames, ignore_index=True)
+
+
+def read_tasks(path, chunksize=DEFAULT_CHUNKSIZE, timezone="UTC", price_table=None):
+    """
+    returns the tasks of a Nextflow trace file or HealthOmics run manifest as a
+    list of task dictionaries, like `list_run_tasks` items. for large files use
+    `read_task_frame`, task dictionaries take several times the memory
+    """
+    tasks = []
+    for frame in iter_task_frames(
+        path, chunksize=chunksize, timezone=timezone, price_table=price_table
+    ):
+        frame = frame.astype(object).where(frame.notna(), None)
+        tasks += frame.to_dict("records")
+    return tasks
+
+
+# run status of imported tasks by precedence, runs with failed tasks are FAILED
+_RUN_STATUSES = ["FAILED", "CANCELLED"]
+
+
+def run_from_tasks(run_id, tasks, name=None):
+    """
+    returns a `get_run` like record for imported tasks (a list of task dictionaries
+    or a DataFrame from `read_task_frame`), spanning their creation to last stop
+    time. the run is FAILED if any task failed, else CANCELLED if any task was
+    cancelled, else COMPLETED
+    """
+    if not isinstance(tasks, pd.DataFrame):
+        tasks = pd.DataFrame.from_records(tasks, columns=["status", "creationTime", "stopTime"])
+    statuses = set(tasks["status"].dropna())
+    status = next((status for status in _RUN_STATUSES if status in statuses), "COMPLETED")
+    creation = pd.to_datetime(tasks["creationTime"], utc=True).min()
+    stop = pd.to_datetime(tasks["stopTime"], utc=True).max()
+    return {
+        "id": run_id,
+        "arn": None,
+        "name": name or run_id,
+        "workflowId": None,
+        "status": status,
+        "creationTime": creation,
+        "startTime": creation,
+        "stopTime": creation if pd.isna(stop) else stop,
+    }
+
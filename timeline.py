@@ -1,20 +1,45 @@
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 import os
 import os.path as path
+import sys
 from textwrap import dedent
 
-from bokeh.models import ColumnDataSource, Range1d, Div
+from bokeh.models import (
+    ColumnDataSource,
+    CustomJS,
+    CustomJSHover,
+    DataTable,
+    Div,
+    HoverTool,
+    LinearColorMapper,
+    NumberFormatter,
+    Range1d,
+    StringFormatter,
+    TableColumn,
+)
 from bokeh.layouts import gridplot, column
-from bokeh.plotting import figure, output_file, show
+from bokeh.plotting import figure, output_file, save, show
 from bokeh.resources import CDN
+from bokeh.util.browser import view
+from bokeh.transform import transform
 import boto3
+import numpy as np
 import pandas as pd
 
 from compute_pricing import get_pricing
+from nf import normalize_process_name
+from omics_paginator import iter_run_tasks
+from parquet_export import PARTITIONS, write_dataset
+from price_table import PriceTable, as_price_table
+from run_store import DEFAULT_RUN_STORE, DEFAULT_RUN_STORE_MAX_BYTES, RunStore
+from task_import import read_task_frame, run_from_tasks
 
 
 parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
-parser.add_argument("runid", help="HealthOmics workflow run-id to plot")
+parser.add_argument(
+    "runid", help="HealthOmics workflow run-id to plot, or a name for --tasks-file"
+)
 parser.add_argument("--profile", default=None, help="AWS profile to use")
 parser.add_argument("--region", default=None, help="AWS region to use")
 parser.add_argument(
@@ -28,14 +53,117 @@ parser.add_argument(
     "-o", "--output-dir", default=".", help="Directory to save output files"
 )
 parser.add_argument("--no-show", action="store_true", help="Do not show plot")
+parser.add_argument(
+    "--price-table",
+    default=None,
+    help="Price table built with price_table.py to use instead of the pricing offer",
+)
+parser.add_argument(
+    "--run-cache",
+    default=DEFAULT_RUN_STORE,
+    help="Path of the local run cache database",
+)
+parser.add_argument(
+    "--no-run-cache",
+    action="store_true",
+    help="Always retrieve run details from AWS HealthOmics",
+)
+parser.add_argument(
+    "--run-cache-max-bytes",
+    type=int,
+    default=DEFAULT_RUN_STORE_MAX_BYTES,
+    help="Maximum size of the run cache, least recently used runs are removed first. "
+    "0 for no limit",
+)
+parser.add_argument(
+    "--lod",
+    default="auto",
+    choices=["auto", "on", "off"],
+    help="Collapse tasks into per-process density bands when zoomed out. "
+    "auto enables it for runs with more than --lod-threshold tasks",
+)
+parser.add_argument(
+    "--lod-threshold",
+    type=int,
+    default=10000,
+    help="Number of tasks above which --lod auto enables density bands and WebGL",
+)
+parser.add_argument(
+    "--webgl",
+    action="store_true",
+    help="Render with WebGL regardless of the number of tasks",
+)
+parser.add_argument(
+    "--offline",
+    action="store_true",
+    help="Use the cached pricing offer without revalidating it",
+)
+parser.add_argument(
+    "--parquet",
+    default=None,
+    help="Also write task details to this Parquet dataset directory, see parquet_export.py",
+)
+parser.add_argument(
+    "--partition-by",
+    default="workflow",
+    choices=list(PARTITIONS),
+    help="Partitioning of the --parquet dataset",
+)
+parser.add_argument(
+    "--tasks-file",
+    default=None,
+    help="Plot the tasks of a Nextflow trace file or exported HealthOmics run manifest "
+    "instead of retrieving the run, see task_import.py",
+)
+parser.add_argument(
+    "--trace-timezone",
+    default="UTC",
+    help="Time zone of --tasks-file Nextflow trace timestamps",
+)
+parser.add_argument(
+    "--compare",
+    nargs="+",
+    default=None,
+    metavar="RUNID",
+    help="Compare these runs against runid per process, instead of plotting runid alone. "
+    "Exits with status 1 if any process regressed",
+)
+parser.add_argument(
+    "--regression-threshold",
+    type=float,
+    default=0.1,
+    help="Relative increase of a process's median task duration, median queue time "
+    "or cost over runid that is flagged as a regression",
+)
+parser.add_argument(
+    "--max-workers",
+    type=int,
+    default=8,
+    help="Maximum number of runs to retrieve concurrently",
+)
 
 
 TIME_SCALE_FACTORS = {"sec": 1, "min": 1 / 60, "hr": 1 / 3600, "day": 1 / 86400}
 
+# above this many tasks, timelines are rendered with WebGL and tasks are collapsed
+# into per-process density bands until zoomed in
+LOD_TASK_THRESHOLD = 10000
+
+# maximum number of task rows in view before switching to density bands
+LOD_DETAIL_ROWS = 2000
+
+LOD_TIME_BINS = 400
+
+# columns of task timings data only used for drawing, left out of Parquet exports
+PLOT_ONLY_COLUMNS = ["y", "color", "label", "text_x"]
+
 TASK_COLORS = {
     "COMPLETED": "cornflowerblue",
     "FAILED": "crimson",
     "CANCELLED": "orange",
+    "STARTING": "mediumseagreen",
+    "RUNNING": "mediumseagreen",
+    "STOPPING": "mediumseagreen",
 }
 
 
@@ -43,64 +171,380 @@ def get_tasks(runid, client=None):
     if not client:
         client = boto3.client("omics")
 
-    request = {"id": runid}
-    tasks = []
-    while True:
-        response = client.list_run_tasks(**request)
-        next_token = response.get("nextToken")
-        tasks += response.get("items")
-        if not next_token:
-            break
-        else:
-            request["startingToken"] = next_token
+    return list(iter_run_tasks(client, runid))
+
+
+def get_run_and_tasks(runid, client=None, run_store=None):
+    """returns the `get_run` response and tasks of a run, through `run_store` if given"""
+    if not client:
+        client = boto3.client("omics")
 
-    return tasks
+    if run_store:
+        return run_store.get_run(runid, client), run_store.get_tasks(runid, client)
 
+    run = client.get_run(id=runid)
+    run.pop("ResponseMetadata", None)
+    return run, get_tasks(runid, client=client)
 
-def get_task_timings_data(tasks, time_units="min", pricing=None):
+
+def get_runs(runids, client=None, run_store=None, max_workers=8):
+    """returns {runid: (run, tasks)} of several runs, retrieved concurrently"""
+    if not client:
+        client = boto3.client("omics")
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(
+            lambda runid: get_run_and_tasks(runid, client=client, run_store=run_store),
+            runids,
+        )
+        return dict(zip(runids, results))
+
+
+def get_task_timings_data(tasks, time_units="min", pricing=None, now=None, tare=None):
+    """
+    returns a DataFrame of tasks with the timing, cost and resource columns used for plotting
+
+    `tasks` is a list of task dicts or a DataFrame with the same columns (e.g. from
+    `task_import.read_task_frame`)
+
+    columns are computed on whole arrays, and `tasks` are not modified. tasks that
+    haven't started or stopped yet (in runs in progress) are drawn up to `now`, a
+    timezone aware datetime defaulting to the current time
+
+    :param: tare: time at 0 on the time axis, defaults to the first task creation time
+    """
     time_scale_factor = TIME_SCALE_FACTORS[time_units]
-    tare = min([task["creationTime"] for task in tasks])
-
-    for i, task in enumerate(tasks):
-        task["y"] = i
-        task["color"] = TASK_COLORS[task["status"]]
-
-        task["running_left"] = (
-            task["startTime"] - tare
-        ).total_seconds() * time_scale_factor
-        task["running_right"] = (
-            task["stopTime"] - tare
-        ).total_seconds() * time_scale_factor
-        task["running_duration"] = task["running_right"] - task["running_left"]
-
-        if pricing:
-            duration_hr = task["running_duration"] / time_scale_factor / 3600
-            usd_per_hour = float(
-                pricing[task["instanceType"]]["priceDimensions"]["pricePerUnit"]["USD"]
-            )
-            task["cost_usd"] = duration_hr * usd_per_hour
+    data = tasks.copy() if isinstance(tasks, pd.DataFrame) else pd.DataFrame.from_records(tasks)
+    for name in ("startTime", "stopTime", "instanceType"):
+        if name not in data:
+            data[name] = None
+    now = pd.Timestamp.now(tz="UTC") if now is None else pd.Timestamp(now)
+    if tare is None:
+        tare = data["creationTime"].min()
+
+    def elapsed(column):
+        # cache=False: deciding whether to cache iterates the whole column
+        times = pd.to_datetime(data[column], utc=True, cache=False).fillna(now)
+        return (times - tare).dt.total_seconds().to_numpy()
+
+    data["y"] = np.arange(len(data))
+    data["color"] = data["status"].map(TASK_COLORS)
+
+    data["running_left"] = elapsed("startTime") * time_scale_factor
+    data["running_right"] = elapsed("stopTime") * time_scale_factor
+    data["running_duration"] = data["running_right"] - data["running_left"]
+
+    if pricing:
+        price_table = as_price_table(pricing)
+        usd_per_hour = price_table.compute_prices(data["instanceType"])
+        # tasks that haven't been placed yet have no instance type
+        unknown = data.loc[
+            np.isnan(usd_per_hour) & data["instanceType"].notna(), "instanceType"
+        ].unique()
+        if len(unknown):
+            raise KeyError(f"no prices for instance types: {', '.join(map(str, unknown))}")
+        duration_hr = data["running_duration"] / time_scale_factor / 3600
+        data["cost_usd"] = duration_hr * usd_per_hour
+
+    data["queued_left"] = elapsed("creationTime") * time_scale_factor
+    data["queued_right"] = data["running_left"]
+    data["queued_duration"] = data["queued_right"] - data["queued_left"]
+
+    data["memory_to_cpus"] = data["memory"] / data["cpus"]
+
+    data["label"] = (
+        "(" + data["taskId"].astype(str) + ") " + data["name"].fillna("").astype(str)
+    )
+    data["text_x"] = (elapsed("stopTime") + 30) * time_scale_factor
+
+    return data.sort_values("creationTime")
+
+
+def get_wall_time(data):
+    """
+    returns the time from the first task creation to the last task stop of task
+    timings data, in its time units. unfinished tasks count up to the time they
+    were drawn to
+    """
+    return data["running_right"].max() - data["queued_left"].min()
+
+
+UTILIZATION_COLUMNS = ["time", "cpus", "memory", "tasks", "usd_per_hour"]
+
+
+def get_utilization(data, time_units="min"):
+    """
+    returns the vCPUs, memory (GiB), number of tasks and USD per hour (with a
+    cost_usd column) in flight over time, from task timings data
+
+    rows are steps of a step function: values hold from a row's time until the
+    next row's. computed with a sweep over the sorted task start and stop events,
+    in O(n log n)
+    """
+    time_scale_factor = TIME_SCALE_FACTORS[time_units]
+    start = data["running_left"].to_numpy(dtype="float64")
+    stop = data["running_right"].to_numpy(dtype="float64")
+    running = np.isfinite(start) & np.isfinite(stop) & (stop > start)
+    start, stop = start[running], stop[running]
+
+    amounts = {
+        "cpus": data["cpus"].to_numpy(dtype="float64")[running],
+        "memory": data["memory"].to_numpy(dtype="float64")[running],
+        "tasks": np.ones(running.sum()),
+    }
+    if "cost_usd" in data:
+        duration_hr = (stop - start) / time_scale_factor / 3600
+        cost_usd = np.nan_to_num(data["cost_usd"].to_numpy(dtype="float64")[running])
+        amounts["usd_per_hour"] = cost_usd / duration_hr
+
+    # stops sort before starts at the same time, so back to back tasks don't overlap
+    times = np.concatenate([start, stop])
+    is_start = np.concatenate([np.ones(len(start), bool), np.zeros(len(stop), bool)])
+    order = np.lexsort((is_start, times))
+    times = times[order]
+    # keep the last event of each time
+    last = np.append(times[1:] != times[:-1], True)
+
+    utilization = {"time": times[last]}
+    for name, amount in amounts.items():
+        in_flight = np.cumsum(np.concatenate([amount, -amount])[order])[last]
+        # remove rounding error left by cancelling float amounts
+        utilization[name] = np.where(np.abs(in_flight) < 1e-9, 0.0, in_flight)
+
+    columns = [name for name in UTILIZATION_COLUMNS if name in utilization]
+    return pd.DataFrame(utilization, columns=columns)
+
+
+PROCESS_STAT_QUANTILES = {"p50": 0.5, "p90": 0.9}
+
+
+def get_process_stats(data, time_units="min"):
+    """
+    returns per-process statistics of task timings data, with processes named
+    without their workflow scope and tag (e.g. FASTQC)
+
+    columns are the number of tasks, total / p50 / p90 / max running and queued
+    durations in `time_units`, cpu_hours, cost_usd (with a cost_usd column) and
+    min / p50 / max memory per vcpu. rows are sorted by cost, or by cpu_hours
+    without costs
+    """
+    time_scale_factor = TIME_SCALE_FACTORS[time_units]
+    codes, names = pd.factorize(data["name"].fillna("").astype(str))
+    process = np.array(
+        [normalize_process_name(name, scoped=False) for name in names], dtype=object
+    )[codes]
+
+    values = pd.DataFrame(
+        {
+            "running": data["running_duration"].to_numpy(),
+            "queued": data["queued_duration"].to_numpy(),
+            "cpu_hours": data["cpus"].to_numpy()
+            * data["running_duration"].to_numpy()
+            / time_scale_factor
+            / 3600,
+            "memory_to_cpus": data["memory_to_cpus"].to_numpy(),
+        }
+    )
+    if "cost_usd" in data:
+        values["cost_usd"] = data["cost_usd"].to_numpy()
+    grouped = values.groupby(process, sort=False)
+
+    stats = {"tasks": grouped.size()}
+    for name in ("running", "queued"):
+        stats[f"{name}_total"] = grouped[name].sum()
+        for label, q in PROCESS_STAT_QUANTILES.items():
+            stats[f"{name}_{label}"] = grouped[name].quantile(q)
+        stats[f"{name}_max"] = grouped[name].max()
+    stats["cpu_hours"] = grouped["cpu_hours"].sum()
+    if "cost_usd" in values:
+        stats["cost_usd"] = grouped["cost_usd"].sum()
+    stats["memory_to_cpus_min"] = grouped["memory_to_cpus"].min()
+    stats["memory_to_cpus_p50"] = grouped["memory_to_cpus"].median()
+    stats["memory_to_cpus_max"] = grouped["memory_to_cpus"].max()
+
+    by = "cost_usd" if "cost_usd" in stats else "cpu_hours"
+    return (
+        pd.DataFrame(stats)
+        .rename_axis("process")
+        .reset_index()
+        .sort_values([by, "process"], ascending=[False, True], ignore_index=True)
+    )
+
+
+def plot_process_stats(stats, time_units="min"):
+    """returns a sortable Bokeh DataTable of `get_process_stats` output"""
+    formats = {"tasks": "0,0", "cost_usd": "$0,0.00"}
+    columns = [
+        TableColumn(
+            field=name,
+            title=name if name in ("process", "tasks", "cost_usd", "cpu_hours")
+            or name.startswith("memory")
+            else f"{name} ({time_units})",
+            formatter=StringFormatter()
+            if name == "process"
+            else NumberFormatter(format=formats.get(name, "0,0.00")),
+        )
+        for name in stats.columns
+    ]
+    return DataTable(
+        source=ColumnDataSource(stats),
+        columns=columns,
+        sortable=True,
+        index_position=None,
+        height=min(600, 28 * (len(stats) + 1)),
+        sizing_mode="stretch_width",
+    )
+
+
+# columns of timing data used by plot glyphs and tooltips, embedded as binary arrays
+PLOT_FLOAT_COLUMNS = [
+    "queued_left",
+    "queued_right",
+    "queued_duration",
+    "running_left",
+    "running_right",
+    "running_duration",
+    "memory",
+    "memory_to_cpus",
+    "cost_usd",
+]
+PLOT_INT_COLUMNS = ["y", "cpus"]
+
+
+def get_plot_source(data):
+    """
+    returns a (ColumnDataSource, hover formatters, status color mapper) tuple for timing data
+
+    only the columns used by glyphs and tooltips are included. numeric columns are
+    downcast to float32 / int32, which Bokeh embeds as binary arrays, and the
+    status and name strings are dictionary encoded: each row holds integer codes,
+    which the hover formatters and color mapper translate back. names are split into
+    process and tag (e.g. ' (sample1)') dictionaries, since tags repeat across processes
+    """
+    columns = {
+        column: data[column].to_numpy(dtype="float32")
+        for column in PLOT_FLOAT_COLUMNS
+        if column in data
+    }
+    columns.update(
+        {column: data[column].to_numpy(dtype="int32") for column in PLOT_INT_COLUMNS}
+    )
+
+    task_ids = data["taskId"].astype(str)
+    if task_ids.str.fullmatch(r"\d{1,9}").all():
+        columns["taskId"] = task_ids.astype("int32").to_numpy()
+    else:
+        columns["taskId"] = task_ids.tolist()
+
+    status_codes, statuses = pd.factorize(data["status"])
+    columns["status"] = status_codes.astype("int32")
+
+    # same split as nf.normalize_process_name
+    name_parts = data["name"].fillna("").astype(str).str.extract(r"^(.*?)(\s*\(.*\)\s*)?$")
+    process_codes, processes = pd.factorize(name_parts[0])
+    tag_codes, tags = pd.factorize(name_parts[1].fillna(""))
+    columns["name_process"] = process_codes.astype("int32")
+    columns["name_tag"] = tag_codes.astype("int32")
+
+    source = ColumnDataSource(columns)
+    formatters = {
+        "@status": CustomJSHover(
+            args=dict(statuses=list(statuses)), code="return statuses[value]"
+        ),
+        "@name_process": CustomJSHover(
+            args=dict(processes=list(processes), tags=list(tags), source=source),
+            code="return processes[value] + tags[source.data.name_tag[special_vars.index]]",
+        ),
+    }
+    status_colors = LinearColorMapper(
+        palette=[TASK_COLORS.get(status, "grey") for status in statuses],
+        low=-0.5,
+        high=len(statuses) - 0.5,
+    )
+    return source, formatters, status_colors
+
+
+def order_by_process(data):
+    """
+    returns timing data with `y` reassigned so that tasks of the same process occupy
+    consecutive rows, processes ordered by their first task's creation time
+    """
+    data = data.assign(process=data["name"].map(normalize_process_name))
+    first_created = data.groupby("process")["creationTime"].transform("min")
+    data = data.assign(_first_created=first_created).sort_values(
+        ["_first_created", "process", "creationTime"], kind="stable"
+    )
+    data["y"] = np.arange(len(data))
+    return data.drop(columns="_first_created")
+
 
-        task["queued_left"] = (
-            task["creationTime"] - tare
-        ).total_seconds() * time_scale_factor
-        task["queued_right"] = task["running_left"]
-        task["queued_duration"] = task["queued_right"] - task["queued_left"]
+def _running_time_before(edges, left, right):
+    """total running time of tasks [left, right) before each time in `edges`"""
+    left, right = np.sort(left), np.sort(right)
+    cum_left = np.concatenate([[0], np.cumsum(left)])
+    cum_right = np.concatenate([[0], np.cumsum(right)])
+    n_left = np.searchsorted(left, edges)
+    n_right = np.searchsorted(right, edges)
+    return (edges * n_left - cum_left[n_left]) - (edges * n_right - cum_right[n_right])
 
-        task["memory_to_cpus"] = task["memory"] / task["cpus"]
 
-        task["label"] = f"({task['taskId']}) {task['name']}"
-        task["text_x"] = (
-            (task["stopTime"] - tare).total_seconds() + 30
-        ) * time_scale_factor
+def get_density_bands(data, time_bins=LOD_TIME_BINS):
+    """
+    collapses the tasks of each process into a band of average running task counts over time
 
-        tasks[i] = task
+    `data` must be ordered with `order_by_process`. returns a DataFrame of quads with
+    process, tasks, left, right, bottom, top, running and alpha columns. empty bins are omitted
+    """
+    x_end = data["running_right"].max()
+    edges = np.linspace(0, x_end if x_end > 0 else 1, time_bins + 1)
+    width = edges[1] - edges[0]
 
-    return pd.DataFrame.from_records(tasks).sort_values("creationTime")
+    bands = []
+    for process, group in data.groupby("process", sort=False):
+        running_time = np.diff(
+            _running_time_before(
+                edges, group["running_left"].to_numpy(), group["running_right"].to_numpy()
+            )
+        )
+        running = running_time / width
+        nonzero = running > 0
+        if not nonzero.any():
+            continue
+
+        bands.append(
+            pd.DataFrame(
+                {
+                    "process": process,
+                    "tasks": len(group),
+                    "left": edges[:-1][nonzero],
+                    "right": edges[1:][nonzero],
+                    "bottom": group["y"].min() - 0.4,
+                    "top": group["y"].max() + 0.4,
+                    "running": running[nonzero],
+                    "alpha": 0.15 + 0.85 * running[nonzero] / running.max(),
+                }
+            )
+        )
+
+    columns = ["process", "tasks", "left", "right", "bottom", "top", "running", "alpha"]
+    return pd.concat(bands, ignore_index=True) if bands else pd.DataFrame(columns=columns)
 
 
 def plot_timeline(
-    tasks, title="", time_units="min", max_duration_hrs=5, show_plot=True, pricing=None
+    tasks,
+    title="",
+    time_units="min",
+    max_duration_hrs=5,
+    show_plot=True,
+    pricing=None,
+    lod=None,
+    output_backend=None,
 ):
+    """
+    :param: lod: collapse tasks into per-process density bands when zoomed out.
+        defaults to True for more than LOD_TASK_THRESHOLD tasks
+    :param: output_backend: bokeh output backend, defaults to "webgl" with `lod` and "canvas" otherwise
+    """
     time_scale_factor = TIME_SCALE_FACTORS[time_units]
     if isinstance(tasks, list):
         data = get_task_timings_data(tasks, time_units=time_units, pricing=pricing)
@@ -109,24 +553,37 @@ def plot_timeline(
     else:
         raise ValueError("tasks must be a list or DataFrame")
 
-    source = ColumnDataSource(data)
+    if lod is None:
+        lod = len(data) > LOD_TASK_THRESHOLD
+    if output_backend is None:
+        output_backend = "webgl" if lod else "canvas"
+    if lod:
+        data = order_by_process(data)
+
+    source, formatters, status_colors = get_plot_source(data)
 
     tooltips = [
         ("taskId", "@taskId"),
-        ("name", "@name"),
+        ("name", "@name_process{custom}"),
         ("cpus", "@cpus"),
         ("memory", "@memory GiB"),
         ("memory/vcpus", "@memory_to_cpus"),
         ("queued", f"@queued_duration {time_units}"),
         ("duration", f"@running_duration {time_units}"),
-        ("status", "@status"),
+        ("status", "@status{custom}"),
     ]
 
     if pricing and "cost_usd" in data.columns:
         tooltips.append(("cost", "@cost_usd USD"))
 
-    p_run = figure(width=960, height=800, sizing_mode="stretch_both", tooltips=tooltips)
-    p_run.hbar(
+    p_run = figure(
+        width=960,
+        height=800,
+        sizing_mode="stretch_both",
+        tooltips=None if lod else tooltips,
+        output_backend=output_backend,
+    )
+    queued = p_run.hbar(
         y="y",
         left="queued_left",
         right="queued_right",
@@ -135,15 +592,59 @@ def plot_timeline(
         source=source,
         legend_label="queued",
     )
-    p_run.hbar(
+    running = p_run.hbar(
         y="y",
         left="running_left",
         right="running_right",
         height=0.8,
-        color="color",
+        color=transform("status", status_colors),
         source=source,
         legend_label="running",
     )
+
+    if lod:
+        detail = len(data) <= LOD_DETAIL_ROWS
+        bands = p_run.quad(
+            left="left",
+            right="right",
+            bottom="bottom",
+            top="top",
+            color="cornflowerblue",
+            fill_alpha="alpha",
+            line_alpha=0,
+            source=ColumnDataSource(get_density_bands(data)),
+            legend_label="running (density)",
+            visible=not detail,
+        )
+        queued.visible = running.visible = detail
+
+        p_run.add_tools(
+            HoverTool(
+                renderers=[queued, running], tooltips=tooltips, formatters=formatters
+            ),
+            HoverTool(
+                renderers=[bands],
+                tooltips=[
+                    ("process", "@process"),
+                    ("tasks", "@tasks"),
+                    ("avg. running", "@running{0.0}"),
+                ],
+            ),
+        )
+
+        # show individual tasks once few enough rows are in view
+        toggle_detail = CustomJS(
+            args=dict(tasks=[queued, running], bands=[bands], max_rows=LOD_DETAIL_ROWS),
+            code="""
+                const rows = Math.abs(cb_obj.end - cb_obj.start)
+                if (!Number.isFinite(rows)) return
+                const detail = rows <= max_rows
+                for (const r of tasks) r.visible = detail
+                for (const r of bands) r.visible = !detail
+            """,
+        )
+        p_run.y_range.js_on_change("start", toggle_detail)
+        p_run.y_range.js_on_change("end", toggle_detail)
     # p_run.text(x='text_x', y='y', text='label', alpha=0.4, text_baseline='middle', text_font_size='1.5ex', source=source)
     x_max = (
         max_duration_hrs * 3600 * time_scale_factor
@@ -156,7 +657,7 @@ def plot_timeline(
     p_run.legend.location = "top_right"
     p_run.title.text = (
         f"tasks: {len(tasks)}, "
-        f"wall time: {(data['stopTime'].max() - data['creationTime'].min()).total_seconds() * time_scale_factor:.2f} {time_units}"
+        f"wall time: {get_wall_time(data):.2f} {time_units}"
     )
 
     p_cpu = figure(
@@ -164,30 +665,33 @@ def plot_timeline(
         y_range=p_run.y_range,
         sizing_mode="stretch_height",
         tooltips=tooltips,
+        output_backend=output_backend,
     )
     p_cpu.hbar(y="y", right="cpus", height=0.8, color="darkgrey", source=source)
     p_cpu.x_range = Range1d(-1, data["cpus"].max())
     p_cpu.xaxis.axis_label = "vcpus"
     p_cpu.yaxis.visible = False
-    p_cpu.title.text = f"max cpus: {max(source.data['cpus'])}"
+    p_cpu.title.text = f"max cpus: {data['cpus'].max()}"
 
     p_mem = figure(
         width=160,
         y_range=p_run.y_range,
         sizing_mode="stretch_height",
         tooltips=tooltips,
+        output_backend=output_backend,
     )
     p_mem.hbar(y="y", right="memory", height=0.8, color="darkgrey", source=source)
     p_mem.x_range = Range1d(-1, data["memory"].max())
     p_mem.xaxis.axis_label = "memory (GiB)"
     p_mem.yaxis.visible = False
-    p_mem.title.text = f"max mem: {max(source.data['memory']):.2f} GiB"
+    p_mem.title.text = f"max mem: {data['memory'].max():.2f} GiB"
 
     p_mcr = figure(
         width=160,
         y_range=p_run.y_range,
         sizing_mode="stretch_height",
         tooltips=tooltips,
+        output_backend=output_backend,
     )
     p_mcr.hbar(
         y="y", right="memory_to_cpus", height=0.8, color="darkslateblue", source=source
@@ -196,7 +700,7 @@ def plot_timeline(
     p_mcr.x_range = Range1d(-0.01, data["memory_to_cpus"].max())
     p_mcr.xaxis.axis_label = "memory/vcpus"
     p_mcr.yaxis.visible = False
-    p_mcr.title.text = f"max mem/vcpus: {max(source.data['memory_to_cpus']):.2f}"
+    p_mcr.title.text = f"max mem/vcpus: {data['memory_to_cpus'].max():.2f}"
 
     plots = [p_cpu, p_mem, p_mcr, p_run]
 
@@ -206,6 +710,7 @@ def plot_timeline(
             y_range=p_run.y_range,
             sizing_mode="stretch_height",
             tooltips=tooltips,
+            output_backend=output_backend,
         )
         p_usd.hbar(
             y="y", right="cost_usd", height=0.8, color="limegreen", source=source
@@ -213,12 +718,78 @@ def plot_timeline(
         p_usd.x_range = Range1d(-0.01, data["cost_usd"].max())
         p_usd.xaxis.axis_label = "cost ($)"
         p_usd.yaxis.visible = False
-        p_usd.title.text = f"tot. task cost: ${sum(source.data['cost_usd']):.2f}"
+        p_usd.title.text = f"tot. task cost: ${data['cost_usd'].sum():.2f}"
 
         plots = [p_usd] + plots
 
-    g = gridplot(plots, ncols=len(plots), toolbar_location="right")
-    layout = column(Div(text=f"<strong>{title}</strong>"), g)
+    for plot in plots:
+        for hover in plot.select(HoverTool):
+            if hover.tooltips == tooltips:
+                hover.formatters = formatters
+
+    # resources in flight over time, below and linked to the run timeline
+    utilization = get_utilization(data, time_units=time_units)
+    util_source = ColumnDataSource(
+        {name: utilization[name].to_numpy(dtype="float32") for name in utilization}
+    )
+    util_panels = [
+        ("cpus", "vcpus", "darkgrey"),
+        ("memory", "memory (GiB)", "darkgrey"),
+        ("tasks", "tasks", "cornflowerblue"),
+    ]
+    if "usd_per_hour" in utilization:
+        util_panels.append(("usd_per_hour", "USD/hr", "limegreen"))
+
+    util_plots = []
+    for name, label, color in util_panels:
+        p_util = figure(
+            width=960,
+            height=120,
+            x_range=p_run.x_range,
+            sizing_mode="stretch_width",
+            output_backend=output_backend,
+        )
+        area = p_util.varea_step(
+            x="time",
+            y1=0,
+            y2=name,
+            step_mode="after",
+            color=color,
+            fill_alpha=0.5,
+            source=util_source,
+        )
+        p_util.step(
+            x="time", y=name, mode="after", color=color, source=util_source
+        )
+        p_util.add_tools(
+            HoverTool(
+                renderers=[area],
+                tooltips=[
+                    ("time", f"@time{{0.00}} {time_units}"),
+                    (label, f"@{name}{{0.00}}"),
+                ],
+            )
+        )
+        p_util.yaxis.axis_label = label
+        p_util.xaxis.visible = False
+        peak = utilization[name].max() if len(utilization) else 0
+        p_util.title.text = f"{label} in use, peak: {peak:.2f}"
+        util_plots.append(p_util)
+    util_plots[-1].xaxis.visible = True
+    util_plots[-1].xaxis.axis_label = p_run.xaxis.axis_label
+
+    # utilization panels go in the column of the run timeline
+    filler = [None] * (len(plots) - 1)
+    g = gridplot(
+        [plots] + [filler + [p_util] for p_util in util_plots],
+        toolbar_location="right",
+    )
+    layout = column(
+        Div(text=f"<strong>{title}</strong>"),
+        g,
+        Div(text="<strong>processes</strong> (click a column header to sort)"),
+        plot_process_stats(get_process_stats(data, time_units=time_units), time_units),
+    )
 
     if show_plot:
         show(layout)
@@ -226,40 +797,319 @@ def plot_timeline(
     return layout
 
 
-def main(args):
-    runid = args.runid
+# process statistics compared between runs, and whether an increase is a regression
+COMPARE_COLUMNS = {
+    "running_p50": True,
+    "running_total": False,
+    "queued_p50": True,
+    "cost_usd": True,
+}
 
-    session = boto3.Session(profile_name=args.profile, region_name=args.region)
-    omics = session.client("omics")
-    pricing = get_pricing(client=omics)
-    run = omics.get_run(id=runid)
-    tasks = get_tasks(runid, client=omics)
 
-    run_duration_hrs = (run["stopTime"] - run["startTime"]).total_seconds() / 3600
+def compare_runs(datas, time_units="min", threshold=0.1):
+    """
+    compares task timings data of runs per process against the first (baseline) run
 
-    output_file_basename = f"{runid}_timeline"
+    :param: datas: dictionary of {runid: task timings data}, baseline first
+
+    returns a DataFrame with a row per process and run, with the process's tasks,
+    median and total running time, median queue time and cost (see
+    `get_process_stats`), and the change of each relative to the baseline as a
+    fraction. processes are aligned by name without workflow scope and tag, and a
+    `(run)` row compares all tasks. `regression` flags an increase of median running
+    time, median queue time or cost of more than `threshold`
+    """
+    runids = list(datas)
+    frames = []
+    for runid, data in datas.items():
+        stats = get_process_stats(data, time_units=time_units)
+        total = get_process_stats(data.assign(name=""), time_units=time_units)
+        total["process"] = "(run)"
+        frames.append(pd.concat([total, stats], ignore_index=True).assign(run=runid))
+
+    columns = ["process", "run", "tasks"] + [
+        column for column in COMPARE_COLUMNS if column in frames[0]
+    ]
+    comparison = pd.concat(frames, ignore_index=True)[columns]
+
+    baseline = comparison[comparison["run"] == runids[0]].set_index("process")
+    aligned = baseline.reindex(comparison["process"])
+    comparison["regression"] = False
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for column in columns[3:]:
+            change = comparison[column].to_numpy() / aligned[column].to_numpy() - 1
+            comparison[f"{column}_change"] = change
+            if COMPARE_COLUMNS[column]:
+                comparison["regression"] |= change > threshold
+
+    # processes in baseline order, then processes new in later runs
+    order = {process: ix for ix, process in enumerate(dict.fromkeys(comparison["process"]))}
+    comparison["_order"] = comparison["process"].map(order)
+    comparison["_run"] = comparison["run"].map({runid: ix for ix, runid in enumerate(runids)})
+    return comparison.sort_values(["_order", "_run"], ignore_index=True).drop(
+        columns=["_order", "_run"]
+    )
+
+
+def plot_comparison(
+    datas,
+    comparison,
+    runs=None,
+    time_units="min",
+    show_plot=True,
+    output_backend="canvas",
+):
+    """
+    returns a Bokeh layout with stacked timelines of runs sharing the time axis,
+    tasks grouped by process, and a table of `compare_runs` output
+
+    :param: runs: dictionary of {runid: `get_run` response} for plot titles
+    """
+    tooltips = [
+        ("taskId", "@taskId"),
+        ("name", "@name_process{custom}"),
+        ("queued", f"@queued_duration {time_units}"),
+        ("duration", f"@running_duration {time_units}"),
+        ("status", "@status{custom}"),
+    ]
+
+    plots = []
+    for runid, data in datas.items():
+        data = order_by_process(data)
+        source, formatters, status_colors = get_plot_source(data)
+        p = figure(
+            width=960,
+            height=max(200, min(600, 2 * len(data))),
+            sizing_mode="stretch_width",
+            output_backend=output_backend,
+        )
+        if plots:
+            p.x_range = plots[0].x_range
+        p.hbar(
+            y="y",
+            left="queued_left",
+            right="queued_right",
+            height=0.8,
+            color="lightgrey",
+            source=source,
+        )
+        running = p.hbar(
+            y="y",
+            left="running_left",
+            right="running_right",
+            height=0.8,
+            color=transform("status", status_colors),
+            source=source,
+        )
+        p.add_tools(HoverTool(renderers=[running], tooltips=tooltips, formatters=formatters))
+        wall_time = get_wall_time(data)
+        name = (runs or {}).get(runid, {}).get("name")
+        p.title.text = (
+            f"{runid}{f' ({name})' if name else ''}, tasks: {len(data)}, "
+            f"wall time: {wall_time:.2f} {time_units}"
+        )
+        p.y_range.flipped = True
+        p.yaxis.visible = False
+        plots.append(p)
+    plots[-1].xaxis.axis_label = f"task execution time ({time_units})"
+
+    formats = {"tasks": "0,0", "cost_usd": "$0,0.00"}
+    table_columns = []
+    for name in comparison.columns:
+        if name in ("process", "run"):
+            formatter = StringFormatter()
+        elif name == "regression":
+            formatter = StringFormatter(text_color="crimson", font_style="bold")
+        elif name.endswith("_change"):
+            formatter = NumberFormatter(format="+0.0%")
+        else:
+            formatter = NumberFormatter(format=formats.get(name, "0,0.00"))
+        table_columns.append(TableColumn(field=name, title=name, formatter=formatter))
+    table_data = comparison.assign(
+        regression=comparison["regression"].map({True: "regression", False: ""})
+    )
+    table = DataTable(
+        source=ColumnDataSource(table_data),
+        columns=table_columns,
+        sortable=True,
+        index_position=None,
+        height=min(600, 28 * (len(comparison) + 1)),
+        sizing_mode="stretch_width",
+    )
+
+    layout = column(
+        *plots,
+        Div(text="<strong>per-process comparison with the first run</strong>"),
+        table,
+        sizing_mode="stretch_width",
+    )
+    if show_plot:
+        show(layout)
+
+    return layout
+
+
+def compare_main(args, client, pricing, run_store=None):
+    """compare mode of `main`, returns the exit status"""
+    runids = list(dict.fromkeys([args.runid] + args.compare))
+    results = get_runs(runids, client=client, run_store=run_store, max_workers=args.max_workers)
+    runs = {runid: run for runid, (run, _) in results.items()}
+    datas = {
+        runid: get_task_timings_data(tasks, time_units=args.time_units, pricing=pricing)
+        for runid, (_, tasks) in results.items()
+    }
+
+    comparison = compare_runs(
+        datas, time_units=args.time_units, threshold=args.regression_threshold
+    )
     if not args.output_dir == ".":
         os.makedirs(args.output_dir, exist_ok=True)
-
-    data = get_task_timings_data(tasks)
-    data.to_csv(path.join(args.output_dir, f"{output_file_basename}.csv"), index=False)
+    comparison.to_csv(path.join(args.output_dir, f"{args.runid}_compare.csv"), index=False)
 
     output_file(
-        filename=path.join(args.output_dir, f"{output_file_basename}.html"),
-        title=runid,
+        filename=path.join(args.output_dir, f"{args.runid}_compare.html"),
+        title=f"{args.runid} compared",
         mode="cdn",
     )
-    title = f"arn: {run['arn']}, name: {run.get('name')}"
+    layout = plot_comparison(
+        datas,
+        comparison,
+        runs=runs,
+        time_units=args.time_units,
+        show_plot=(not args.no_show),
+        output_backend="webgl" if args.webgl else "canvas",
+    )
+    if args.no_show:
+        save(layout)
+
+    regressions = comparison[comparison["regression"]]
+    if len(regressions):
+        print(
+            f"regressions of more than {args.regression_threshold:.0%} compared to {args.runid}:",
+            file=sys.stderr,
+        )
+        print(regressions.to_string(index=False), file=sys.stderr)
+        return 1
+    return 0
+
+
+def write_timeline(
+    run,
+    tasks,
+    output_dir=".",
+    time_units="min",
+    pricing=None,
+    lod="auto",
+    lod_threshold=LOD_TASK_THRESHOLD,
+    webgl=False,
+    show_plot=False,
+    parquet=None,
+    partition_by="workflow",
+):
+    """
+    writes the timeline html document and csv files of a run to `output_dir`, and
+    optionally adds its tasks to a Parquet dataset
+
+    :param: run: `get_run` response
+    :param: lod: "auto", "on" or "off", see --lod
+    :param: show_plot: open the html document in a browser
+
+    returns a summary of the run with the path of the html document
+    """
+    runid = run["id"]
+    # runs in progress are plotted up to now
+    run_stop = run.get("stopTime") or pd.Timestamp.now(tz="UTC")
+    run_start = run.get("startTime") or run["creationTime"]
+    run_duration_hrs = (run_stop - run_start).total_seconds() / 3600
+
+    output_file_basename = f"{runid}_timeline"
+    if not output_dir == ".":
+        os.makedirs(output_dir, exist_ok=True)
+
+    data = get_task_timings_data(tasks, time_units=time_units, pricing=pricing)
+    data.to_csv(path.join(output_dir, f"{output_file_basename}.csv"), index=False)
+    get_utilization(data, time_units=time_units).to_csv(
+        path.join(output_dir, f"{runid}_utilization.csv"), index=False
+    )
+    get_process_stats(data, time_units=time_units).to_csv(
+        path.join(output_dir, f"{runid}_processes.csv"), index=False
+    )
+    if parquet:
+        write_dataset(
+            data.drop(columns=PLOT_ONLY_COLUMNS).assign(time_units=time_units),
+            parquet,
+            run_id=runid,
+            workflow_id=run.get("workflowId"),
+            partition_by=partition_by,
+        )
+
+    title = f"arn: {run.get('arn')}, name: {run.get('name')}"
     g = plot_timeline(
-        tasks,
+        data,
         title=title,
-        time_units=args.time_units,
+        time_units=time_units,
         max_duration_hrs=run_duration_hrs,
-        show_plot=(not args.no_show),
+        show_plot=False,
+        pricing=pricing,
+        lod={"auto": len(data) > lod_threshold, "on": True, "off": False}[lod],
+        output_backend="webgl" if webgl else None,
+    )
+    html_path = path.join(output_dir, f"{output_file_basename}.html")
+    save(g, filename=html_path, resources=CDN, title=runid)
+    if show_plot:
+        view(html_path)
+
+    return {
+        "runId": runid,
+        "name": run.get("name"),
+        "workflowId": run.get("workflowId"),
+        "status": run.get("status"),
+        "creationTime": run.get("creationTime"),
+        "tasks": len(data),
+        "wall_time_hr": run_duration_hrs,
+        "task_cost": data["cost_usd"].sum() if "cost_usd" in data else None,
+        "html": html_path,
+    }
+
+
+def main(args):
+    runid = args.runid
+
+    session = boto3.Session(profile_name=args.profile, region_name=args.region)
+    omics = session.client("omics")
+    if args.price_table:
+        pricing = PriceTable.load(args.price_table).for_region(omics.meta.region_name)
+    else:
+        pricing = get_pricing(client=omics, offline=args.offline)
+    run_store = None if args.no_run_cache else RunStore(args.run_cache, max_bytes=args.run_cache_max_bytes)
+
+    if args.compare:
+        return compare_main(args, omics, pricing, run_store=run_store)
+
+    if args.tasks_file:
+        tasks = read_task_frame(
+            args.tasks_file,
+            timezone=args.trace_timezone,
+            price_table=as_price_table(pricing, region=omics.meta.region_name),
+        )
+        run = run_from_tasks(runid, tasks)
+    else:
+        run, tasks = get_run_and_tasks(runid, client=omics, run_store=run_store)
+    write_timeline(
+        run,
+        tasks,
+        output_dir=args.output_dir,
+        time_units=args.time_units,
         pricing=pricing,
+        lod=args.lod,
+        lod_threshold=args.lod_threshold,
+        webgl=args.webgl,
+        show_plot=(not args.no_show),
+        parquet=args.parquet,
+        partition_by=args.partition_by,
     )
 
 
 if __name__ == "__main__":
     args = parser.parse_args()
-    main(args)
+    sys.exit(main(args))
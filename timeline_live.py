@@ -0,0 +1,378 @@
+#!/bin/env python3
+
+"""
+live timeline of an AWS HealthOmics workflow run in progress, served by a Bokeh server
+
+tasks are polled through the run cache (see run_store.py), which only re-fetches
+tasks that can still change. new tasks are appended to the plot with
+`ColumnDataSource.stream` and tasks that changed since the last poll are updated
+in place with `ColumnDataSource.patch`, so the page is never re-rendered.
+pending and running tasks are drawn up to the current time.
+"""
+
+import argparse
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from bokeh.layouts import column
+from bokeh.models import ColumnDataSource, Div, Span
+from bokeh.plotting import figure
+from bokeh.server.server import Server
+import boto3
+import numpy as np
+import pandas as pd
+
+from compute_pricing import get_pricing
+from omics_replay import ReplayClient
+from price_table import PriceTable
+from run_store import (
+    DEFAULT_RUN_STORE,
+    DEFAULT_RUN_STORE_MAX_BYTES,
+    TERMINAL_RUN_STATUSES,
+    RunStore,
+)
+from timeline import TIME_SCALE_FACTORS, get_task_timings_data
+
+
+parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+parser.add_argument("runid", help="HealthOmics workflow run-id to follow")
+parser.add_argument("--profile", default=None, help="AWS profile to use")
+parser.add_argument("--region", default=None, help="AWS region to use")
+parser.add_argument(
+    "-u",
+    "--time-units",
+    default="min",
+    choices=["sec", "min", "hr", "day"],
+    help="Time units to use for plot",
+)
+parser.add_argument(
+    "--poll-interval", type=float, default=30, help="Seconds between task updates"
+)
+parser.add_argument(
+    "--full-refresh-every",
+    type=int,
+    default=10,
+    help="List all tasks every this many polls, to pick up tasks that started "
+    "and finished between polls",
+)
+parser.add_argument("--port", type=int, default=5006, help="Port of the Bokeh server")
+parser.add_argument("--no-show", action="store_true", help="Do not open a browser")
+parser.add_argument(
+    "--price-table",
+    default=None,
+    help="Price table built with price_table.py to use instead of the pricing offer",
+)
+parser.add_argument(
+    "--offline",
+    action="store_true",
+    help="Use the cached pricing offer without revalidating it",
+)
+parser.add_argument(
+    "--run-cache",
+    default=DEFAULT_RUN_STORE,
+    help="Path of the local run cache database",
+)
+parser.add_argument(
+    "--no-run-cache",
+    action="store_true",
+    help="Keep the run cache in memory only",
+)
+parser.add_argument(
+    "--run-cache-max-bytes",
+    type=int,
+    default=DEFAULT_RUN_STORE_MAX_BYTES,
+    help="Maximum size of the run cache, least recently used runs are removed first. "
+    "0 for no limit",
+)
+parser.add_argument(
+    "--replay",
+    default=None,
+    help="Replay a run recorded with omics_replay.py instead of calling AWS HealthOmics",
+)
+parser.add_argument(
+    "--speed",
+    type=float,
+    default=60,
+    help="Replay speed, as a multiple of real time",
+)
+
+
+# columns of the plot source, in addition to cost_usd with pricing
+LIVE_COLUMNS = [
+    "taskId",
+    "name",
+    "status",
+    "color",
+    "y",
+    "cpus",
+    "memory",
+    "queued_left",
+    "queued_right",
+    "queued_duration",
+    "running_left",
+    "running_right",
+    "running_duration",
+]
+
+
+def _changed(current, previous):
+    """element-wise inequality of two arrays, treating missing values as equal"""
+    return ~((current == previous) | (pd.isna(current) & pd.isna(previous)))
+
+
+class LiveTimeline:
+    """
+    incrementally updated timeline plot of a workflow run
+
+    `poll()` fetches the run and its tasks and returns the deltas to the plot
+    source, which `apply()` pushes with `stream` / `patch`. polling does no Bokeh
+    document changes, so it can run outside of the server's event loop.
+
+    usage:
+        timeline = LiveTimeline(run_id, client)
+        timeline.apply(*timeline.poll())
+        timeline.layout  # Bokeh layout to add to a document
+    """
+
+    def __init__(
+        self,
+        run_id,
+        client,
+        run_store=None,
+        time_units="min",
+        pricing=None,
+        full_refresh_every=10,
+        clock=None,
+    ):
+        """
+        :param: clock: function returning the current (timezone aware) time, e.g.
+            `ReplayClient.now` when replaying a recorded run
+        """
+        self.run_id = run_id
+        self.client = client
+        self.run_store = run_store or RunStore(":memory:")
+        self.time_units = time_units
+        self.pricing = pricing
+        self.full_refresh_every = full_refresh_every
+        self.clock = clock or (lambda: pd.Timestamp.now(tz="UTC"))
+
+        self.run = None
+        self.polls = 0
+        self.tare = None
+        self.rows = {}  # taskId: row in the plot source
+        self.columns = LIVE_COLUMNS + (["cost_usd"] if pricing else [])
+        self._sent = pd.DataFrame(columns=self.columns)
+
+        self.source = ColumnDataSource({name: [] for name in self.columns})
+        self.layout = self._plot()
+
+    @property
+    def finished(self):
+        return bool(self.run) and self.run.get("status") in TERMINAL_RUN_STATUSES
+
+    def _plot(self):
+        tooltips = [
+            ("taskId", "@taskId"),
+            ("name", "@name"),
+            ("cpus", "@cpus"),
+            ("memory", "@memory GiB"),
+            ("queued", f"@queued_duration {self.time_units}"),
+            ("duration", f"@running_duration {self.time_units}"),
+            ("status", "@status"),
+        ]
+        if self.pricing:
+            tooltips.append(("cost", "@cost_usd USD"))
+
+        p_run = figure(
+            width=960, height=800, sizing_mode="stretch_both", tooltips=tooltips
+        )
+        p_run.hbar(
+            y="y",
+            left="queued_left",
+            right="queued_right",
+            height=0.8,
+            color="lightgrey",
+            source=self.source,
+            legend_label="queued",
+        )
+        p_run.hbar(
+            y="y",
+            left="running_left",
+            right="running_right",
+            height=0.8,
+            color="color",
+            source=self.source,
+            legend_label="running",
+        )
+        self.now_marker = Span(
+            location=0, dimension="height", line_color="black", line_dash="dashed"
+        )
+        p_run.add_layout(self.now_marker)
+        p_run.legend.location = "top_left"
+        p_run.xaxis.axis_label = f"task execution time ({self.time_units})"
+        p_run.yaxis.visible = False
+
+        self.status = Div(text=f"run {self.run_id}: waiting for tasks")
+        return column(self.status, p_run, sizing_mode="stretch_both")
+
+    def poll(self):
+        """
+        fetches the run and its tasks
+
+        returns a (stream, patches, now) tuple: columns of tasks new since the last
+        poll, {column: [(row, value), ...]} of changed values of known tasks, and the
+        time the tasks were drawn up to
+        """
+        self.polls += 1
+        full_refresh = self.full_refresh_every and self.polls % self.full_refresh_every == 0
+        tasks = self.run_store.get_tasks(self.run_id, self.client, full_refresh=full_refresh)
+        self.run = self.run_store.get_run(self.run_id, self.client)
+        now = pd.Timestamp(self.clock())
+        if not tasks:
+            return {}, {}, now
+
+        if self.tare is None:
+            self.tare = min(task["creationTime"] for task in tasks)
+        data = get_task_timings_data(
+            tasks, time_units=self.time_units, pricing=self.pricing, now=now, tare=self.tare
+        )
+        data["color"] = data["color"].fillna("grey")
+
+        # known tasks keep their row, new tasks are appended in order of creation
+        known = data["taskId"].isin(self.rows.keys()).to_numpy()
+        for task_id in data.loc[~known, "taskId"]:
+            self.rows[task_id] = len(self.rows)
+        data["y"] = data["taskId"].map(self.rows)
+        data = data.set_index("y", drop=False).sort_index()[self.columns]
+
+        new = data[~data.index.isin(self._sent.index)]
+        stream = {name: new[name].tolist() for name in self.columns} if len(new) else {}
+
+        current = data.loc[self._sent.index]
+        patches = {}
+        for name in self.columns:
+            changed = _changed(current[name].to_numpy(), self._sent[name].to_numpy())
+            if changed.any():
+                rows = current.index[changed]
+                patches[name] = list(zip(rows.tolist(), current.loc[rows, name].tolist()))
+
+        self._sent = data
+        return stream, patches, now
+
+    def apply(self, stream, patches, now):
+        """pushes the deltas returned by `poll()` to the plot"""
+        if stream:
+            self.source.stream(stream)
+        if patches:
+            self.source.patch(patches)
+        if self.tare is not None:
+            scale = TIME_SCALE_FACTORS[self.time_units]
+            self.now_marker.location = (now - self.tare).total_seconds() * scale
+
+        counts = self._sent["status"].value_counts()
+        summary = ", ".join(f"{count} {status.lower()}" for status, count in counts.items())
+        run_status = self.run.get("status") if self.run else "unknown"
+        text = f"run {self.run_id} ({run_status}): {summary or 'no tasks yet'}"
+        if self.pricing and len(self._sent):
+            text += f", task cost so far: ${np.nansum(self._sent['cost_usd']):.2f}"
+        self.status.text = text
+
+
+def live_document(run_id, client, poll_interval=30, **kwargs):
+    """
+    returns a Bokeh server application function showing a LiveTimeline of `run_id`
+    that is updated every `poll_interval` seconds until the run has finished
+
+    :param: kwargs: other arguments of LiveTimeline
+    """
+
+    def make_document(doc):
+        timeline = LiveTimeline(run_id, client, **kwargs)
+        executor = ThreadPoolExecutor(max_workers=1)
+        polling = {"busy": False, "callback": None}
+
+        def applied(deltas):
+            timeline.apply(*deltas)
+            polling["busy"] = False
+            if timeline.finished and polling["callback"]:
+                doc.remove_periodic_callback(polling["callback"])
+                polling["callback"] = None
+
+        def failed():
+            polling["busy"] = False
+
+        def poll():
+            # runs in the executor thread, document changes are scheduled on the event loop
+            try:
+                deltas = timeline.poll()
+            except Exception as e:
+                # keep polling, e.g. after a transient API error
+                print(f"failed to update run {run_id}: {e!r}", file=sys.stderr)
+                doc.add_next_tick_callback(failed)
+                return
+            doc.add_next_tick_callback(partial(applied, deltas))
+
+        def update():
+            if not polling["busy"]:
+                polling["busy"] = True
+                executor.submit(poll)
+
+        doc.title = run_id
+        doc.add_root(timeline.layout)
+        update()
+        polling["callback"] = doc.add_periodic_callback(update, poll_interval * 1000)
+        doc.on_session_destroyed(lambda session_context: executor.shutdown(wait=False))
+
+    return make_document
+
+
+def serve(app, port=5006, show=True):
+    """serves a Bokeh application function until interrupted"""
+    server = Server({"/": app}, port=port, num_procs=1)
+    server.start()
+    print(f"serving live timeline at http://localhost:{port}/")
+    if show:
+        server.io_loop.add_callback(server.show, "/")
+    server.io_loop.start()
+
+
+def main(args):
+    clock = None
+    if args.replay:
+        client = ReplayClient.from_file(args.replay, speed=args.speed, region_name=args.region)
+        clock = client.now
+    else:
+        session = boto3.Session(profile_name=args.profile, region_name=args.region)
+        client = session.client("omics")
+
+    if args.price_table:
+        region = client.meta.region_name or boto3.Session(profile_name=args.profile).region_name
+        pricing = PriceTable.load(args.price_table).for_region(region)
+    elif args.replay:
+        pricing = None
+    else:
+        pricing = get_pricing(client=client, offline=args.offline)
+
+    # replayed runs are not cached, their records change with replay time
+    if args.no_run_cache or args.replay:
+        run_store = RunStore(":memory:")
+    else:
+        run_store = RunStore(args.run_cache, max_bytes=args.run_cache_max_bytes)
+
+    app = live_document(
+        args.runid,
+        client,
+        poll_interval=args.poll_interval,
+        run_store=run_store,
+        time_units=args.time_units,
+        pricing=pricing,
+        full_refresh_every=args.full_refresh_every,
+        clock=clock,
+    )
+    serve(app, port=args.port, show=not args.no_show)
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,217 @@
+#!/bin/env python3
+
+"""
+re-prices a completed workflow run as if processes had requested different cpus / memory
+
+each overridden request is mapped to the cheapest `omics.*` instance it fits on,
+and the run is re-priced assuming task durations stay the same. tasks are grouped
+by process and resource request first, so sweeping many candidate configurations
+only re-prices a handful of rows per configuration.
+
+overrides are JSON of {process: {"cpus": N, "memory": GiB}}, where process is either
+the full process name (e.g. NFCORE_RNASEQ:RNASEQ:FASTQC) or the last part of it
+(FASTQC). a sweep file is a list of such overrides, or a dictionary of {config name: overrides}.
+"""
+
+from argparse import ArgumentParser
+import json
+import sys
+
+import boto3
+import numpy as np
+import pandas as pd
+
+from compute_pricing import get_pricing, get_run_info, get_task_costs
+from instances import fit_instances, instance_specs
+from nf import normalize_process_name
+from price_table import PriceTable, as_price_table
+from run_store import DEFAULT_RUN_STORE, DEFAULT_RUN_STORE_MAX_BYTES, RunStore
+
+parser = ArgumentParser()
+parser.add_argument('--profile', type=str, help="AWS profile to use")
+parser.add_argument('--region', type=str, help="AWS region to use")
+parser.add_argument('--offering', type=str, help="path to pricing offer JSON")
+parser.add_argument('--price-table', type=str, help="path to a price table built with price_table.py")
+parser.add_argument('--offline', action='store_true', help="use the cached pricing offer without revalidating it")
+parser.add_argument('--run-cache', type=str, default=DEFAULT_RUN_STORE, help="path of the local run cache database")
+parser.add_argument('--no-run-cache', action='store_true', help="always retrieve run details from AWS HealthOmics")
+parser.add_argument(
+    '--run-cache-max-bytes', type=int, default=DEFAULT_RUN_STORE_MAX_BYTES,
+    help="maximum size of the run cache, least recently used runs are removed first. 0 for no limit"
+)
+parser.add_argument('--overrides', type=str, help="path to JSON of per-process resource overrides")
+parser.add_argument('--sweep', type=str, help="path to JSON of several override configurations to compare")
+parser.add_argument('run_id', type=str, help="HealthOmics workflow run-id to re-price")
+
+
+GROUP_COLUMNS = ['process', 'cpus', 'memory_gib', 'gpus', 'instance']
+
+
+def resource_groups(tasks, pricing):
+    """
+    groups a run's tasks by process and resource request
+
+    returns a DataFrame of GROUP_COLUMNS plus the number of tasks, total duration_hr and
+    actual cost of each group
+
+    :param: pricing: PriceTable or output of `compute_pricing.get_pricing()`
+    """
+    task_costs = get_task_costs(tasks, as_price_table(pricing))
+    # tasks without a name are grouped as process '', rather than dropped from the totals
+    task_costs['process'] = task_costs['name'].fillna('').map(normalize_process_name)
+    task_costs['instance'] = task_costs['instance'].astype(str)
+    return task_costs.groupby(GROUP_COLUMNS, sort=False, dropna=False).agg(
+        tasks=('cost', 'size'), duration_hr=('duration_hr', 'sum'), cost=('cost', 'sum')
+    ).reset_index()
+
+
+def _process_index(groups):
+    """
+    returns {process name: indices of groups} for full and unscoped process names,
+    leaving out GPU groups which keep their instance since their resources can't be
+    derived from the type name
+    """
+    index = {}
+    cpu_only = groups['gpus'].to_numpy() == 0
+    for scoped in (False, True):
+        names = groups['process'].map(lambda name: normalize_process_name(name, scoped=scoped))
+        for name, indices in names[cpu_only].groupby(names[cpu_only], sort=False).indices.items():
+            index[name] = np.flatnonzero(cpu_only)[indices]
+    return index
+
+
+def _override_requests(groups, overrides, index=None):
+    """returns the cpus and memory_gib requests of each group with `overrides` applied"""
+    if index is None:
+        index = _process_index(groups)
+
+    cpus = groups['cpus'].to_numpy(dtype='float64', copy=True)
+    memory_gib = groups['memory_gib'].to_numpy(dtype='float64', copy=True)
+    overridden = np.zeros(len(groups), dtype=bool)
+
+    # full process names take precedence over unscoped names
+    for process, override in sorted(overrides.items(), key=lambda item: ':' in item[0]):
+        indices = index.get(process)
+        if indices is None:
+            continue
+        if 'cpus' in override:
+            cpus[indices] = override['cpus']
+        if 'memory' in override:
+            memory_gib[indices] = override['memory']
+        overridden[indices] = True
+
+    return cpus, memory_gib, overridden
+
+
+def simulate(groups, overrides, pricing, specs=None):
+    """
+    re-prices resource groups from `resource_groups` with per-process overrides
+
+    groups that are not overridden keep the instance and price they actually ran on.
+    returns a copy of `groups` with new_cpus, new_memory_gib, new_instance,
+    new_usd_per_hour and new_cost columns. new_cost is NaN for requests that
+    don't fit any instance
+    """
+    price_table = as_price_table(pricing)
+    if specs is None:
+        specs = instance_specs(price_table)
+
+    cpus, memory_gib, overridden = _override_requests(groups, overrides)
+    instance, usd_per_hour = fit_instances(cpus, memory_gib, price_table, specs=specs)
+
+    actual_usd_per_hour = groups['cost'].to_numpy() / groups['duration_hr'].to_numpy()
+    simulated = groups.copy()
+    simulated['new_cpus'] = cpus
+    simulated['new_memory_gib'] = memory_gib
+    simulated['new_instance'] = np.where(overridden, instance, groups['instance'].to_numpy(dtype=object))
+    simulated['new_usd_per_hour'] = np.where(overridden, usd_per_hour, actual_usd_per_hour)
+    simulated['new_cost'] = np.where(overridden, usd_per_hour * groups['duration_hr'], groups['cost'])
+    return simulated
+
+
+def summarize(simulated):
+    """per-process actual vs. simulated cost of `simulate` output, most savings first"""
+    summary = simulated.groupby('process', sort=False).agg(
+        tasks=('tasks', 'sum'),
+        instances=('instance', lambda s: ', '.join(sorted(set(s)))),
+        new_instances=('new_instance', lambda s: ', '.join(sorted(set(map(str, s))))),
+        cost=('cost', 'sum'),
+        new_cost=('new_cost', lambda s: s.sum(min_count=len(s))),
+    ).reset_index()
+    summary['savings'] = summary['cost'] - summary['new_cost']
+    return summary.sort_values('savings', ascending=False, ignore_index=True)
+
+
+def sweep(groups, configs, pricing):
+    """
+    re-prices resource groups for many override configurations in one vectorized pass
+
+    :param: configs: list of overrides, or dictionary of {config name: overrides}
+
+    returns a DataFrame with the actual cost, new_cost and savings of each configuration,
+    cheapest first. new_cost is NaN if a configuration has requests that don't fit any instance
+    """
+    price_table = as_price_table(pricing)
+    specs = instance_specs(price_table)
+    if not isinstance(configs, dict):
+        configs = dict(enumerate(configs))
+
+    index = _process_index(groups)
+    requests = [_override_requests(groups, overrides, index=index) for overrides in configs.values()]
+    cpus = np.concatenate([r[0] for r in requests])
+    memory_gib = np.concatenate([r[1] for r in requests])
+    overridden = np.concatenate([r[2] for r in requests])
+
+    _, usd_per_hour = fit_instances(cpus, memory_gib, price_table, specs=specs)
+
+    n_configs, n_groups = len(configs), len(groups)
+    duration_hr = np.tile(groups['duration_hr'].to_numpy(), n_configs)
+    actual_cost = np.tile(groups['cost'].to_numpy(), n_configs)
+    new_cost = np.where(overridden, usd_per_hour * duration_hr, actual_cost).reshape(n_configs, n_groups)
+
+    total = groups['cost'].sum()
+    result = pd.DataFrame({
+        'config': list(configs),
+        'cost': total,
+        # sum() would silently skip unfitted (NaN) groups
+        'new_cost': np.where(np.isnan(new_cost).any(axis=1), np.nan, new_cost.sum(axis=1)),
+    })
+    result['savings'] = result['cost'] - result['new_cost']
+    return result.sort_values('new_cost', ignore_index=True)
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    if not (args.overrides or args.sweep):
+        parser.error("specify --overrides and/or --sweep")
+
+    session = boto3.Session(region_name=args.region, profile_name=args.profile)
+    client = session.client('omics')
+
+    if args.price_table:
+        price_table = PriceTable.load(args.price_table).for_region(client.meta.region_name)
+    else:
+        pricing = get_pricing(offering=args.offering, client=client, offline=args.offline)
+        price_table = PriceTable.from_pricing(pricing, region=client.meta.region_name)
+
+    if args.no_run_cache:
+        tasks = get_run_info(args.run_id, client=client)['tasks']
+    else:
+        tasks = RunStore(args.run_cache, max_bytes=args.run_cache_max_bytes).get_tasks(args.run_id, client)
+
+    groups = resource_groups(tasks, price_table)
+
+    if args.overrides:
+        with open(args.overrides, 'r') as file:
+            overrides = json.load(file)
+        summary = summarize(simulate(groups, overrides, price_table))
+        print(summary.to_string(index=False))
+        print(
+            f"\nactual: ${summary['cost'].sum():.2f}, simulated: ${summary['new_cost'].sum(min_count=len(summary)):.2f}",
+            file=sys.stderr
+        )
+
+    if args.sweep:
+        with open(args.sweep, 'r') as file:
+            configs = json.load(file)
+        print(sweep(groups, configs, price_table).to_string(index=False))